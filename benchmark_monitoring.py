@@ -0,0 +1,419 @@
+# benchmark_monitoring.py
+"""
+Module benchmark_monitoring.py
+
+Microbenchmarks des chemins critiques du monitoring (sans matériel ni Tkinter):
+    - GreenhouseApp._compare, _check_condition, _evaluate_logic_group, get_alias
+    - GreenhouseApp.refresh_device_lists (listes internes; le redessin Tk est exclu)
+    - un cycle complet de monitoring, phase par phase: lecture capteurs, lecture
+      des états Kasa, évaluation des règles, application des commandes Kasa
+
+Les capteurs et les DeviceController sont remplacés par des faux (latence
+simulée réglable). Les tailles (règles, capteurs, prises) sont paramétrables et
+chaque combinaison est mesurée; les résultats sont enregistrés en JSON pour
+comparer deux exécutions (--compare).
+
+Exemples:
+    python benchmark_monitoring.py --rules 10,100,1000 --sensors 8 --outlets 6,24
+    python benchmark_monitoring.py --kasa-latency 40 --sensor-latency 750 --output pi.json
+    python benchmark_monitoring.py --compare pi_avant.json --output pi_apres.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from device_control import CircuitBreaker
+from greenhouse_v3 import GreenhouseApp
+from rule_engine import RuleEngine
+from sensor_service import SensorAcquisitionService
+from timeseries import TimeSeriesStore
+from window_aggregates import AggregateTracker
+
+# Opérateurs utilisés par les règles générées
+_SENSOR_OPERATORS = ['<', '>', '<=', '>=', '=', '!=']
+_TIME_OPERATORS = ['<', '>', '<=', '>=', '=', '!=']
+
+
+# --- Faux périphériques ---
+class FakeW1Sensor:
+    """Sonde DS18B20 factice (seul l'attribut id est utilisé par l'application)."""
+    __slots__ = ('id',)
+
+    def __init__(self, sensor_id):
+        self.id = sensor_id
+
+
+class FakeTempSensorManager:
+    """Remplace TempSensorManager: températures aléatoires, latence de lecture simulée (s)."""
+
+    def __init__(self, count, latency=0.0, seed=0):
+        self.sensors = [FakeW1Sensor(f"28-{i:012x}") for i in range(count)]
+        self.latency = latency
+        self._rng = random.Random(seed)
+
+    def read_all_temperatures(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return {sensor.id: round(self._rng.uniform(10, 35), 2) for sensor in self.sensors}
+
+    def get_read_times(self):
+        return {} # Chaque appel relit toutes les sondes: instant de l'instantané
+
+
+class FakeLightManager:
+    """Remplace BH1750Manager: luminosités aléatoires, latence de lecture simulée (s)."""
+
+    def __init__(self, count, latency=0.0, seed=0):
+        self.addresses = [0x23 + i for i in range(count)]
+        self.latency = latency
+        self._rng = random.Random(seed + 1)
+
+    def get_active_sensors(self):
+        return list(self.addresses)
+
+    def read_all_sensors(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return {hex(addr): round(self._rng.uniform(0, 20000), 1) for addr in self.addresses}
+
+
+class FakeDeviceController:
+    """Remplace DeviceController (mêmes méthodes asynchrones), latence réseau simulée (s)."""
+
+    def __init__(self, ip_address, outlet_count, latency=0.0):
+        self.ip_address = ip_address
+        self._device = self # Toujours "connecté"
+        self.breaker = CircuitBreaker(name=ip_address) # Toujours fermé (appareil joignable)
+        self.latency = latency
+        self.states = [False] * outlet_count
+        self.command_count = 0
+
+    async def _connect(self):
+        return True
+
+    async def get_outlet_state(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [{'index': i, 'alias': f"Prise {i}", 'is_on': state} for i, state in enumerate(self.states)]
+
+    async def _switch(self, index, state):
+        self.command_count += 1
+        if self.latency:
+            await asyncio.sleep(2 * self.latency) # Commande + update() de vérification
+        self.states[index] = state
+        return True
+
+    async def turn_outlet_on(self, index):
+        return await self._switch(index, True)
+
+    async def turn_outlet_off(self, index):
+        return await self._switch(index, False)
+
+    async def set_outlet_states(self, states):
+        # Commandes enchaînées sur la même connexion, une seule vérification en fin de lot
+        for index, state in states.items():
+            self.command_count += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self.states[index] = state
+        if states and self.latency:
+            await asyncio.sleep(self.latency)
+        return {index: True for index in states}
+
+    async def turn_all_outlets_off(self):
+        for index in range(len(self.states)):
+            await self._switch(index, False)
+        return True
+
+
+# --- Construction d'une application factice ---
+def make_rules(n_rules, sensor_ids, outlets, rng):
+    """Règles aléatoires: 1 à 3 conditions SI (capteur, parfois heure), JUSQU'À une fois sur trois."""
+    def condition():
+        if rng.random() < 0.85:
+            return {'type': 'Capteur', 'id': rng.choice(sensor_ids), 'operator': rng.choice(_SENSOR_OPERATORS),
+                    'threshold': round(rng.uniform(10, 35), 1), 'condition_id': f"c{rng.getrandbits(32):x}"}
+        return {'type': 'Heure', 'id': None, 'operator': rng.choice(_TIME_OPERATORS),
+                'value': f"{rng.randrange(24):02d}:{rng.randrange(60):02d}", 'condition_id': f"c{rng.getrandbits(32):x}"}
+
+    rules = []
+    for i in range(n_rules):
+        mac, index = rng.choice(outlets)
+        rules.append({'id': f"rule-{i}", 'name': f"Règle {i + 1}",
+                      'trigger_logic': rng.choice(['ET', 'OU']),
+                      'conditions': [condition() for _ in range(rng.randint(1, 3))],
+                      'until_logic': 'OU',
+                      'until_conditions': [condition()] if rng.random() < 0.33 else [],
+                      'target_device_mac': mac, 'target_outlet_index': index,
+                      'action': rng.choice(['ON', 'OFF'])})
+    return rules
+
+
+def make_app(n_rules, n_sensors, n_outlets, seed=0, sensor_latency=0.0, kasa_latency=0.0, backend='auto'):
+    """Crée une GreenhouseApp sans interface (seuls les attributs utilisés par le monitoring sont définis)."""
+    rng = random.Random(seed)
+    n_light = min(2, n_sensors // 4) # Au plus deux BH1750 (adresses 0x23 / 0x5C sur le bus)
+    temp_manager = FakeTempSensorManager(n_sensors - n_light, sensor_latency, seed)
+    light_manager = FakeLightManager(n_light, sensor_latency, seed)
+    sensor_ids = [s.id for s in temp_manager.sensors] + [hex(a) for a in light_manager.addresses]
+
+    kasa_devices = {}
+    outlets = []
+    for d in range(math.ceil(n_outlets / 3)): # Multiprises à 3 prises (KP303)
+        mac = f"AA:BB:CC:00:{d // 256:02X}:{d % 256:02X}"
+        count = min(3, n_outlets - 3 * d)
+        info = {'ip': f"10.0.{d // 250}.{d % 250 + 1}", 'mac': mac, 'alias': f"Multiprise {d}",
+                'is_strip': True, 'is_plug': False,
+                'outlets': [{'index': i, 'alias': f"Prise {i}", 'is_on': False} for i in range(count)]}
+        kasa_devices[mac] = {'info': info, 'controller': FakeDeviceController(info['ip'], count, kasa_latency), 'ip': info['ip']}
+        outlets.extend((mac, i) for i in range(count))
+
+    app = GreenhouseApp.__new__(GreenhouseApp)
+    app.root = None
+    app.config = {'monitoring': {'evaluation_backend': backend}}
+    app.aliases = {
+        'sensors': {sid: f"Capteur {i}" for i, sid in enumerate(sensor_ids) if i % 2 == 0},
+        'devices': {mac: f"Serre {i}" for i, mac in enumerate(kasa_devices)},
+        'outlets': {mac: {'0': "Chauffage"} for mac in kasa_devices},
+    }
+    app.rules = make_rules(n_rules, sensor_ids, outlets, rng)
+    app.rule_engine = RuleEngine(backend=backend)
+    app.rule_engine.load(app.rules)
+    app.kasa_devices = kasa_devices
+    app.temp_manager = temp_manager
+    app.light_manager = light_manager
+    app.sensor_service = SensorAcquisitionService(temp_manager, light_manager) # Non démarré: acquisition à la demande
+    app.history = TimeSeriesStore()
+    app.aggregates = AggregateTracker(seed=app.history.sensor_window)
+    app.sensor_service.add_listener(app.history.on_sensor_snapshot)
+    app.available_sensors = []
+    app.available_kasa_strips = []
+    app.available_outlets = {}
+    app.monitoring_active = True
+    app.live_kasa_states = {}
+    app.monitoring_sensor_values = {}
+    app._monitoring_wakeup = None
+    app.rule_widgets = {} # Aucune règle affichée: repopulate_all_rule_dropdowns ne touche aucun widget
+    app.update_status_display = lambda: None # Redessin Tk exclu de la mesure
+    return app
+
+
+# --- Mesures ---
+def _stats(samples, scale, unit):
+    """Statistiques d'une liste de durées (secondes) converties dans l'unité donnée."""
+    values = sorted(v * scale for v in samples)
+    p95 = values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)]
+    return {'unit': unit, 'mean': statistics.fmean(values), 'median': statistics.median(values),
+            'min': values[0], 'p95': p95, 'max': values[-1], 'samples': len(values)}
+
+
+def time_call(func, repeat=5, min_time=0.05):
+    """Mesure func() (microsecondes par appel), en calibrant le nombre d'appels par série."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time or number >= 1_000_000:
+            break
+        number *= 10
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    result = _stats(samples, 1e6, 'us')
+    result['calls_per_sample'] = number
+    return result
+
+
+def bench_micro(app, rng, repeat):
+    """Microbenchmarks des fonctions appelées à chaque cycle."""
+    values = app.temp_manager.read_all_temperatures()
+    values.update(app.light_manager.read_all_sensors())
+    now_time = datetime.now().time()
+    all_conditions = [c for r in app.rules for c in r['conditions'] + r['until_conditions']]
+    sensor_conditions = [c for c in all_conditions if c['type'] == 'Capteur'] or all_conditions
+    groups = [(r['conditions'], r['trigger_logic'], r['id']) for r in app.rules]
+    macs = list(app.kasa_devices)
+    sensor_ids = list(values)
+
+    cond_cycle = itertools.cycle(sensor_conditions)
+    group_cycle = itertools.cycle(groups)
+    compare_cycle = itertools.cycle([(rng.uniform(10, 35), rng.choice(_SENSOR_OPERATORS), rng.uniform(10, 35))
+                                     for _ in range(256)])
+    alias_cycle = itertools.cycle([('sensor', sid, None) for sid in sensor_ids]
+                                  + [('device', mac, None) for mac in macs]
+                                  + [('outlet', mac, i) for mac in macs for i in range(3)])
+
+    def compare():
+        v1, op, v2 = next(compare_cycle)
+        app._compare(v1, op, v2)
+
+    def check_condition():
+        app._check_condition(next(cond_cycle), values, now_time)
+
+    def evaluate_logic_group():
+        conditions, logic, rule_id = next(group_cycle)
+        app._evaluate_logic_group(conditions, logic, values, now_time, rule_id, "SI")
+
+    def get_alias():
+        item_type, item_id, sub_id = next(alias_cycle)
+        app.get_alias(item_type, item_id, sub_id)
+
+    return {
+        '_compare': time_call(compare, repeat),
+        '_check_condition': time_call(check_condition, repeat),
+        '_evaluate_logic_group': time_call(evaluate_logic_group, repeat),
+        'get_alias': time_call(get_alias, repeat),
+        'refresh_device_lists': time_call(app.refresh_device_lists, repeat),
+    }
+
+
+async def _bench_cycles(app, cycles):
+    """Cycles complets (mêmes méthodes que _async_monitoring_task), durée de chaque phase."""
+    app.asyncio_loop = asyncio.get_running_loop()
+    app.rule_engine.reset_state()
+    phases = {'sensors': [], 'kasa_poll': [], 'evaluate': [], 'apply': [], 'cycle': [], 'cycle_with_kasa_poll': []}
+    commands = 0
+    for cycle_index in range(cycles + 1):
+        t0 = time.perf_counter()
+        # Acquisition (thread du service dans l'application réelle) puis adoption de l'instantané
+        await app.asyncio_loop.run_in_executor(None, app.sensor_service.sample_once)
+        await app._poll_sensors_once()
+        t1 = time.perf_counter()
+        await app._poll_kasa_once()
+        t2 = time.perf_counter()
+        desired = app.rule_engine.evaluate(app.monitoring_sensor_values, datetime.now().time())
+        t3 = time.perf_counter()
+        before = sum(d['controller'].command_count for d in app.kasa_devices.values())
+        await app._apply_outlet_states(desired)
+        t4 = time.perf_counter()
+        if cycle_index == 0:
+            continue # Cycle de chauffe (compilation du backend, premières connexions) non mesuré
+        commands += sum(d['controller'].command_count for d in app.kasa_devices.values()) - before
+        phases['sensors'].append(t1 - t0)
+        phases['kasa_poll'].append(t2 - t1)
+        phases['evaluate'].append(t3 - t2)
+        phases['apply'].append(t4 - t3)
+        # Dans la boucle réelle, les états Kasa ne sont relus que toutes les kasa_poll_interval secondes
+        phases['cycle'].append((t1 - t0) + (t4 - t2))
+        phases['cycle_with_kasa_poll'].append(t4 - t0)
+    result = {name: _stats(samples, 1e3, 'ms') for name, samples in phases.items()}
+    result['commands_per_cycle'] = commands / cycles if cycles else 0
+    return result
+
+
+def bench_cycle(app, cycles):
+    return asyncio.run(_bench_cycles(app, cycles))
+
+
+def run_benchmarks(args):
+    """Exécute toutes les combinaisons de tailles et retourne le document JSON des résultats."""
+    results = []
+    budget_ms = args.budget * 1000
+    for n_rules, n_sensors, n_outlets in itertools.product(args.rules, args.sensors, args.outlets):
+        app = make_app(n_rules, n_sensors, n_outlets, args.seed, args.sensor_latency / 1000,
+                       args.kasa_latency / 1000, args.backend)
+        n_conditions = sum(len(r['conditions']) + len(r['until_conditions']) for r in app.rules)
+        entry = {'params': {'rules': n_rules, 'sensors': n_sensors, 'outlets': n_outlets, 'conditions': n_conditions},
+                 'micro': bench_micro(app, random.Random(args.seed), args.repeat),
+                 'cycle': bench_cycle(app, args.cycles)}
+        entry['cycle_budget_ms'] = budget_ms
+        entry['overruns_budget'] = entry['cycle']['cycle']['p95'] > budget_ms
+        results.append(entry)
+        _print_entry(entry)
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'backend': args.backend,
+            'sensor_latency_ms': args.sensor_latency,
+            'kasa_latency_ms': args.kasa_latency,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+
+def _print_entry(entry):
+    p = entry['params']
+    print(f"\n== {p['rules']} règles ({p['conditions']} conditions), {p['sensors']} capteurs, {p['outlets']} prises ==")
+    for name, stats in entry['micro'].items():
+        print(f"  {name:<24} {stats['median']:>12.2f} µs/appel")
+    for name, stats in entry['cycle'].items():
+        if isinstance(stats, dict):
+            print(f"  cycle:{name:<20} {stats['median']:>10.3f} ms (p95 {stats['p95']:.3f} ms)")
+    status = "DÉPASSE" if entry['overruns_budget'] else "respecte"
+    print(f"  -> {entry['cycle']['commands_per_cycle']:.1f} commandes/cycle; {status} le budget de {entry['cycle_budget_ms']:.0f} ms (p95)")
+
+
+def compare_results(previous, current):
+    """Affiche le rapport (actuel / précédent) des médianes pour les combinaisons communes."""
+    def key(entry):
+        p = entry['params']
+        return (p['rules'], p['sensors'], p['outlets'])
+
+    previous_by_key = {key(e): e for e in previous.get('results', [])}
+    print(f"\n== Comparaison avec {previous.get('meta', {}).get('date', '?')} (ratio actuel/précédent, <1 = plus rapide) ==")
+    for entry in current['results']:
+        old = previous_by_key.get(key(entry))
+        if not old:
+            continue
+        ratios = []
+        for section in ('micro', 'cycle'):
+            for name, stats in entry[section].items():
+                old_stats = old.get(section, {}).get(name)
+                if isinstance(stats, dict) and isinstance(old_stats, dict) and old_stats.get('median'):
+                    ratios.append(f"{name}={stats['median'] / old_stats['median']:.2f}")
+        print(f"  {key(entry)}: " + ", ".join(ratios))
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',') if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks du cycle de monitoring (faux capteurs et prises Kasa).")
+    parser.add_argument('--rules', type=_int_list, default=[10, 100, 1000], help="Nombres de règles (liste séparée par des virgules).")
+    parser.add_argument('--sensors', type=_int_list, default=[8], help="Nombres de capteurs.")
+    parser.add_argument('--outlets', type=_int_list, default=[6, 24], help="Nombres de prises (multiprises de 3).")
+    parser.add_argument('--cycles', type=int, default=50, help="Nombre de cycles complets mesurés.")
+    parser.add_argument('--repeat', type=int, default=5, help="Séries par microbenchmark.")
+    parser.add_argument('--sensor-latency', type=float, default=0.0, help="Latence simulée d'une lecture de capteurs (ms).")
+    parser.add_argument('--kasa-latency', type=float, default=0.0, help="Latence réseau simulée d'une requête Kasa (ms).")
+    parser.add_argument('--budget', type=float, default=2.0, help="Budget d'un cycle (s), intervalle de lecture des capteurs.")
+    parser.add_argument('--backend', default='auto', choices=('auto', 'python', 'numpy'), help="Backend du moteur de règles.")
+    parser.add_argument('--seed', type=int, default=0, help="Graine des règles et valeurs générées.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Fichier JSON des résultats ('' = pas d'écriture).")
+    parser.add_argument('--compare', help="Fichier JSON d'une exécution précédente à comparer.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    logging.getLogger().setLevel(logging.WARNING) # Les logs INFO du monitoring fausseraient les mesures
+
+    document = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+        print(f"\nRésultats enregistrés dans {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(json.load(f), document)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
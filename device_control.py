@@ -1,14 +1,81 @@
 # device_control.py
 import asyncio
+import socket
+import time
 # Make sure these specific types are imported
 from kasa import SmartDevice, KasaException, SmartStrip, SmartPlug
 
+class CircuitBreaker:
+    """
+    Per-device circuit breaker for unreachable devices.
+
+    closed:    calls go through; `failure_threshold` consecutive connection failures open it.
+    open:      calls fail fast (no connect timeout) until the backoff has elapsed.
+    half-open: a single trial call is let through; success closes the breaker, failure
+               reopens it with a doubled backoff (capped at `max_backoff`).
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold: int = 2, base_backoff: float = 5.0, max_backoff: float = 300.0,
+                 name: str = '', clock=time.monotonic):
+        if int(failure_threshold) < 1:
+            raise ValueError(f"Invalid failure_threshold: {failure_threshold}")
+        if float(base_backoff) <= 0 or float(max_backoff) < float(base_backoff):
+            raise ValueError(f"Invalid backoff: base {base_backoff}, max {max_backoff}")
+        self.failure_threshold = int(failure_threshold)
+        self.base_backoff = float(base_backoff)
+        self.max_backoff = float(max_backoff)
+        self.name = name
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0 # Consecutive failures
+        self.backoff = self.base_backoff
+        self._opened_at = 0.0
+
+    def allow(self, trial: bool = True) -> bool:
+        """True if a call may proceed. `trial`: this call may be the half-open trial."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN or not trial or self.retry_in() > 0:
+            return False # Trial already running, or still backing off
+        self.state = self.HALF_OPEN
+        print(f"Circuit for {self.name} half-open: trying the device again.")
+        return True
+
+    def retry_in(self) -> float:
+        """Seconds until the next trial is allowed (0 if not open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.backoff - self._clock())
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print(f"Circuit for {self.name} closed: device reachable again.")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = self.base_backoff
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self._clock()
+        print(f"Circuit for {self.name} open after {self.failures} failure(s): failing fast for {self.backoff:.0f} s.")
+
+
 class DeviceController:
     """
     Controls a specific Kasa smart device (Plug or Strip).
     """
     # MODIFIED __init__ to accept hints
-    def __init__(self, ip_address: str, is_strip: bool | None = None, is_plug: bool | None = None):
+    def __init__(self, ip_address: str, is_strip: bool | None = None, is_plug: bool | None = None,
+                 breaker: CircuitBreaker | None = None):
         """
         Initializes the controller for a device at the given IP address.
 
@@ -16,11 +83,14 @@ class DeviceController:
             ip_address (str): The IP address of the Kasa device.
             is_strip (bool | None): Hint from discovery if the device is a strip.
             is_plug (bool | None): Hint from discovery if the device is a plug.
+            breaker (CircuitBreaker | None): Circuit breaker guarding (re)connections.
         """
         if not ip_address:
             raise ValueError("IP address cannot be empty.")
         self.ip_address = ip_address
+        self.breaker = breaker if breaker is not None else CircuitBreaker(name=ip_address)
         self._device = None # Placeholder for the connected device object
+        self._loop = None # Event loop owning the device transport (sessions can't cross loops)
         # Store hints
         self._hint_is_strip = is_strip
         self._hint_is_plug = is_plug
@@ -31,6 +101,7 @@ class DeviceController:
         Establishes connection and updates the device state using type hints if possible.
         Returns True on success, False on failure.
         """
+        await self.close() # Release any previous session before opening a new one
         print(f"Attempting to connect to {self.ip_address}...")
         DeviceClass = None # Variable to hold the specific class (SmartStrip, SmartPlug)
 
@@ -57,6 +128,7 @@ class DeviceController:
                      print("Generic detection: Smart Plug")
                      DeviceClass = SmartPlug
                 # Add elif for bulb etc.
+                await generic_device.disconnect() # Detection-only transport
             except KasaException as e:
                 print(f"Error during generic detection for {self.ip_address}: {e}")
                 # Fall through, DeviceClass is still None
@@ -76,6 +148,7 @@ class DeviceController:
             # Check if connection really worked (alias is a good indicator)
             if self._device.alias:
                  print(f"Connected successfully to {self._device.alias} ({self._device.model}).")
+                 self._loop = asyncio.get_running_loop()
                  return True
             else:
                  # Sometimes update() might not raise error but fails silently
@@ -91,6 +164,75 @@ class DeviceController:
             self._device = None
             return False
 
+    async def _ensure_connected(self, trial: bool = True) -> bool:
+        """
+        Reuses the open session if it is usable from the running event loop,
+        otherwise (re)connects lazily. Returns True if a device session is available.
+
+        While the circuit breaker is open this fails fast instead of waiting for a
+        connect timeout. Only calls with `trial=True` (state polls) may probe a
+        half-open device, so commands never wait on an unreachable one.
+        """
+        if self._device is not None and self._loop is not asyncio.get_running_loop():
+            # Session opened by another event loop: its transport can't be used from here,
+            # close it (on its own loop, see close()) and reconnect.
+            await self.close()
+        if self._device is None:
+            if not self.breaker.allow(trial):
+                return False # Circuit open: fail fast
+            connected = False
+            try:
+                connected = await self._connect()
+            finally: # Also on cancellation, so a half-open trial can't stay pending
+                if connected:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+            return connected
+        return True
+
+    async def _invalidate(self):
+        """Drops the session after a communication error; the next call reconnects."""
+        print(f"Dropping session for {self.ip_address}, will reconnect on next use.")
+        self.breaker.record_failure()
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the device session (transport) if one is open.
+
+        A transport belongs to the event loop that opened it. If that loop is running in
+        another thread, the disconnect is run there; if it is no longer running, the
+        connection is shut down directly so the socket is not left open.
+        """
+        device, loop = self._device, self._loop
+        self._device = None
+        self._loop = None
+        if device is None:
+            return
+        try:
+            if loop is None or loop is asyncio.get_running_loop():
+                await device.disconnect()
+            elif loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(device.disconnect(), loop))
+            else:
+                self._shutdown_socket(device)
+        except Exception as e:
+            print(f"Error closing session for {self.ip_address}: {e}")
+
+    def _shutdown_socket(self, device):
+        """Shuts down the TCP connection of a session whose event loop no longer runs."""
+        # python-kasa keeps the stream writer on the protocol's transport (XorTransport.writer)
+        writer = getattr(getattr(device.protocol, '_transport', None), 'writer', None)
+        sock = writer.get_extra_info('socket') if writer is not None else None
+        if sock is None:
+            print(f"Session for {self.ip_address} belongs to a stopped event loop, dropping it.")
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass # Already disconnected
+
     async def get_outlet_state(self) -> list[dict] | None:
         """
         Gets the state of all controllable outlets on the device.
@@ -99,15 +241,17 @@ class DeviceController:
             list[dict] | None: A list of outlet states or None if connection fails or no outlets.
                               Example: [{'index': 0, 'alias': 'Fan', 'is_on': False}, ...]
         """
-        # Attempt connection if not already connected or if connection check fails
-        # Note: self._device might exist but be stale, update() handles refresh
-        if not self._device:
-            if not await self._connect():
+        # Reuse the pooled session; connect only if there is none (or it was dropped)
+        # A connect made for this call has just fetched the state (not one made by a command)
+        connecting = self._device is None or self._loop is not asyncio.get_running_loop()
+        if not await self._ensure_connected():
+             if self.breaker.state == self.breaker.CLOSED: # Open circuit: already reported when it opened
                  print("Connection failed in get_outlet_state.")
-                 return None # Connection failed
+             return None # Connection failed
 
         try:
-            await self._device.update() # Ensure fresh state
+            if not connecting: # _connect() just fetched the state, no second update()
+                await self._device.update() # Ensure fresh state
             outlets = []
             if self._device.is_strip and self._device.children:
                 for i, plug in enumerate(self._device.children):
@@ -126,11 +270,11 @@ class DeviceController:
             return outlets
         except KasaException as e:
             print(f"Error getting outlet state for {self.ip_address}: {e}")
-            # Invalidate connection on error? Maybe.
-            # self._device = None
+            await self._invalidate()
             return None
-        except Exception as e:
+        except Exception as e: # OSError, timeouts...: the session is just as dead
              print(f"Unexpected error getting outlet state for {self.ip_address}: {e}")
+             await self._invalidate()
              return None
 
 
@@ -144,9 +288,8 @@ class DeviceController:
         Returns:
             bool: True if successful, False otherwise.
         """
-        if not self._device:
-             if not await self._connect():
-                  return False # Connection failed
+        if not await self._ensure_connected(trial=False):
+             return False # Connection failed
 
         try:
             target_plug = None
@@ -171,9 +314,11 @@ class DeviceController:
                  return False
         except KasaException as e:
              print(f"Error turning ON outlet {index} for {self.ip_address}: {e}")
+             await self._invalidate()
              return False
         except Exception as e:
              print(f"Unexpected error turning ON outlet {index} for {self.ip_address}: {e}")
+             await self._invalidate()
              return False
 
     async def turn_outlet_off(self, index: int) -> bool:
@@ -186,9 +331,8 @@ class DeviceController:
         Returns:
             bool: True if successful (outlet is off), False otherwise.
         """
-        if not self._device:
-            if not await self._connect():
-                 return False # Connection failed
+        if not await self._ensure_connected(trial=False):
+            return False # Connection failed
 
         try:
             target_plug = None
@@ -213,16 +357,84 @@ class DeviceController:
                  return False
         except KasaException as e:
              print(f"Error turning OFF outlet {index} for {self.ip_address}: {e}")
+             await self._invalidate()
              return False
         except Exception as e:
              print(f"Unexpected error turning OFF outlet {index} for {self.ip_address}: {e}")
+             await self._invalidate()
              return False
 
+    async def set_outlet_states(self, states: dict[int, bool]) -> dict[int, bool]:
+        """
+        Applies several outlet changes on this device in one batch.
+
+        All commands are sent back to back over the device connection, then the
+        device is refreshed once to verify the resulting states (instead of one
+        update() per outlet as with turn_outlet_on/turn_outlet_off).
+
+        Args:
+            states (dict[int, bool]): Desired state per outlet index ({index: True for ON}).
+
+        Returns:
+            dict[int, bool]: Per index, True if the outlet ended up in the requested state.
+        """
+        results = {index: False for index in states}
+        if not states:
+            return results
+        if not await self._ensure_connected(trial=False):
+            return results # Connection failed
+
+        try:
+            sent = []
+            failed = 0
+            for index, turn_on in states.items():
+                target_plug = None
+                if self._device.is_strip and self._device.children and 0 <= index < len(self._device.children):
+                    target_plug = self._device.children[index]
+                elif self._device.is_plug and index == 0:
+                    target_plug = self._device # Control the plug itself
+                if not target_plug:
+                    print(f"Error: Invalid outlet index {index} for device {self.ip_address}.")
+                    continue
+                print(f"Turning {'ON' if turn_on else 'OFF'} outlet {index} ('{target_plug.alias}')...")
+                try:
+                    if turn_on:
+                        await target_plug.turn_on()
+                    else:
+                        await target_plug.turn_off()
+                    sent.append(index)
+                except KasaException as e:
+                    print(f"Error turning {'ON' if turn_on else 'OFF'} outlet {index} for {self.ip_address}: {e}")
+                    failed += 1
+
+            if failed and not sent:
+                # Every command failed: the session is most likely dead, don't keep reusing it
+                await self._invalidate()
+                return results
+
+            if sent:
+                await self._device.update() # Single verification refresh for the whole batch
+                for index in sent:
+                    if self._device.is_strip:
+                        is_now_on = self._device.children[index].is_on
+                    else: # is_plug
+                        is_now_on = self._device.is_on
+                    results[index] = is_now_on == states[index]
+                print(f"Batch on {self.ip_address}: {sum(results.values())}/{len(states)} outlet(s) in requested state.")
+            return results
+        except KasaException as e:
+            print(f"Error applying outlet states for {self.ip_address}: {e}")
+            await self._invalidate()
+            return results
+        except Exception as e:
+            print(f"Unexpected error applying outlet states for {self.ip_address}: {e}")
+            await self._invalidate()
+            return results
+
     async def turn_all_outlets_on(self) -> bool:
         """Turns all controllable outlets ON. Returns True if all attempts were made."""
-        if not self._device:
-            if not await self._connect():
-                 return False
+        if not await self._ensure_connected(trial=False):
+            return False
 
         if not self._device.is_strip:
             print("Turning on single plug...")
@@ -252,9 +464,8 @@ class DeviceController:
 
     async def turn_all_outlets_off(self) -> bool:
         """Turns all controllable outlets OFF. Returns True if all attempts were made."""
-        if not self._device:
-            if not await self._connect():
-                 return False
+        if not await self._ensure_connected(trial=False):
+            return False
 
         if not self._device.is_strip:
              print("Turning off single plug...")
@@ -282,6 +493,63 @@ class DeviceController:
         return False # Should not happen if is_strip is True
 
 
+class DeviceSessionPool:
+    """
+    Keeps one long-lived DeviceController (and its device session) per MAC address.
+
+    The same controller is reused by discovery, state polls, commands and shutdown,
+    so each device keeps a single transport that is only reopened after a failure.
+    The pool is not thread-safe: use it from a single event loop (the one owning the sessions).
+    """
+    def __init__(self, breaker_settings: dict | None = None):
+        self.breaker_settings = dict(breaker_settings or {})
+        CircuitBreaker(**self.breaker_settings) # Validate now (ValueError/TypeError) rather than on first acquire
+        self._controllers = {} # {mac: DeviceController}
+        self._lock = asyncio.Lock() # Serializes acquire/retain (both await a close() mid-update)
+
+    def __contains__(self, mac) -> bool:
+        return mac in self._controllers
+
+    def __len__(self) -> int:
+        return len(self._controllers)
+
+    def get(self, mac: str) -> DeviceController | None:
+        """Returns the pooled controller for this MAC, or None."""
+        return self._controllers.get(mac)
+
+    async def acquire(self, mac: str, ip_address: str, is_strip: bool | None = None,
+                      is_plug: bool | None = None) -> DeviceController:
+        """
+        Returns the pooled controller for this MAC, creating it if needed.
+        If the device changed IP address, the old session is closed and replaced.
+        """
+        async with self._lock:
+            controller = self._controllers.get(mac)
+            if controller is not None and controller.ip_address == ip_address:
+                return controller
+            if controller is not None:
+                print(f"Device {mac} moved from {controller.ip_address} to {ip_address}, replacing session.")
+                await controller.close()
+                # Keep the type hints learned earlier if the caller doesn't provide new ones
+                is_strip = controller._hint_is_strip if is_strip is None else is_strip
+                is_plug = controller._hint_is_plug if is_plug is None else is_plug
+            controller = DeviceController(ip_address, is_strip, is_plug,
+                                          breaker=CircuitBreaker(name=f"{mac} ({ip_address})", **self.breaker_settings))
+            self._controllers[mac] = controller
+            return controller
+
+    async def retain(self, macs) -> None:
+        """Closes and forgets the sessions of devices whose MAC is not in `macs`."""
+        keep = set(macs)
+        async with self._lock:
+            for mac in [m for m in self._controllers if m not in keep]:
+                await self._controllers.pop(mac).close()
+
+    async def close_all(self) -> None:
+        """Closes every pooled session (controllers stay pooled and reconnect lazily)."""
+        await asyncio.gather(*(c.close() for c in self._controllers.values()), return_exceptions=True)
+
+
 # Example usage (for testing this file directly)
 if __name__ == "__main__":
     async def test_control():
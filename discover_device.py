@@ -5,19 +5,135 @@
 # récupérer leurs informations et préparer leur contrôle.
 # -----------------------------------------------------------
 import asyncio
+import json
+import os
+import time
+from typing import NamedTuple
 # Note: Nous continuons d'utiliser SmartDevice pour la découverte,
 # mais une refonte future pourrait impliquer les classes kasa.iot.
 # A deeper refactor might involve kasa.iot classes later if needed.
 from kasa import Discover, KasaException, SmartDevice
 
+DEFAULT_TARGET = '255.255.255.255' # Diffusion de découverte sur le réseau local
+DEFAULT_CACHE_FILE = 'kasa_cache.json' # Dernier résultat de découverte (démarrage sans attendre la diffusion)
+PROBE_TIMEOUT = 2 # s, interrogation directe (unicast) d'un appareil connu
+DETAIL_CONCURRENCY = 8 # Récupérations de détails simultanées après la diffusion
+DETAIL_TIMEOUT = 5 # s, récupération des détails (update()) d'un appareil
+MISSED_SCANS_BEFORE_REMOVAL = 3 # Redécouvertes consécutives sans réponse avant de retirer un appareil
+
+def device_info_from(ip: str, device) -> dict:
+    """Construit le dictionnaire d'informations d'un appareil Kasa déjà mis à jour (update())."""
+    # --- Use getattr for safe access to potentially missing attributes ---
+    hw_info_dict = getattr(device, 'hw_info', {}) # Default to empty dict
+    sw_info_dict = getattr(device, 'sw_info', {}) # Default to empty dict
+    device_info = {
+        'ip': ip,
+        'alias': getattr(device, 'alias', f"Unknown Device @ {ip}"), # Use IP if no alias
+        'model': getattr(device, 'model', 'Unknown Model'),
+        'mac': getattr(device, 'mac', 'N/A'),
+        'rssi': getattr(device, 'rssi', None), # None if not available
+        'hw_ver': hw_info_dict.get('hw_ver', 'N/A'),
+        'sw_ver': sw_info_dict.get('sw_ver', 'N/A'),
+        'has_emeter': getattr(device, 'has_emeter', False),
+        'is_strip': getattr(device, 'is_strip', False),
+        'is_plug': getattr(device, 'is_plug', False), # Pass plug flag for controller hint
+        'outlets': []
+    }
+
+    # --- Traite les prises multiples ou simples selon le type détecté ---
+    if device_info['is_strip'] and hasattr(device, 'children') and device.children:
+        # Check hasattr for children too, just in case
+        for i, plug in enumerate(device.children):
+            device_info['outlets'].append({
+                'index': i,
+                'alias': getattr(plug, 'alias', f'Outlet {i}'), # Safe access for child alias
+                'is_on': getattr(plug, 'is_on', False)        # Safe access for child state
+            })
+    elif device_info['is_plug']:
+        device_info['outlets'].append({
+            'index': 0,
+            'alias': device_info['alias'], # Use main alias
+            'is_on': getattr(device, 'is_on', False) # Safe access for plug state
+        })
+    # Add handling for other device types (bulbs, etc.) if needed
+    return device_info
+
+def outlet_signature(device_info: dict) -> tuple:
+    """Liste des prises (alias par index) d'un appareil, pour détecter un renommage ou un changement de prises."""
+    return tuple(o.get('alias') for o in sorted(device_info.get('outlets', []), key=lambda o: o.get('index', 0)))
+
+def _scan_signature(device) -> tuple | None:
+    """Signature des prises lue dans la réponse de découverte (None si la réponse est partielle)."""
+    try:
+        sys_info = device.sys_info
+        if sys_info.get('children'):
+            return tuple(child.get('alias') for child in sys_info['children'])
+        return (device.alias,) if device.is_plug else ()
+    except Exception:
+        return None
+
+class DeviceDelta(NamedTuple):
+    """Différences entre une redécouverte et les appareils déjà connus."""
+    added: list # Infos complètes des nouveaux appareils
+    removed: list # MAC des appareils disparus
+    ip_changed: dict # {mac: infos complètes à la nouvelle IP}
+    outlets_changed: dict # {mac: infos complètes} (prises ajoutées, retirées ou renommées)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.ip_changed or self.outlets_changed)
+
+class DiscoveryCache:
+    """
+    Cache disque (JSON) du dernier résultat de découverte: MAC -> IP, modèle, type, prises.
+    Permet de contacter directement les appareils connus au démarrage, sans attendre la diffusion.
+    """
+    VERSION = 1
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE):
+        self.path = path
+
+    def load(self) -> list[dict]:
+        """Retourne les appareils en cache (liste vide si absent ou illisible)."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"Kasa discovery cache {self.path} unreadable ({e}), ignoring it.")
+            return []
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            return []
+        return [d for d in data.get('devices', []) if isinstance(d, dict) and d.get('ip') and d.get('mac')]
+
+    def save(self, devices: list[dict]):
+        """Enregistre le résultat de découverte (écriture atomique: fichier temporaire puis renommage)."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'saved_at': time.time(), 'devices': devices}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write Kasa discovery cache {self.path}: {e}")
+
 class DeviceDiscoverer:
     """
     Découvre les appareils intelligents Kasa présents sur le réseau local.
     """
-    async def discover(self) -> list[dict]:
+    def __init__(self, missed_scans: int = MISSED_SCANS_BEFORE_REMOVAL, target: str = DEFAULT_TARGET):
+        self.missed_scans = missed_scans
+        self.target = target # Adresse de diffusion (ou de l'émulateur local, voir kasa_emulator.py)
+        self._misses = {} # {mac: redécouvertes consécutives sans réponse} (voir rediscover)
+
+    async def discover(self, on_device=None, concurrency: int = DETAIL_CONCURRENCY,
+                       detail_timeout: float = DETAIL_TIMEOUT) -> list[dict]:
         """
         Analyse le réseau et retourne une liste d'informations sur les appareils Kasa détectés.
 
+        Les détails des appareils sont récupérés en parallèle (voir discover_iter); la liste
+        est dans l'ordre d'arrivée. on_device: coroutine optionnelle appelée avec chaque
+        appareil dès que ses détails sont disponibles, sans attendre les autres.
+
         Retourne:
             list[dict]: Une liste de dictionnaires, chacun représentant un appareil.
                         Exemple:
@@ -42,90 +158,172 @@ class DeviceDiscoverer:
                             # ... autres appareils
                         ]
         """
-        # Démarre la découverte des appareils Kasa
-        print("Starting Kasa device discovery...")
         discovered_devices_info = []
-        try:
-            found_devices = await Discover.discover(timeout=7)
-            if not found_devices:
-                print("No Kasa devices found on the network.")
-                return []
-
-            print(f"Found {len(found_devices)} device(s). Fetching details...")
-
-            # Parcourt chaque appareil trouvé pour récupérer ses détails
-            for ip, device in found_devices.items():
+        async for device_info in self.discover_iter(concurrency, detail_timeout):
+            discovered_devices_info.append(device_info)
+            if on_device is not None:
                 try:
-                    await device.update()
-
-                    # --- Use getattr for safe access to potentially missing attributes ---
-                    mac_addr = getattr(device, 'mac', 'N/A')
-                    rssi_val = getattr(device, 'rssi', None) # None if not available
-                    hw_info_dict = getattr(device, 'hw_info', {}) # Default to empty dict
-                    sw_info_dict = getattr(device, 'sw_info', {}) # Default to empty dict
-                    has_emeter_flag = getattr(device, 'has_emeter', False)
-                    is_strip_flag = getattr(device, 'is_strip', False)
-                    is_plug_flag = getattr(device, 'is_plug', False)
-                    alias_val = getattr(device, 'alias', f"Unknown Device @ {ip}") # Use IP if no alias
-                    model_val = getattr(device, 'model', 'Unknown Model')
-                    # ------------------------------------------------------------------
-
-                    # Extract versions safely from the dicts retrieved via getattr
-                    hw_ver = hw_info_dict.get('hw_ver', 'N/A')
-                    sw_ver = sw_info_dict.get('sw_ver', 'N/A')
-
-                    device_info = {
-                        'ip': ip,
-                        'alias': alias_val,
-                        'model': model_val,
-                        'mac': mac_addr,
-                        'rssi': rssi_val,
-                        'hw_ver': hw_ver,
-                        'sw_ver': sw_ver,
-                        'has_emeter': has_emeter_flag,
-                        'is_strip': is_strip_flag,
-                        'is_plug': is_plug_flag, # Pass plug flag for controller hint
-                        'outlets': []
-                    }
-
-                    # --- Traite les prises multiples ou simples selon le type détecté ---
-                    if device_info['is_strip'] and hasattr(device, 'children') and device.children:
-                        # Check hasattr for children too, just in case
-                        for i, plug in enumerate(device.children):
-                            device_info['outlets'].append({
-                                'index': i,
-                                'alias': getattr(plug, 'alias', f'Outlet {i}'), # Safe access for child alias
-                                'is_on': getattr(plug, 'is_on', False)        # Safe access for child state
-                            })
-                    elif device_info['is_plug']:
-                         # Safe access for plug state
-                         is_on_state = getattr(device, 'is_on', False)
-                         device_info['outlets'].append({
-                                'index': 0,
-                                'alias': device_info['alias'], # Use main alias
-                                'is_on': is_on_state
-                            })
-                    # Add handling for other device types (bulbs, etc.) if needed
-
-                    discovered_devices_info.append(device_info)
-                    print(f"  - Added: {device_info['alias']} ({ip}) - MAC: {device_info['mac']} RSSI: {device_info['rssi']}")
-
-                except KasaException as e:
-                    # Gère les erreurs spécifiques à Kasa lors de la mise à jour ou du traitement
-                    print(f"  - Kasa error processing device {ip}: {e}. Skipping.")
+                    await on_device(device_info)
                 except Exception as e:
-                    # Gère les autres erreurs inattendues lors du traitement
-                    print(f"  - Unexpected error processing device {ip}: {e}. Skipping.")
+                    print(f"  - Error in discovery callback for {device_info['ip']}: {e}")
 
+        print("Discovery finished.")
+        return discovered_devices_info
+
+    async def discover_iter(self, concurrency: int = DETAIL_CONCURRENCY, detail_timeout: float = DETAIL_TIMEOUT):
+        """
+        Générateur asynchrone: diffusion UDP, puis récupération des détails de tous les appareils
+        en parallèle (au plus `concurrency` à la fois, `detail_timeout` secondes chacun).
+        Chaque appareil est produit dès que ses détails sont prêts: un appareil lent ou muet
+        ne retarde plus les autres.
+        """
+        # Démarre la découverte des appareils Kasa
+        print("Starting Kasa device discovery...")
+        try:
+            found_devices = await Discover.discover(target=self.target, timeout=7)
         except KasaException as e:
             # Gère les erreurs spécifiques à Kasa lors de la phase de découverte principale
             print(f"Error during discovery phase: {e}")
+            return
         except Exception as e:
             # Gère les autres erreurs inattendues lors de la phase de découverte principale
             print(f"An unexpected error occurred during discovery phase: {e}")
+            return
+        if not found_devices:
+            print("No Kasa devices found on the network.")
+            return
 
-        print("Discovery finished.")
-        return discovered_devices_info
+        print(f"Found {len(found_devices)} device(s). Fetching details ({concurrency} at a time)...")
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        tasks = [asyncio.ensure_future(self._fetch_details(ip, device, semaphore, detail_timeout))
+                 for ip, device in found_devices.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                device_info = await next_done
+                if device_info is not None:
+                    yield device_info
+        finally:
+            for task in tasks: # Consommateur arrêté en cours de route: ne pas laisser de requêtes orphelines
+                task.cancel()
+
+    async def _fetch_details(self, ip: str, device, semaphore: asyncio.Semaphore, timeout: float) -> dict | None:
+        """Met à jour un appareil trouvé par la diffusion et retourne ses informations (None si échec)."""
+        async with semaphore:
+            try:
+                await asyncio.wait_for(device.update(), timeout)
+                device_info = device_info_from(ip, device)
+                print(f"  - Added: {device_info['alias']} ({ip}) - MAC: {device_info['mac']} RSSI: {device_info['rssi']}")
+                return device_info
+            except asyncio.TimeoutError:
+                print(f"  - Device {ip} did not answer within {timeout} s. Skipping.")
+            except KasaException as e:
+                # Gère les erreurs spécifiques à Kasa lors de la mise à jour ou du traitement
+                print(f"  - Kasa error processing device {ip}: {e}. Skipping.")
+            except Exception as e:
+                # Gère les autres erreurs inattendues lors du traitement
+                print(f"  - Unexpected error processing device {ip}: {e}. Skipping.")
+            return None
+
+    async def probe(self, known_devices: list[dict], timeout: float = PROBE_TIMEOUT) -> list[dict]:
+        """
+        Interroge directement (unicast, en parallèle) des appareils déjà connus, ex: ceux du
+        DiscoveryCache. Retourne les informations à jour des appareils qui répondent à leur IP
+        connue avec la même adresse MAC (un autre appareil a pu reprendre l'IP via DHCP).
+        """
+        results = await asyncio.gather(*(self._probe_one(info, timeout) for info in known_devices))
+        probed = [info for info in results if info is not None]
+        print(f"Probed {len(known_devices)} known Kasa device(s): {len(probed)} answered.")
+        return probed
+
+    async def _probe_one(self, known: dict, timeout: float) -> dict | None:
+        ip, mac = known.get('ip'), known.get('mac')
+        device = None
+        try:
+            device = await asyncio.wait_for(Discover.discover_single(ip, discovery_timeout=timeout), timeout + 1)
+            await asyncio.wait_for(device.update(), timeout)
+            device_info = device_info_from(ip, device)
+        except (KasaException, asyncio.TimeoutError, OSError) as e:
+            print(f"  - Known device {known.get('alias', mac)} not reachable at {ip}: {e}")
+            return None
+        finally:
+            if device is not None:
+                try:
+                    await device.disconnect() # Sonde seulement: le contrôleur ouvrira sa propre session
+                except Exception:
+                    pass
+        if device_info['mac'] != mac:
+            print(f"  - {ip} now answers as {device_info['mac']} (expected {mac}), ignoring cached entry.")
+            return None
+        return device_info
+
+    async def rediscover(self, known_devices: dict[str, dict], detail_timeout: float = DETAIL_TIMEOUT) -> DeviceDelta:
+        """
+        Redécouverte incrémentale à faible coût, comparée aux appareils connus ({mac: infos}).
+
+        La diffusion suffit pour les appareils inchangés (MAC, IP et prises sont lus dans leur
+        réponse): seuls les appareils nouveaux, déplacés ou dont les prises ont changé sont
+        interrogés. Un appareil n'est déclaré disparu qu'après `missed_scans` redécouvertes
+        consécutives sans réponse (une réponse UDP peut se perdre).
+        """
+        try:
+            found_devices = await Discover.discover(target=self.target, timeout=7)
+        except Exception as e:
+            print(f"Error during rediscovery: {e}")
+            return DeviceDelta([], [], {}, {})
+
+        added, ip_changed, outlets_changed = [], {}, {}
+        seen_macs = set()
+        to_fetch = {} # {ip: appareil} à interroger
+        try:
+            for ip, device in found_devices.items():
+                try:
+                    mac = device.mac
+                except Exception:
+                    mac = None # Réponse partielle (ex: protocole récent): MAC connue après update()
+                known = known_devices.get(mac) if mac else None
+                if mac:
+                    seen_macs.add(mac)
+                signature = _scan_signature(device)
+                if known is None or known.get('ip') != ip or signature is None or signature != outlet_signature(known):
+                    to_fetch[ip] = device
+
+            semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
+            results = await asyncio.gather(*(self._fetch_details(ip, device, semaphore, detail_timeout)
+                                             for ip, device in to_fetch.items()))
+        finally:
+            for device in found_devices.values(): # Appareils de passage: les contrôleurs ont leurs propres sessions
+                try:
+                    await device.disconnect()
+                except Exception:
+                    pass
+
+        for device_info in results:
+            if device_info is None:
+                continue
+            mac = device_info['mac']
+            seen_macs.add(mac)
+            known = known_devices.get(mac)
+            if known is None:
+                added.append(device_info)
+            elif known.get('ip') != device_info['ip']:
+                ip_changed[mac] = device_info
+            elif outlet_signature(known) != outlet_signature(device_info):
+                outlets_changed[mac] = device_info
+
+        removed = []
+        for mac in known_devices:
+            if mac in seen_macs:
+                self._misses.pop(mac, None)
+                continue
+            self._misses[mac] = self._misses.get(mac, 0) + 1
+            if self._misses[mac] >= self.missed_scans:
+                removed.append(mac)
+                del self._misses[mac]
+
+        delta = DeviceDelta(added, removed, ip_changed, outlets_changed)
+        print(f"Rediscovery: {len(found_devices)} answered, {len(to_fetch)} queried, "
+              f"+{len(added)} -{len(removed)} ip:{len(ip_changed)} outlets:{len(outlets_changed)}.")
+        return delta
 
 # Example usage (for testing this file directly)
 # (No changes needed in the __main__ block below)
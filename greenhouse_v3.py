@@ -7,6 +7,7 @@ import queue
 import logging # Import logging first
 import uuid
 from datetime import datetime, time, timedelta
+from time import monotonic # Horloge des temps de maintien des prises
 import re # Pour la validation de l'heure
 import copy # Pour la copie profonde des conditions
 
@@ -16,15 +17,28 @@ try:
     # logger_setup.py (pour la configuration du logging)
     from logger_setup import setup_logging
     # discover_device.py (pour la découverte des appareils Kasa)
-    from discover_device import DeviceDiscoverer
+    from discover_device import DeviceDiscoverer, DiscoveryCache, DEFAULT_CACHE_FILE
     # device_control.py (pour le contrôle des appareils Kasa)
-    from device_control import DeviceController
+    from device_control import DeviceController, DeviceSessionPool
     # temp_sensor_wrapper.py (pour les capteurs de température)
     from temp_sensor_wrapper import TempSensorManager
     # light_sensor.py (pour les capteurs de lumière BH1750)
     from light_sensor import BH1750Manager
+    # sensor_service.py (acquisition unique des capteurs, instantanés immuables)
+    from sensor_service import SensorAcquisitionService
+    # w1_watcher.py (détection à chaud des sondes 1-Wire)
+    from w1_watcher import W1BusWatcher
+    # timeseries.py (historique en mémoire des capteurs et des prises)
+    from timeseries import TimeSeriesStore, DEFAULT_SENSOR_CAPACITY, DEFAULT_OUTLET_CAPACITY
+    # history_store.py (historique des capteurs sur disque, agrégats minute/heure)
+    from history_store import DiskHistory, DEFAULT_FLUSH_INTERVAL
+    # window_aggregates.py (moyenne/min/max glissants pour les conditions 'Agrégat')
+    from window_aggregates import AggregateTracker
     # config_manager.py (pour charger/sauvegarder la configuration)
     from config_manager import load_config, save_config
+    # rule_engine.py (pour l'évaluation compilée des règles)
+    from rule_engine import (RuleEngine, compile_condition, compile_group, outlet_command, seconds_of_day, SENSOR_OPERATOR_FUNCS,
+                             PENDING_RETRY_DELAY)
 except ImportError as e:
     # Log critique si un module manque
     logging.critical(f"Erreur d'importation d'un module requis: {e}. Assurez-vous que tous les fichiers .py sont présents.")
@@ -45,10 +59,20 @@ TIME_OPERATORS = ['<', '>', '=', '!=', '<=', '>='] # Opérateurs pour les condit
 SENSOR_OPERATORS = ['<', '>', '=', '!=', '<=', '>='] # Opérateurs pour les conditions de capteurs
 ACTIONS = ['ON', 'OFF'] # Actions possibles sur les prises
 LOGIC_OPERATORS = ['ET', 'OU'] # Opérateurs logiques entre conditions ('AND', 'OR')
-CONDITION_TYPES = ['Capteur', 'Heure(HH:MM)'] # Types de conditions possibles
+AGGREGATE_CONDITION_TYPES = {'Moyenne': 'avg', 'Min': 'min', 'Max': 'max', 'Pente(/min)': 'slope'} # Type affiché -> fonction d'une condition 'Agrégat'
+CONDITION_TYPES = ['Capteur', 'Heure(HH:MM)'] + list(AGGREGATE_CONDITION_TYPES) # Types de conditions possibles
 DEFAULT_CONFIG_FILE = 'config.yaml' # Nom du fichier de configuration
+DEFAULT_HISTORY_DIR = 'history' # Répertoire de l'historique des capteurs sur disque
 TIME_REGEX = re.compile(r'^([01]\d|2[0-3]):([0-5]\d)$') # Expression régulière pour valider le format HH:MM
 
+def condition_kind(type_display):
+    """Type interne ('Capteur', 'Heure' ou 'Agrégat') d'un type affiché dans l'éditeur de conditions."""
+    if type_display.startswith('Heure'):
+        return 'Heure'
+    if type_display in AGGREGATE_CONDITION_TYPES:
+        return 'Agrégat'
+    return 'Capteur'
+
 #--------------------------------------------------------------------------
 # CLASSE POUR L'ÉDITEUR DE CONDITIONS (POP-UP) - SANS SCROLLBAR
 #--------------------------------------------------------------------------
@@ -72,7 +96,7 @@ class ConditionEditor(simpledialog.Dialog):
         super().__init__(parent, title=title)
 
     # Définition des colonnes (X à gauche)
-    COL_WIDTHS = { "delete": 35, "logic": 30, "type": 100, "sensor": 160, "op": 45, "value": 90 }
+    COL_WIDTHS = { "delete": 35, "logic": 30, "type": 100, "sensor": 160, "op": 45, "value": 90, "hyst": 55, "window": 60 }
 
     def body(self, master):
         """Crée le contenu du corps de la boîte de dialogue sans scrollbar."""
@@ -108,6 +132,8 @@ class ConditionEditor(simpledialog.Dialog):
         header_frame.columnconfigure(3, weight=1, minsize=self.COL_WIDTHS["sensor"]) # Sensor extensible
         header_frame.columnconfigure(4, weight=0, minsize=self.COL_WIDTHS["op"])
         header_frame.columnconfigure(5, weight=0, minsize=self.COL_WIDTHS["value"])
+        header_frame.columnconfigure(6, weight=0, minsize=self.COL_WIDTHS["hyst"])
+        header_frame.columnconfigure(7, weight=0, minsize=self.COL_WIDTHS["window"])
         # Placer les labels d'en-tête
         ttk.Label(header_frame, text="", anchor='w').grid(row=0, column=0, padx=1, sticky='w')
         ttk.Label(header_frame, text="", anchor='w').grid(row=0, column=1, padx=1, sticky='w')
@@ -115,6 +141,8 @@ class ConditionEditor(simpledialog.Dialog):
         ttk.Label(header_frame, text="Capteur", anchor='w').grid(row=0, column=3, padx=1, sticky='w')
         ttk.Label(header_frame, text="OP", anchor='w').grid(row=0, column=4, padx=1, sticky='w')
         ttk.Label(header_frame, text="Valeur", anchor='w').grid(row=0, column=5, padx=1, sticky='w')
+        ttk.Label(header_frame, text="Hyst.", anchor='w').grid(row=0, column=6, padx=1, sticky='w') # Bande morte (optionnelle)
+        ttk.Label(header_frame, text="Fenêtre (min)", anchor='w').grid(row=0, column=7, padx=1, sticky='w') # Agrégats uniquement
 
         # --- Frame pour contenir les lignes de conditions (PAS de Canvas/Scrollbar) ---
         # Renommé pour plus de clarté
@@ -166,6 +194,8 @@ class ConditionEditor(simpledialog.Dialog):
         line_frame.columnconfigure(3, weight=1, minsize=self.COL_WIDTHS["sensor"])
         line_frame.columnconfigure(4, weight=0, minsize=self.COL_WIDTHS["op"])
         line_frame.columnconfigure(5, weight=0, minsize=self.COL_WIDTHS["value"])
+        line_frame.columnconfigure(6, weight=0, minsize=self.COL_WIDTHS["hyst"])
+        line_frame.columnconfigure(7, weight=0, minsize=self.COL_WIDTHS["window"])
 
         widgets = {}
         if condition_data:
@@ -211,6 +241,16 @@ class ConditionEditor(simpledialog.Dialog):
         widgets['value_entry'] = ttk.Entry(line_frame, textvariable=widgets['value_var'], width=10)
         widgets['value_entry'].grid(row=0, column=5, padx=2, sticky='w')
 
+        # Col 6: Hystérésis (bande morte, capteurs uniquement)
+        widgets['hyst_var'] = tk.StringVar()
+        widgets['hyst_entry'] = ttk.Entry(line_frame, textvariable=widgets['hyst_var'], width=6)
+        widgets['hyst_entry'].grid(row=0, column=6, padx=2, sticky='w')
+
+        # Col 7: Fenêtre glissante en minutes (agrégats Moyenne/Min/Max uniquement)
+        widgets['window_var'] = tk.StringVar()
+        widgets['window_entry'] = ttk.Entry(line_frame, textvariable=widgets['window_var'], width=6)
+        widgets['window_entry'].grid(row=0, column=7, padx=2, sticky='w')
+
         # Stocker info (inclut la ligne de grille pour la suppression/maj)
         line_info = {'frame': line_frame, 'widgets': widgets, 'condition_id': condition_id, 'row': current_grid_row}
         self.condition_lines.append(line_info) # Ajouter APRES avoir vérifié len() pour le label logique
@@ -219,15 +259,23 @@ class ConditionEditor(simpledialog.Dialog):
         if condition_data:
              # ... (Logique de peuplement identique) ...
              cond_type_raw = condition_data.get('type')
-             cond_type_display = next((ct for ct in CONDITION_TYPES if ct.startswith(cond_type_raw)), '') if cond_type_raw else ''
+             if cond_type_raw == 'Agrégat':
+                 cond_type_display = next((ct for ct, func in AGGREGATE_CONDITION_TYPES.items() if func == condition_data.get('function')), '')
+             else:
+                 cond_type_display = next((ct for ct in CONDITION_TYPES if ct.startswith(cond_type_raw)), '') if cond_type_raw else ''
              widgets['type_var'].set(cond_type_display)
              widgets['operator_var'].set(condition_data.get('operator', ''))
-             if cond_type_raw == 'Capteur':
+             if cond_type_raw in ('Capteur', 'Agrégat'):
                  sensor_id = condition_data.get('id')
                  sensor_name = self.app.get_alias('sensor', sensor_id) if sensor_id else ''
                  valid_sensor_names = [name for name, _id in self.available_sensors]
                  widgets['sensor_var'].set(sensor_name if sensor_name in valid_sensor_names else "")
                  widgets['value_var'].set(str(condition_data.get('threshold', '')))
+                 if condition_data.get('hysteresis') is not None:
+                     widgets['hyst_var'].set(str(condition_data.get('hysteresis')))
+                 if cond_type_raw == 'Agrégat':
+                     try: widgets['window_var'].set(f"{float(condition_data.get('window')) / 60:g}")
+                     except (TypeError, ValueError): pass
              elif cond_type_raw == 'Heure':
                  widgets['value_var'].set(condition_data.get('value', ''))
              self._on_condition_type_change(widgets, condition_id)
@@ -241,20 +289,28 @@ class ConditionEditor(simpledialog.Dialog):
         """Adapte l'UI d'une ligne en utilisant grid."""
         # ... (Identique à la version Grid V4 - X à gauche) ...
         selected_type_display = line_widgets['type_var'].get()
-        selected_type_internal = 'Heure' if selected_type_display.startswith('Heure') else 'Capteur'
+        selected_type_internal = condition_kind(selected_type_display)
         current_op = line_widgets['operator_var'].get()
         current_val = line_widgets['value_var'].get()
         sensor_combo = line_widgets['sensor_combo']
         operator_combo = line_widgets['operator_combo']
         value_entry = line_widgets['value_entry']
-        sensor_col, operator_col, value_col = 3, 4, 5
+        hyst_entry = line_widgets['hyst_entry']
+        window_entry = line_widgets['window_entry']
+        sensor_col, operator_col, value_col, hyst_col, window_col = 3, 4, 5, 6, 7
+
+        if selected_type_internal == 'Agrégat':
+            window_entry.grid(row=0, column=window_col, padx=2, sticky='w')
+        else:
+            window_entry.grid_remove(); line_widgets['window_var'].set("")
 
-        if selected_type_internal == 'Capteur':
+        if selected_type_internal in ('Capteur', 'Agrégat'):
             sensor_combo.config(state="readonly")
             sensor_combo.grid(row=0, column=sensor_col, padx=2, sticky='ew')
             operator_combo.grid(row=0, column=operator_col, padx=2, sticky='w')
             value_entry.grid(row=0, column=value_col, padx=2, sticky='w')
             value_entry.config(state="normal")
+            hyst_entry.grid(row=0, column=hyst_col, padx=2, sticky='w')
             operator_combo.config(values=SENSOR_OPERATORS)
             if current_op not in SENSOR_OPERATORS: line_widgets['operator_var'].set('')
             if TIME_REGEX.match(current_val): line_widgets['value_var'].set('')
@@ -265,6 +321,7 @@ class ConditionEditor(simpledialog.Dialog):
             operator_combo.grid(row=0, column=operator_col, padx=2, sticky='w')
             value_entry.grid(row=0, column=value_col, padx=2, sticky='w')
             value_entry.config(state="normal")
+            hyst_entry.grid_remove(); line_widgets['hyst_var'].set("")
             operator_combo.config(values=TIME_OPERATORS)
             if current_op not in TIME_OPERATORS: line_widgets['operator_var'].set('')
             try:
@@ -346,7 +403,7 @@ class ConditionEditor(simpledialog.Dialog):
             widgets = line_info['widgets']
             condition_data = {'condition_id': line_info['condition_id']}
             cond_type_display = widgets['type_var'].get()
-            cond_type_internal = 'Heure' if cond_type_display.startswith('Heure') else 'Capteur'
+            cond_type_internal = condition_kind(cond_type_display)
             operator = widgets['operator_var'].get()
             value_str = widgets['value_var'].get().strip()
             if not cond_type_display:
@@ -360,7 +417,7 @@ class ConditionEditor(simpledialog.Dialog):
             if not value_str:
                 messagebox.showwarning("Validation", f"Ligne {i+1}: Veuillez entrer une valeur.", parent=self)
                 return 0
-            if cond_type_internal == 'Capteur':
+            if cond_type_internal in ('Capteur', 'Agrégat'):
                 sensor_name = widgets['sensor_var'].get()
                 if not sensor_name:
                     messagebox.showwarning("Validation", f"Ligne {i+1}: Veuillez sélectionner un capteur.", parent=self)
@@ -377,6 +434,21 @@ class ConditionEditor(simpledialog.Dialog):
                 if operator not in SENSOR_OPERATORS:
                      messagebox.showwarning("Validation", f"Ligne {i+1}: Opérateur '{operator}' invalide pour Capteur.", parent=self)
                      return 0
+                hyst_str = widgets['hyst_var'].get().strip()
+                if hyst_str:
+                    try: hysteresis = float(hyst_str.replace(',', '.'))
+                    except ValueError:
+                        messagebox.showwarning("Validation", f"Ligne {i+1}: Hystérésis '{hyst_str}' invalide (numérique attendu).", parent=self)
+                        return 0
+                    if hysteresis != 0: condition_data['hysteresis'] = hysteresis # Négative: refusée par compile_condition
+                if cond_type_internal == 'Agrégat':
+                    condition_data['function'] = AGGREGATE_CONDITION_TYPES[cond_type_display]
+                    window_str = widgets['window_var'].get().strip()
+                    try: window_minutes = float(window_str.replace(',', '.'))
+                    except ValueError:
+                        messagebox.showwarning("Validation", f"Ligne {i+1}: Fenêtre '{window_str}' invalide (minutes attendues).", parent=self)
+                        return 0
+                    condition_data['window'] = int(round(window_minutes * 60)) # Secondes (vérifiées par compile_condition)
             elif cond_type_internal == 'Heure':
                 if not TIME_REGEX.match(value_str):
                     messagebox.showwarning("Validation", f"Ligne {i+1}: Heure '{value_str}' invalide (format HH:MM attendu).", parent=self)
@@ -386,6 +458,12 @@ class ConditionEditor(simpledialog.Dialog):
                 if operator not in TIME_OPERATORS:
                      messagebox.showwarning("Validation", f"Ligne {i+1}: Opérateur '{operator}' invalide pour Heure.", parent=self)
                      return 0
+            # Vérification finale: la condition doit pouvoir être compilée par le moteur de règles
+            try:
+                compile_condition(condition_data)
+            except ValueError as e:
+                messagebox.showwarning("Validation", f"Ligne {i+1}: Condition invalide ({e}).", parent=self)
+                return 0
             validated_conditions.append(condition_data)
         self.result_logic = logic
         self.result_conditions = validated_conditions
@@ -477,10 +555,96 @@ class GreenhouseApp:
             rule_counter += 1
         logging.info(f"{len(self.rules)} règles chargées depuis {DEFAULT_CONFIG_FILE}.")
 
+        # Compilation des règles dans le moteur d'évaluation (index capteur -> règles, etc.)
+        # Backend: 'auto' (défaut), 'python' ou 'numpy' via config['monitoring']['evaluation_backend']
+        monitoring_settings = self.config.get('monitoring') or {}
+        self.rule_engine = RuleEngine(backend=monitoring_settings.get('evaluation_backend', 'auto'))
+        self.rule_engine.load(self.rules)
+
         # Initialisation des gestionnaires de périphériques et des listes d'état
         self.kasa_devices = {} # {mac: {'info': dict, 'controller': DeviceController, 'ip': str}}
-        self.temp_manager = TempSensorManager()
-        self.light_manager = BH1750Manager()
+        kasa_settings = self.config.get('kasa') or {}
+        # Sessions Kasa persistantes, une par MAC, chacune protégée par un disjoncteur (appareil injoignable)
+        # via config['kasa']['circuit_breaker'] = {'failure_threshold': 2, 'base_backoff': 5, 'max_backoff': 300}
+        try:
+            self.device_pool = DeviceSessionPool(breaker_settings=kasa_settings.get('circuit_breaker'))
+        except (ValueError, TypeError) as e:
+            logging.error(f"Configuration 'kasa.circuit_breaker' invalide ({e}), paramètres par défaut utilisés.")
+            self.device_pool = DeviceSessionPool()
+        # Boucle asyncio persistante (thread dédié) pour toutes les E/S Kasa: découverte, redécouverte,
+        # monitoring et extinction y partagent les sessions du pool, modifié uniquement depuis ce thread
+        self.kasa_loop = asyncio.new_event_loop()
+        threading.Thread(target=self.kasa_loop.run_forever, name="KasaLoop", daemon=True).start()
+        # Cache du dernier résultat de découverte Kasa (démarrage sans attendre la diffusion UDP)
+        # via config['kasa'] = {'discovery_cache': chemin du fichier, ou '' pour désactiver}
+        cache_file = kasa_settings.get('discovery_cache', DEFAULT_CACHE_FILE)
+        self.discovery_cache = DiscoveryCache(cache_file) if cache_file else None
+        # Redécouverte incrémentale périodique (secondes, 0 = désactivée)
+        # via config['kasa']['rediscovery_interval']
+        try:
+            self.kasa_rediscovery_interval = max(0.0, float(kasa_settings.get('rediscovery_interval', 300)))
+        except (ValueError, TypeError) as e:
+            logging.error(f"Configuration 'kasa' invalide ({e}), redécouverte toutes les 300 s.")
+            self.kasa_rediscovery_interval = 300.0
+        self.kasa_rediscoverer = DeviceDiscoverer() # Conserve le compte des redécouvertes sans réponse par MAC
+        self._kasa_rediscovery_running = False
+        # Sondes DS18B20: mode d'acquisition, résolution et intervalle de lecture par sonde
+        # via config['temperature_sensors'] = {'acquisition_mode': ..., 'default': {...}, 'probes': {id: {...}}}
+        temp_settings = self.config.get('temperature_sensors') or {}
+        try:
+            self.temp_manager = TempSensorManager(acquisition_mode=temp_settings.get('acquisition_mode', 'auto'),
+                                                  default_settings=temp_settings.get('default'),
+                                                  probe_settings=temp_settings.get('probes'))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"Configuration 'temperature_sensors' invalide ({e}), paramètres par défaut utilisés.")
+            self.temp_manager = TempSensorManager()
+        # Capteurs BH1750: pilote ('auto', 'smbus2', 'adafruit'), mode de mesure continue et bus I2C
+        # via config['light_sensors'] = {'backend': ..., 'mode': ..., 'bus': N}
+        light_settings = self.config.get('light_sensors') or {}
+        try:
+            self.light_manager = BH1750Manager(bus_number=int(light_settings.get('bus', 1)),
+                                               backend=light_settings.get('backend', 'auto'),
+                                               mode=light_settings.get('mode', 'high'))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"Configuration 'light_sensors' invalide ({e}), paramètres par défaut utilisés.")
+            self.light_manager = BH1750Manager()
+        # Seul le service d'acquisition lit les capteurs; monitoring et UI consultent ses instantanés
+        # Familles lues en parallèle, délai max. par famille via config['monitoring']['sensor_timeouts']
+        sensor_poll_interval = float(monitoring_settings.get('sensor_poll_interval', 2)) # secondes
+        try:
+            self.sensor_service = SensorAcquisitionService(self.temp_manager, self.light_manager, sensor_poll_interval,
+                                                           monitoring_settings.get('sensor_timeouts'))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"Configuration 'sensor_timeouts' invalide ({e}), délais par défaut utilisés.")
+            self.sensor_service = SensorAcquisitionService(self.temp_manager, self.light_manager, sensor_poll_interval)
+        # Historique en mémoire (tampons circulaires), alimenté par chaque instantané et chaque état Kasa lu
+        # Taille via config['history'] = {'sensor_capacity': échantillons par capteur, 'outlet_capacity': changements par prise}
+        history_settings = self.config.get('history') or {}
+        try:
+            self.history = TimeSeriesStore(int(history_settings.get('sensor_capacity', DEFAULT_SENSOR_CAPACITY)),
+                                           int(history_settings.get('outlet_capacity', DEFAULT_OUTLET_CAPACITY)))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"Configuration 'history' invalide ({e}), capacités par défaut utilisées.")
+            self.history = TimeSeriesStore()
+        self.sensor_service.add_listener(self.history.on_sensor_snapshot)
+        # Agrégats glissants des conditions 'Agrégat' (fenêtre initiale remplie depuis l'historique en mémoire)
+        self.aggregates = AggregateTracker(seed=self.history.sensor_window)
+        # Historique persistant (fichiers mmap brut 48 h / minute 90 j / heure), écrit par lots
+        # via config['history'] = {'persist': bool, 'directory': chemin, 'flush_interval': secondes}
+        self.disk_history = None
+        if history_settings.get('persist', True):
+            try:
+                self.disk_history = DiskHistory(history_settings.get('directory', DEFAULT_HISTORY_DIR), sensor_poll_interval,
+                                                float(history_settings.get('flush_interval', DEFAULT_FLUSH_INTERVAL)))
+                self.sensor_service.add_listener(self.disk_history.on_sensor_snapshot)
+            except (OSError, ValueError, TypeError) as e:
+                logging.error(f"Historique sur disque désactivé ({e}).")
+        self.sensor_service.start()
+        # Détection à chaud des sondes 1-Wire: ajout/retrait incrémental, puis rafraîchissement de l'UI
+        self.w1_watcher = W1BusWatcher(self.temp_manager.bus_directory(), self.sensor_service.apply_temperature_bus_changes,
+                                       name_filter=TempSensorManager.is_probe_entry)
+        self.sensor_service.add_topology_listener(lambda: self.root.after(0, self.refresh_device_lists))
+        self.w1_watcher.start()
         self.available_sensors = [] # [(alias, id), ...] pour les combobox
         self.available_kasa_strips = [] # [(alias, mac), ...] pour les combobox
         self.available_outlets = {} # {mac: [(alias_prise, index), ...]} pour les combobox
@@ -489,6 +653,8 @@ class GreenhouseApp:
         self.asyncio_loop = None # Référence à la boucle d'événements asyncio utilisée par le monitoring
         self.ui_update_job = None # Référence au job 'after' pour les mises à jour périodiques de l'UI
         self.live_kasa_states = {} # {mac: {index: bool}} état actuel des prises lu périodiquement
+        self.monitoring_sensor_values = {} # {sensor_id: valeur} dernière lecture des capteurs par le monitoring
+        self._monitoring_wakeup = None # asyncio.Event réveillant la boucle de monitoring
         self.rule_widgets = {} # {rule_id: {'frame': ttk.Frame, 'widgets': dict}} pour accéder aux widgets d'une règle
 
         # Création de l'interface graphique
@@ -499,6 +665,9 @@ class GreenhouseApp:
         self.update_log_display()
         # Lancement de la découverte initiale des périphériques en arrière-plan
         self.discover_all_devices()
+        # Puis redécouvertes incrémentales périodiques des appareils Kasa
+        if self.kasa_rediscovery_interval > 0:
+            self.root.after(int(self.kasa_rediscovery_interval * 1000), self._schedule_kasa_rediscovery)
         # Gestion de la fermeture de la fenêtre
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -692,6 +861,7 @@ class GreenhouseApp:
             }
             # Ajouter la nouvelle règle à la liste interne
             self.rules.append(rule_data)
+            self.rule_engine.update_rule(rule_data)
         else:
             # Si des données sont fournies, utiliser l'ID existant (ou en générer un si manquant)
             rule_id = rule_data.get('id')
@@ -901,6 +1071,8 @@ class GreenhouseApp:
             initial_len = len(self.rules)
             self.rules = [rule for rule in self.rules if rule.get('id') != rule_id]
 
+            self.rule_engine.remove_rule(rule_id)
+
             if len(self.rules) < initial_len:
                 logging.info(f"Règle {rule_id} supprimée.")
             else:
@@ -981,6 +1153,7 @@ class GreenhouseApp:
         rule_data['target_device_mac'] = kasa_mac
         rule_data['target_outlet_index'] = outlet_index # Sera None si non trouvé
         rule_data['action'] = action
+        self.rule_engine.update_rule(rule_data)
 
         logging.debug(f"Partie ALORS de la règle {rule_id} mise à jour dans les données: MAC={kasa_mac}, Index={outlet_index}, Action={action}")
 
@@ -1090,56 +1263,107 @@ class GreenhouseApp:
                      widgets['until_summary_label'].config(text=self._generate_condition_summary(new_conditions, new_logic))
                 except tk.TclError: pass # Ignorer si détruit
 
+        # Recompiler la règle dans le moteur d'évaluation
+        self.rule_engine.update_rule(rule_data)
+
     # --- Découverte / Rafraîchissement des Périphériques ---
     def discover_all_devices(self):
         """Lance la découverte de tous les types de périphériques (Capteurs T°, Lux, Kasa)."""
         logging.info("Lancement de la découverte de tous les périphériques...")
-        # Découverte des capteurs de température (synchrone, rapide)
-        try:
-            self.temp_manager.discover_sensors()
-            logging.info(f"Découverte Température: {len(self.temp_manager.sensors)} capteur(s) trouvé(s).")
-        except Exception as e:
-            logging.error(f"Erreur lors de la découverte des capteurs de température: {e}")
-
-        # Découverte des capteurs de lumière (synchrone, rapide)
+        # Découverte des capteurs de température et de lumière (synchrone, rapide), via le service d'acquisition
+        self.sensor_service.rediscover()
+        logging.info(f"Découverte Température: {len(self.temp_manager.sensors)} capteur(s) trouvé(s).")
         try:
-            self.light_manager.scan_sensors()
             active_light_sensors = self.light_manager.get_active_sensors()
             logging.info(f"Découverte Lumière (BH1750): {len(active_light_sensors)} capteur(s) trouvé(s).")
         except Exception as e:
             logging.error(f"Erreur lors de la découverte des capteurs de lumière: {e}")
 
         # Découverte des appareils Kasa (asynchrone, potentiellement long)
-        # Lancé dans un thread séparé pour ne pas bloquer l'UI
-        threading.Thread(target=self._run_kasa_discovery_async, daemon=True).start()
+        # Exécutée sur la boucle Kasa persistante pour ne pas bloquer l'UI
+        self._run_on_kasa_loop(self._async_discover_kasa()).add_done_callback(self._log_kasa_task_error)
 
-    def _run_kasa_discovery_async(self):
-        """Exécute la découverte Kasa asynchrone dans une boucle d'événements."""
-        try:
-            # Essayer de récupérer la boucle d'événements existante (si déjà créée par monitoring)
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            # Si aucune boucle n'existe, en créer une nouvelle
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        # Exécuter la tâche de découverte Kasa jusqu'à ce qu'elle soit terminée
-        loop.run_until_complete(self._async_discover_kasa())
-        # Note: Ne ferme pas la boucle ici, elle pourrait être réutilisée par le monitoring
+    def _run_on_kasa_loop(self, coro):
+        """Soumet une coroutine à la boucle Kasa persistante (depuis n'importe quel thread); retourne son Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.kasa_loop)
+
+    @staticmethod
+    def _log_kasa_task_error(future):
+        """Callback d'une tâche Kasa lancée sans attendre son résultat: journalise son exception éventuelle."""
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Erreur dans une tâche Kasa en arrière-plan: {future.exception()}")
 
     async def _async_discover_kasa(self):
-        """Tâche asynchrone pour découvrir les appareils Kasa sur le réseau."""
+        """
+        Tâche asynchrone pour découvrir les appareils Kasa sur le réseau.
+
+        Au démarrage, les appareils du cache de découverte sont d'abord interrogés directement
+        (unicast, en parallèle) et utilisables aussitôt; la découverte par diffusion, plus lente,
+        réconcilie ensuite la liste (nouveaux appareils, IP changées) et met le cache à jour.
+        """
         logging.info("Début découverte Kasa asynchrone...")
         discoverer = DeviceDiscoverer()
+        probed_kasa = []
+        cached_kasa = self.discovery_cache.load() if self.discovery_cache is not None and not self.kasa_devices else []
+        if cached_kasa:
+            try:
+                probed_kasa = await discoverer.probe(cached_kasa)
+            except Exception as e:
+                logging.error(f"Erreur pendant l'interrogation des appareils Kasa en cache: {e}")
+            if probed_kasa:
+                await self._adopt_kasa_devices(probed_kasa)
+                logging.info(f"Appareils Kasa du cache prêts: {len(probed_kasa)}/{len(cached_kasa)} (découverte réseau en cours).")
+                self.root.after(0, self.refresh_device_lists)
+
+        # Chaque appareil trouvé est utilisable dès que ses détails arrivent (sans attendre les plus lents)
+        initialized_macs = {dev_info['mac'] for dev_info in probed_kasa}
         try:
-            discovered_kasa = await discoverer.discover() # Lance la découverte réseau
+            discovered_kasa = await discoverer.discover( # Lance la découverte réseau
+                on_device=lambda dev_info: self._adopt_streamed_kasa_device(dev_info, initialized_macs))
         except Exception as e:
             logging.error(f"Erreur critique pendant la découverte Kasa: {e}")
             discovered_kasa = []
 
+        # Un appareil qui a répondu en direct mais pas à la diffusion (paquet UDP perdu) est conservé
+        discovered_macs = {dev_info.get('mac') for dev_info in discovered_kasa}
+        discovered_kasa += [dev_info for dev_info in probed_kasa if dev_info['mac'] not in discovered_macs]
+        # Les appareils déjà pris en charge (cache, flux de découverte) ne sont pas éteints une seconde fois
+        await self._adopt_kasa_devices(discovered_kasa, initialized_macs=initialized_macs)
+        if discovered_kasa and self.discovery_cache is not None:
+            self.discovery_cache.save(discovered_kasa)
+        logging.info(f"Découverte Kasa terminée: {len(self.kasa_devices)} appareil(s) trouvé(s).")
+
+        # Planifier l'exécution de refresh_device_lists dans le thread principal de Tkinter
+        # Utiliser after(0) ou after(100) pour s'assurer que cela s'exécute après la fin de cette coroutine
+        self.root.after(100, self.refresh_device_lists)
+
+    async def _adopt_streamed_kasa_device(self, dev_info, initialized_macs):
+        """
+        Ajoute un appareil dès sa découverte (avant la fin de la découverte complète).
+        Les appareils déjà connus sont laissés à la réconciliation finale (_adopt_kasa_devices).
+        """
+        ip, mac = dev_info.get('ip'), dev_info.get('mac')
+        if not ip or not mac or mac in self.kasa_devices:
+            return
+        is_strip = dev_info.get('is_strip', False)
+        is_plug = dev_info.get('is_plug', False)
+        ctrl = await self.device_pool.acquire(mac, ip, is_strip, is_plug)
+        # Remplacement de la référence: les lecteurs des autres threads voient l'ancien ou le nouveau dictionnaire
+        self.kasa_devices = {**self.kasa_devices, mac: {'info': dev_info, 'controller': ctrl, 'ip': ip}}
+        if not self.monitoring_active and (is_strip or is_plug) and mac not in initialized_macs:
+            try:
+                await ctrl.turn_all_outlets_off() # Extinction initiale par sécurité, comme _adopt_kasa_devices
+            except Exception as e:
+                logging.error(f"Erreur lors de l'extinction initiale Kasa de {dev_info.get('alias', mac)}: {e}")
+        initialized_macs.add(mac)
+        self.root.after(0, self.refresh_device_lists)
+
+    async def _adopt_kasa_devices(self, device_infos, initialized_macs=frozenset()):
+        """Remplace la liste des appareils Kasa (contrôleurs du pool, extinction initiale hors monitoring)."""
         new_kasa_devices = {} # Dictionnaire temporaire pour les nouveaux appareils
         tasks_initial_state = [] # Tâches pour récupérer l'état initial et éteindre si besoin
 
-        for dev_info in discovered_kasa:
+        for dev_info in device_infos:
             ip = dev_info.get('ip')
             mac = dev_info.get('mac')
             alias = dev_info.get('alias', 'N/A')
@@ -1148,10 +1372,10 @@ class GreenhouseApp:
                 logging.warning(f"Appareil Kasa découvert sans IP ou MAC: Alias='{alias}', Info={dev_info}")
                 continue
 
-            # Créer un contrôleur pour cet appareil
+            # Récupérer (ou créer) le contrôleur persistant de cet appareil
             is_strip = dev_info.get('is_strip', False)
             is_plug = dev_info.get('is_plug', False)
-            ctrl = DeviceController(ip, is_strip, is_plug)
+            ctrl = await self.device_pool.acquire(mac, ip, is_strip, is_plug)
 
             # Stocker les informations et le contrôleur
             new_kasa_devices[mac] = {'info': dev_info, 'controller': ctrl, 'ip': ip }
@@ -1159,7 +1383,7 @@ class GreenhouseApp:
             # Si le monitoring n'est pas actif, on essaie d'éteindre toutes les prises par sécurité
             # (On ne le fait pas si le monitoring tourne pour ne pas interférer avec les règles)
             # On le fait ici pendant la découverte pour profiter de la connexion établie
-            if not self.monitoring_active and (is_strip or is_plug):
+            if not self.monitoring_active and (is_strip or is_plug) and mac not in initialized_macs:
                 logging.debug(f"Ajout tâche d'extinction initiale pour {alias} ({mac})")
                 tasks_initial_state.append(ctrl.turn_all_outlets_off())
 
@@ -1179,13 +1403,64 @@ class GreenhouseApp:
                  logging.error(f"Erreur imprévue durant gather pour l'extinction initiale: {e_gather}")
              logging.info("Tâches d'extinction initiale Kasa terminées.")
 
-        # Mettre à jour la liste principale des appareils Kasa
+        # Fermer les sessions des appareils disparus, puis mettre à jour la liste principale
+        await self.device_pool.retain(new_kasa_devices)
         self.kasa_devices = new_kasa_devices
-        logging.info(f"Découverte Kasa terminée: {len(self.kasa_devices)} appareil(s) trouvé(s).")
 
-        # Planifier l'exécution de refresh_device_lists dans le thread principal de Tkinter
-        # Utiliser after(0) ou after(100) pour s'assurer que cela s'exécute après la fin de cette coroutine
-        self.root.after(100, self.refresh_device_lists)
+    def _schedule_kasa_rediscovery(self):
+        """Minuterie Tk: lance une redécouverte incrémentale Kasa en arrière-plan, puis se replanifie."""
+        self.root.after(int(self.kasa_rediscovery_interval * 1000), self._schedule_kasa_rediscovery)
+        if self._kasa_rediscovery_running:
+            return # La précédente n'est pas terminée
+        self._kasa_rediscovery_running = True
+        # Même boucle que la découverte et les commandes: pas de boucle par redécouverte, et
+        # self.kasa_devices / le pool ne sont modifiés que depuis le thread de la boucle Kasa
+        self._run_on_kasa_loop(self._async_rediscover_kasa())
+
+    async def _async_rediscover_kasa(self):
+        """
+        Redécouverte incrémentale: compare la diffusion aux appareils connus et ne met à jour que
+        ce qui a changé. Les contrôleurs et sessions des appareils inchangés sont conservés et
+        aucune prise existante n'est éteinte; l'UI reçoit le delta (apply_kasa_delta).
+        """
+        try:
+            known = {mac: data['info'] for mac, data in self.kasa_devices.items()}
+            delta = await self.kasa_rediscoverer.rediscover(known)
+            if delta.is_empty():
+                logging.debug("Redécouverte Kasa: aucun changement.")
+                return
+
+            devices = dict(self.kasa_devices)
+            for dev_info in delta.added + list(delta.ip_changed.values()):
+                mac, ip = dev_info['mac'], dev_info['ip']
+                # Le pool ne remplace que la session d'un appareil qui a changé d'IP
+                ctrl = await self.device_pool.acquire(mac, ip, dev_info.get('is_strip', False), dev_info.get('is_plug', False))
+                devices[mac] = {'info': dev_info, 'controller': ctrl, 'ip': ip}
+            for mac, dev_info in delta.outlets_changed.items():
+                if mac in devices:
+                    devices[mac] = {**devices[mac], 'info': dev_info}
+            for mac in delta.removed:
+                devices.pop(mac, None)
+            await self.device_pool.retain(devices)
+            self.kasa_devices = devices
+            logging.info(f"Redécouverte Kasa: {len(delta.added)} ajouté(s), {len(delta.removed)} retiré(s), "
+                         f"{len(delta.ip_changed)} IP changée(s), {len(delta.outlets_changed)} liste(s) de prises modifiée(s).")
+
+            # Extinction de sécurité des seuls nouveaux appareils (hors monitoring), comme à la découverte initiale
+            if not self.monitoring_active:
+                tasks = [devices[d['mac']]['controller'].turn_all_outlets_off()
+                         for d in delta.added if d.get('is_strip') or d.get('is_plug')]
+                for res in await asyncio.gather(*tasks, return_exceptions=True):
+                    if isinstance(res, Exception):
+                        logging.error(f"Erreur lors de l'extinction initiale Kasa d'un nouvel appareil: {res}")
+
+            if self.discovery_cache is not None:
+                self.discovery_cache.save([data['info'] for data in devices.values()])
+            self.root.after(0, lambda: self.apply_kasa_delta(delta))
+        except Exception as e:
+            logging.error(f"Erreur pendant la redécouverte Kasa: {e}")
+        finally:
+            self._kasa_rediscovery_running = False
 
     def refresh_device_lists(self):
         """Met à jour les listes internes (available_sensors, etc.) et rafraîchit l'UI."""
@@ -1214,6 +1489,20 @@ class GreenhouseApp:
         logging.debug(f"Capteurs disponibles mis à jour: {self.available_sensors}")
 
         # --- Mise à jour des appareils et prises Kasa disponibles ---
+        self._rebuild_kasa_lists()
+
+        logging.debug(f"Appareils Kasa disponibles mis à jour: {self.available_kasa_strips}")
+        logging.debug(f"Prises Kasa disponibles mises à jour: {self.available_outlets}")
+
+        # --- Rafraîchir l'UI ---
+        # Mettre à jour les listes déroulantes dans les règles existantes
+        self.repopulate_all_rule_dropdowns()
+        # Mettre à jour l'affichage du panneau de statut
+        self.update_status_display()
+        logging.info("Listes de périphériques et UI rafraîchies.")
+
+    def _rebuild_kasa_lists(self):
+        """Reconstruit available_kasa_strips et available_outlets depuis self.kasa_devices."""
         self.available_kasa_strips = [] # Liste [(alias_appareil, mac), ...]
         self.available_outlets = {} # Dict {mac: [(alias_prise, index), ...]}
 
@@ -1239,15 +1528,23 @@ class GreenhouseApp:
             # Stocker les prises pour cet appareil, triées par index
             self.available_outlets[mac] = sorted(outlets_for_device, key=lambda x: x[1])
 
-        logging.debug(f"Appareils Kasa disponibles mis à jour: {self.available_kasa_strips}")
-        logging.debug(f"Prises Kasa disponibles mises à jour: {self.available_outlets}")
-
-        # --- Rafraîchir l'UI ---
-        # Mettre à jour les listes déroulantes dans les règles existantes
-        self.repopulate_all_rule_dropdowns()
-        # Mettre à jour l'affichage du panneau de statut
-        self.update_status_display()
-        logging.info("Listes de périphériques et UI rafraîchies.")
+    def apply_kasa_delta(self, delta):
+        """
+        Répercute dans l'UI le résultat d'une redécouverte incrémentale (DeviceDelta), sans
+        relire les capteurs: un changement d'IP ne touche que le libellé de l'appareil; seuls
+        les ajouts, retraits et changements de prises reconstruisent les listes Kasa.
+        """
+        for mac, dev_info in delta.ip_changed.items():
+            labels = self.status_labels.get(mac)
+            if labels and mac not in delta.outlets_changed:
+                try:
+                    labels['label_name'].config(text=f"{self.get_alias('device', mac)} ({dev_info['ip']}) [{mac}]")
+                except tk.TclError:
+                    pass # Ignorer si détruit
+        if delta.added or delta.removed or delta.outlets_changed:
+            self._rebuild_kasa_lists()
+            self.repopulate_all_rule_dropdowns()
+            self.update_status_display()
 
     # --- Fonctions d'Affichage du Statut ---
     def update_status_display(self):
@@ -1265,11 +1562,10 @@ class GreenhouseApp:
         ttk.Label(self.scrollable_status_frame, text="Capteurs:", font=('Helvetica', 10, 'bold')).grid(row=row_num, column=0, columnspan=4, sticky='w', pady=(5, 2))
         row_num += 1
 
-        # Lire les valeurs actuelles (une seule fois pour l'affichage initial)
-        try: all_temp_values = self.temp_manager.read_all_temperatures()
-        except Exception: all_temp_values = {}
-        try: all_light_values = self.light_manager.read_all_sensors()
-        except Exception: all_light_values = {}
+        # Dernier instantané publié par le service d'acquisition (aucun accès matériel)
+        snapshot = self.sensor_service.latest()
+        all_temp_values = snapshot.temperatures
+        all_light_values = snapshot.lights
 
         # Parcourir les capteurs disponibles (déjà triés par alias dans refresh_device_lists)
         for sensor_alias, sensor_id in self.available_sensors:
@@ -1325,9 +1621,13 @@ class GreenhouseApp:
             device_edit_button = ttk.Button(device_frame, text="✎", width=2,
                                             command=lambda m=mac, n=device_alias: self.edit_alias_dialog('device', m, n))
             device_edit_button.pack(side=tk.LEFT, padx=2)
+            # État de joignabilité (disjoncteur), mis à jour par update_live_status
+            device_health_label = ttk.Label(device_frame, text=self._kasa_health_text(mac))
+            device_health_label.pack(side=tk.LEFT, padx=5)
 
             # Stocker les références (on ne met pas à jour le nom de l'appareil dynamiquement ici)
-            self.status_labels[mac] = {'type': 'device', 'label_name': device_name_label, 'button_edit': device_edit_button}
+            self.status_labels[mac] = {'type': 'device', 'label_name': device_name_label, 'button_edit': device_edit_button,
+                                       'label_value': device_health_label}
             row_num += 1
 
             # Afficher les prises de cet appareil (si disponibles)
@@ -1396,13 +1696,10 @@ class GreenhouseApp:
             return
 
         logging.debug("Mise à jour des valeurs live dans le panneau de statut...")
-        # Récupérer les dernières valeurs lues par le thread de monitoring (supposées à jour)
-        # Note: Ces lectures se font dans le thread principal Tkinter, pas idéal pour la performance
-        # mais plus simple pour l'instant. Pourrait être optimisé en passant les données via queue.
-        try: current_temps = self.temp_manager.read_all_temperatures()
-        except Exception: current_temps = {}
-        try: current_lights = self.light_manager.read_all_sensors()
-        except Exception: current_lights = {}
+        # Dernier instantané publié par le service d'acquisition (le thread Tk ne touche pas au matériel)
+        snapshot = self.sensor_service.latest()
+        current_temps = snapshot.temperatures
+        current_lights = snapshot.lights
 
         # Parcourir les labels stockés
         for item_id, data in self.status_labels.items():
@@ -1425,10 +1722,25 @@ class GreenhouseApp:
                      # Mettre à jour l'état ON/OFF basé sur self.live_kasa_states
                      state_str = self._get_shared_kasa_state(data['mac'], data['index'])
                      data['label_value'].config(text=state_str)
+
+                 elif data['type'] == 'device':
+                     data['label_value'].config(text=self._kasa_health_text(item_id))
              # else: # Le widget a été détruit (ex: suppression règle/appareil)
                  # On pourrait envisager de supprimer l'entrée de self.status_labels ici
                  # mais cela complique la logique si l'élément réapparaît.
 
+    def _kasa_health_text(self, mac):
+        """Texte d'état du disjoncteur d'un appareil Kasa ('' si joignable)."""
+        controller = self.device_pool.get(mac)
+        if controller is None:
+            return ""
+        breaker = controller.breaker
+        if breaker.state == breaker.OPEN:
+            return f"⚠ Injoignable (nouvel essai dans {breaker.retry_in():.0f} s)"
+        if breaker.state == breaker.HALF_OPEN:
+            return "⚠ Injoignable (nouvel essai en cours)"
+        return ""
+
     def _get_shared_kasa_state(self, mac, index):
         """Récupère l'état (ON/OFF/Inconnu) d'une prise depuis la variable partagée."""
         try:
@@ -1508,6 +1820,9 @@ class GreenhouseApp:
         # Utiliser after(0) pour s'assurer que cela s'exécute dans le thread Tkinter principal
         self.root.after(0, self._set_kasa_status_labels_to_stopped)
 
+        # Réveiller la boucle de monitoring (elle peut dormir jusqu'à la prochaine frontière horaire)
+        self._wake_monitoring_loop()
+
         # Attendre que le thread de monitoring se termine (avec un timeout)
         if self.monitoring_thread and self.monitoring_thread.is_alive():
             logging.info("Attente de la fin du thread de monitoring (max 5 secondes)...")
@@ -1612,18 +1927,13 @@ class GreenhouseApp:
 
 
     def _run_monitoring_loop(self):
-        """Point d'entrée pour le thread de monitoring, gère la boucle asyncio."""
+        """Point d'entrée pour le thread de monitoring: exécute la tâche de monitoring sur la boucle Kasa et attend sa fin."""
         try:
-            # Essayer de récupérer/créer une boucle d'événements asyncio pour ce thread
-            try:
-                self.asyncio_loop = asyncio.get_event_loop()
-            except RuntimeError:
-                self.asyncio_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.asyncio_loop)
-
-            logging.info("Boucle d'événements asyncio démarrée pour le monitoring.")
-            # Lancer la tâche principale de monitoring dans la boucle asyncio
-            self.asyncio_loop.run_until_complete(self._async_monitoring_task())
+            # Le monitoring tourne sur la boucle Kasa persistante, où vivent les sessions des contrôleurs;
+            # ce thread attend sa fin (stop_monitoring le rejoint)
+            self.asyncio_loop = self.kasa_loop
+            logging.info("Monitoring lancé sur la boucle d'événements asyncio Kasa.")
+            self._run_on_kasa_loop(self._async_monitoring_task()).result()
 
         except Exception as e:
             # Capturer toute erreur critique dans la boucle asyncio
@@ -1669,26 +1979,24 @@ class GreenhouseApp:
 
         # Mettre à jour l'état partagé
         self.live_kasa_states = new_states
+        self.history.record_outlets(datetime.now().timestamp(), new_states)
         logging.debug(f"[MONITORING] États Kasa live màj: {successful_reads}/{len(tasks)} appareils lus OK.") # DEBUG Log
 
     async def _fetch_one_kasa_state(self, mac, controller):
         """Tâche asynchrone pour lire l'état des prises d'un seul appareil Kasa."""
         try:
-            # Assurer la connexion (peut impliquer une reconnexion si nécessaire)
-            await controller._connect() # Note: Utilisation d'une méthode "privée"
-
-            # Vérifier si la connexion/mise à jour a réussi
-            if controller._device: # Accès à l'attribut "privé"
-                outlet_states = await controller.get_outlet_state()
-                if outlet_states is not None:
-                    states_dict = {
-                        outlet['index']: outlet['is_on']
-                        for outlet in outlet_states
-                        if 'index' in outlet and 'is_on' in outlet
-                    }
-                    return {mac: states_dict}
-                else:
-                    logging.warning(f"[MONITORING] État Kasa None pour {self.get_alias('device', mac)} ({mac}).") # WARNING Log
+            # Session persistante: get_outlet_state ne reconnecte qu'après un échec
+            outlet_states = await controller.get_outlet_state()
+            if outlet_states is not None:
+                states_dict = {
+                    outlet['index']: outlet['is_on']
+                    for outlet in outlet_states
+                    if 'index' in outlet and 'is_on' in outlet
+                }
+                return {mac: states_dict}
+            elif controller.breaker.state != controller.breaker.CLOSED:
+                # Disjoncteur ouvert: échec immédiat, déjà signalé à l'ouverture (et dans le panneau de statut)
+                logging.debug(f"[MONITORING] {self.get_alias('device', mac)} ({mac}) injoignable, nouvel essai dans {controller.breaker.retry_in():.0f} s.")
             else:
                 logging.warning(f"[MONITORING] Échec connexion/màj Kasa pour {self.get_alias('device', mac)} ({mac}).") # WARNING Log
         except Exception as e:
@@ -1700,347 +2008,239 @@ class GreenhouseApp:
     # ****************************************************************
     # *********************** VERSION CORRIGÉE ***********************
     # ****************************************************************
+    def _adopt_sensor_snapshot(self, snapshot):
+        """Adopte les valeurs d'un instantané du service capteurs; retourne True si elles ont changé."""
+        new_values = dict(snapshot.values) # Valeurs valides uniquement (None filtrés par le service)
+        # Capteurs virtuels des conditions 'Agrégat' (ex: 'avg:<capteur>:600'), mis à jour en O(1) par mesure
+        self.aggregates.set_keys(self.rule_engine.sensor_ids())
+        new_values.update(self.aggregates.update(snapshot.timestamp, snapshot.values, snapshot.read_times))
+        changed = new_values != self.monitoring_sensor_values
+        self.monitoring_sensor_values = new_values
+        if changed:
+            logging.debug(f"[MONITORING] Valeurs capteurs (instantané #{snapshot.sequence}): {new_values}")
+        return changed
+
+    async def _poll_sensors_once(self):
+        """Reprend le dernier instantané du service capteurs et retourne True si les valeurs ont changé."""
+        return self._adopt_sensor_snapshot(self.sensor_service.latest())
+
+    def _on_sensor_snapshot(self, snapshot):
+        """Abonné du service capteurs (thread d'acquisition): transmet l'instantané à la boucle de monitoring."""
+        loop = self.asyncio_loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._handle_sensor_snapshot, snapshot)
+
+    def _handle_sensor_snapshot(self, snapshot):
+        if self._adopt_sensor_snapshot(snapshot) and self._monitoring_wakeup is not None:
+            logging.debug("[MONITORING] Changement détecté (capteurs): réveil de l'évaluation.")
+            self._monitoring_wakeup.set()
+
+    async def _poll_kasa_once(self):
+        """Relit l'état des prises Kasa et retourne True si un état a changé."""
+        previous_states = {mac: dict(states) for mac, states in self.live_kasa_states.items()}
+        try:
+            logging.debug(f"[MONITORING] États Kasa avant màj: {previous_states}")
+            await self._update_live_kasa_states_task()
+            logging.debug(f"[MONITORING] États Kasa après màj: {self.live_kasa_states}")
+        except Exception as e:
+            logging.error(f"[MONITORING] Échec màj Kasa: {e}")
+            return False
+        return self.live_kasa_states != previous_states
+
+    async def _periodic_poll_task(self, poll_coro_func, interval, name):
+        """Relance poll_coro_func toutes les 'interval' secondes et réveille la boucle principale si quelque chose a changé."""
+        while self.monitoring_active:
+            await asyncio.sleep(interval)
+            if not self.monitoring_active:
+                break
+            if await poll_coro_func():
+                logging.debug(f"[MONITORING] Changement détecté ({name}): réveil de l'évaluation.")
+                self._monitoring_wakeup.set()
+
+    def _wake_monitoring_loop(self):
+        """Réveille la boucle de monitoring depuis un autre thread (ex: arrêt demandé par l'UI)."""
+        loop = self.asyncio_loop
+        wakeup = self._monitoring_wakeup
+        if loop is not None and wakeup is not None and loop.is_running():
+            loop.call_soon_threadsafe(wakeup.set)
+
     async def _async_monitoring_task(self):
-        """Tâche asynchrone principale qui évalue les règles et contrôle les prises."""
-        # Store more info for active rules: original action needed to maintain state
-        active_until_rules = {} # {rule_id: {'revert_action': 'ON'/'OFF', 'original_action': 'ON'/'OFF'}}
-        last_kasa_update = datetime.min
-        kasa_update_interval = timedelta(seconds=10) # Check Kasa state every 10 seconds
+        """
+        Tâche asynchrone principale qui évalue les règles et contrôle les prises.
+
+        Les instantanés du service capteurs et la tâche d'interrogation Kasa ne
+        réveillent l'évaluation que lorsqu'une valeur a changé. Sans changement, la boucle
+        dort jusqu'au prochain HH:MM:00 référencé par une condition 'Heure'.
+        """
+        # L'état JUSQU'À (règles actives) est conservé par le moteur de règles entre les cycles
+        self.rule_engine.reset_state()
+        monitoring_settings = self.config.get('monitoring') or {}
+        kasa_poll_interval = float(monitoring_settings.get('kasa_poll_interval', 10)) # secondes
+        self._monitoring_wakeup = asyncio.Event()
+        self.monitoring_sensor_values = {}
+        self.aggregates = AggregateTracker(seed=self.history.sensor_window) # Fenêtres reconstruites depuis l'historique
 
         logging.info("Début de la boucle de monitoring principale.")
 
+        # --- 1 & 2. Valeurs capteurs (instantanés publiés par le service d'acquisition) et états Kasa ---
+        await self._poll_sensors_once()
+        self.sensor_service.add_listener(self._on_sensor_snapshot)
+        await self._poll_kasa_once()
+        poll_tasks = [
+            asyncio.ensure_future(self._periodic_poll_task(self._poll_kasa_once, kasa_poll_interval, "Kasa")),
+        ]
+
         while self.monitoring_active:
+            # Effacer avant l'évaluation: un changement pendant le cycle provoquera un nouveau cycle
+            self._monitoring_wakeup.clear()
             now_dt = datetime.now()
             now_time = now_dt.time()
-            logging.debug(f"--- Cycle Mon {now_dt:%Y-%m-%d %H:%M:%S} ---")
+            logging.debug(f"--- Cycle Mon {now_dt:%Y-%m-%d %H:%M:%S.%f} ---")
+            current_sensor_values = self.monitoring_sensor_values
 
-            # --- 1. Lecture des Capteurs ---
-            current_sensor_values = {}
+            # --- 3. Évaluation des Règles ---
+            # Le moteur ne réévalue que les règles dont un capteur ou une fenêtre horaire a changé
+            # (3a: JUSQU'À actifs, 3b: conditions SI, 3c: maintien des règles actives)
+            desired_outlet_states = self.rule_engine.evaluate(current_sensor_values, now_time) # { (mac, index): 'ON'/'OFF' }
+
+            # --- 4 & 5. Application des changements Kasa ---
+            await self._apply_outlet_states(desired_outlet_states)
+
+            # --- 6. Attente du prochain changement (capteur, Kasa, frontière horaire, fin d'un temps de maintien
+            #        ou réévaluation JUSQU'À en attente) ---
+            timeout = self.rule_engine.seconds_until_next_time_change(datetime.now().time())
+            if timeout is not None:
+                timeout += 0.001 # Se réveiller juste après HH:MM:00
+                logging.debug(f"[MONITORING] Prochaine frontière horaire dans {timeout:.3f} s.")
+            dwell_timeout = self.rule_engine.seconds_until_dwell_expiry(monotonic())
+            if dwell_timeout is not None:
+                timeout = dwell_timeout if timeout is None else min(timeout, dwell_timeout)
+            if self.rule_engine.has_pending_evaluation():
+                # Retour JUSQU'À visible ce cycle (voir RuleEngine.evaluate): prise réévaluée au cycle suivant
+                logging.debug(f"[MONITORING] Réévaluation JUSQU'À en attente, prochain cycle dans {PENDING_RETRY_DELAY} s.")
+                timeout = PENDING_RETRY_DELAY if timeout is None else min(timeout, PENDING_RETRY_DELAY)
             try:
-                # Use run_in_executor for potentially blocking I/O
-                temp_values = await self.asyncio_loop.run_in_executor(None, self.temp_manager.read_all_temperatures)
-                light_values = await self.asyncio_loop.run_in_executor(None, self.light_manager.read_all_sensors)
-                # Combine and filter out None values
-                current_sensor_values = {k: v for k, v in {**temp_values, **light_values}.items() if v is not None}
-                logging.debug(f"[MONITORING] Valeurs capteurs lues: {current_sensor_values}")
-            except Exception as e:
-                logging.error(f"[MONITORING] Erreur lecture capteurs: {e}")
+                await asyncio.wait_for(self._monitoring_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass # Frontière horaire atteinte
 
-            # --- 2. Mise à jour des états Kasa ---
-            if now_dt - last_kasa_update >= kasa_update_interval:
-                try:
-                    logging.debug(f"[MONITORING] États Kasa avant màj: {self.live_kasa_states}")
-                    await self._update_live_kasa_states_task()
-                    last_kasa_update = now_dt
-                    logging.debug(f"[MONITORING] États Kasa après màj: {self.live_kasa_states}")
-                except Exception as e:
-                    logging.error(f"[MONITORING] Échec màj Kasa: {e}")
+        # Arrêt des tâches d'interrogation
+        self.sensor_service.remove_listener(self._on_sensor_snapshot)
+        for task in poll_tasks:
+            task.cancel()
+        await asyncio.gather(*poll_tasks, return_exceptions=True)
+        # Les sessions Kasa restent ouvertes (boucle persistante): l'extinction de sécurité les réutilise puis les ferme
 
-            # --- 3. Évaluation des Règles ---
-            desired_outlet_states = {} # { (mac, index): 'ON'/'OFF' } - Reset each cycle
-            rules_to_evaluate = list(self.rules) # Make a copy
-            active_until_copy = dict(active_until_rules) # Copy for safe iteration
-
-            # --- 3a. Évaluation des conditions JUSQU'À actives ---
-            logging.debug(f"[MONITORING] Éval UNTIL - Règles actives: {list(active_until_copy.keys())}")
-            for rule_id, until_info in active_until_copy.items():
-                rule = next((r for r in rules_to_evaluate if r.get('id') == rule_id), None)
-                if not rule:
-                    logging.warning(f"[MONITORING] R{rule_id} (UNTIL): Règle non trouvée. Annulation.")
-                    if rule_id in active_until_rules: del active_until_rules[rule_id]
-                    continue
-
-                mac = rule.get('target_device_mac')
-                idx = rule.get('target_outlet_index')
-                if mac is None or idx is None:
-                    logging.warning(f"[MONITORING] R{rule_id} (UNTIL): Cible invalide. Annulation.")
-                    if rule_id in active_until_rules: del active_until_rules[rule_id]
-                    continue
+        logging.info("Sortie de la boucle de monitoring principale.")
 
-                outlet_key = (mac, idx)
-                until_logic = rule.get('until_logic', 'OU')
-                until_conditions = rule.get('until_conditions', [])
+    async def _apply_outlet_states(self, desired_outlet_states):
+        """Étapes 4 et 5 du monitoring: envoie les commandes Kasa nécessaires pour atteindre les états désirés."""
+        # --- 4. Application des changements Kasa ---
+        logging.debug(f"[MONITORING] États Kasa désirés finaux pour ce cycle: {desired_outlet_states}")
+        # Changements regroupés par appareil: {mac: {index: bool}} (une seule connexion/vérification par appareil)
+        batches_by_mac = {}
+
+        # Determine all outlets managed by ANY rule
+        all_managed_outlets = self.rule_engine.managed_outlets()
+        logging.debug(f"[MONITORING] Prises gérées par les règles: {all_managed_outlets}")
+
+        # Iterate through all *managed* outlets to determine necessary actions
+        for mac, idx in all_managed_outlets:
+            outlet_key = (mac, idx)
+            # Get the desired state for this outlet based on rule evaluations this cycle
+            desired_state = desired_outlet_states.get(outlet_key) # Will be 'ON', 'OFF', or None if no rule dictated a state this cycle
+            # Get the last known actual state
+            current_live_state = self.live_kasa_states.get(mac, {}).get(idx) # Will be True, False, or None
+
+            # Rule wants ON/OFF but the outlet is in the other (or unknown) state, or
+            # no rule explicitly wants it this cycle and it's currently ON -> implicit OFF
+            command = outlet_command(desired_state, current_live_state)
+            action_needed = command is not None
+            if action_needed:
+                target_state_bool, implicit_off = command
+                if implicit_off:
+                    logging.info(f"[ACTION KASA] Implicite: {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)} -> OFF (non désirée explicitement ce cycle)")
 
-                if not until_conditions: # Should not happen if rule entered active_until
-                    logging.debug(f"[MONITORING] R{rule_id} (UNTIL): Aucune condition. Désactivation.")
-                    if rule_id in active_until_rules: del active_until_rules[rule_id]
+            if action_needed:
+                # Temps de maintien minimum (anti-cyclage): la commande attendra la fin du délai
+                dwell_remaining = self.rule_engine.check_dwell(outlet_key, target_state_bool, monotonic())
+                if dwell_remaining > 0:
+                    logging.debug(f"[MONITORING] {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)}: commande retardée de {dwell_remaining:.0f} s (temps de maintien).")
                     continue
-
-                # Check the UNTIL condition using the helper function
-                until_condition_met = self._evaluate_logic_group(until_conditions, until_logic, current_sensor_values, now_time, rule_id, "UNTIL")
-
-                if until_condition_met:
-                    revert_action = until_info['revert_action']
-                    condition_that_met_until = "Condition(s) UNTIL" # Simplified log
-                    logging.info(f"[MONITORING] R{rule_id}: Condition JUSQU'À ({until_logic}) REMPLIE (par {condition_that_met_until}). Action retour: {revert_action}.")
-                    # Set desired state to revert action, potentially overriding SI from this cycle
-                    desired_outlet_states[outlet_key] = revert_action
-                    if rule_id in active_until_rules: # Remove from active list
-                        del active_until_rules[rule_id]
-                # else: UNTIL condition not met, rule remains active, state will be handled in 3c
-
-            # --- 3b. Évaluation des conditions SI ---
-            logging.debug(f"[MONITORING] Éval SI - Règles à évaluer: {len(rules_to_evaluate)}")
-            for rule in rules_to_evaluate:
-                rule_id = rule.get('id')
-                mac = rule.get('target_device_mac')
-                idx = rule.get('target_outlet_index')
-                action = rule.get('action')
-
-                if not rule_id or mac is None or idx is None or not action:
-                    continue # Skip invalid rules
-
-                outlet_key = (mac, idx)
-
-                # Skip SI evaluation if the rule is currently waiting for UNTIL
-                if rule_id in active_until_rules:
-                    logging.debug(f"[MONITORING] R{rule_id}: Éval SI skip (règle en attente UNTIL).")
+                breaker = self.kasa_devices[mac]['controller'].breaker if mac in self.kasa_devices else None
+                if breaker is not None and breaker.state != breaker.CLOSED:
+                    # Appareil injoignable (disjoncteur ouvert): pas de commande ni de mise à jour optimiste,
+                    # la commande partira au premier cycle après son retour (sondé par l'interrogation Kasa)
+                    logging.debug(f"[MONITORING] {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)}: commande ignorée, appareil injoignable.")
                     continue
-
-                # Skip SI evaluation if the state was already set by an UNTIL condition *this cycle*
-                # This prevents an SI condition from immediately overriding its own UNTIL's revert action
-                if outlet_key in desired_outlet_states:
-                     logging.debug(f"[MONITORING] R{rule_id}: Éval SI skip (état déjà fixé par UNTIL pour {outlet_key} ce cycle).")
-                     continue
-
-                trigger_logic = rule.get('trigger_logic', 'ET')
-                trigger_conditions = rule.get('conditions', [])
-
-                if not trigger_conditions:
-                    continue # Skip rules without trigger conditions
-
-                # Check the SI condition using the helper function
-                trigger_condition_met = self._evaluate_logic_group(trigger_conditions, trigger_logic, current_sensor_values, now_time, rule_id, "SI")
-
-                if trigger_condition_met:
-                    condition_that_met_trigger = "Condition(s) SI" # Simplified log
-                    logging.info(f"[MONITORING] R{rule_id}: Condition SI ({trigger_logic}) REMPLIE (par {condition_that_met_trigger}). Action désirée: {action}.")
-                    # Set desired state ONLY if not already set by UNTIL this cycle (already checked above)
-                    desired_outlet_states[outlet_key] = action
-
-                    # Check if this rule has an UNTIL condition to activate
-                    if rule.get('until_conditions'):
-                        revert_action = 'OFF' if action == 'ON' else 'ON'
-                        logging.info(f"[MONITORING] R{rule_id}: Activation JUSQU'À ({rule.get('until_logic','OU')}). Action retour: {revert_action}.")
-                        # Store both original action and revert action
-                        active_until_rules[rule_id] = {'revert_action': revert_action, 'original_action': action}
-
-            # --- 3c. Maintenir l'état des règles actives (UNTIL non remplie) ---
-            # This step ensures that rules waiting for UNTIL keep their outlets in the desired state
-            logging.debug(f"[MONITORING] Maintien états actifs - Règles: {list(active_until_rules.keys())}")
-            for rule_id, until_info in active_until_rules.items():
-                 rule = next((r for r in rules_to_evaluate if r.get('id') == rule_id), None)
-                 if not rule: continue # Should have been caught earlier
-
-                 mac = rule.get('target_device_mac')
-                 idx = rule.get('target_outlet_index')
-                 if mac is None or idx is None: continue
-
-                 outlet_key = (mac, idx)
-                 original_action = until_info['original_action']
-
-                 # If the state wasn't set by its own UNTIL condition being met this cycle,
-                 # maintain the original action state. This prevents the implicit OFF.
-                 if outlet_key not in desired_outlet_states:
-                     logging.debug(f"[MONITORING] R{rule_id}: Maintien état actif {original_action} pour {outlet_key}")
-                     desired_outlet_states[outlet_key] = original_action
-                 # else: State was already set (likely by its UNTIL being met), do nothing here.
-
-
-            # --- 4. Application des changements Kasa ---
-            logging.debug(f"[MONITORING] États Kasa désirés finaux pour ce cycle: {desired_outlet_states}")
-            tasks_to_run = []
-
-            # Determine all outlets managed by ANY rule
-            all_managed_outlets = set(
-                (r.get('target_device_mac'), r.get('target_outlet_index'))
-                for r in rules_to_evaluate
-                if r.get('target_device_mac') is not None and r.get('target_outlet_index') is not None
-            )
-            logging.debug(f"[MONITORING] Prises gérées par les règles: {all_managed_outlets}")
-
-            # Iterate through all *managed* outlets to determine necessary actions
-            for mac, idx in all_managed_outlets:
-                outlet_key = (mac, idx)
-                # Get the desired state for this outlet based on rule evaluations this cycle
-                desired_state = desired_outlet_states.get(outlet_key) # Will be 'ON', 'OFF', or None if no rule dictated a state this cycle
-                # Get the last known actual state
-                current_live_state = self.live_kasa_states.get(mac, {}).get(idx) # Will be True, False, or None
-
-                action_needed = False
-                kasa_function_name = None
-                target_state_bool = None # For optimistic update
-
-                if desired_state == 'ON' and current_live_state is not True:
-                    # Rule wants ON, but it's OFF or Unknown
-                    action_needed = True
-                    kasa_function_name = 'turn_outlet_on'
-                    target_state_bool = True
-                elif desired_state == 'OFF' and current_live_state is not False:
-                    # Rule wants OFF, but it's ON or Unknown
-                    action_needed = True
-                    kasa_function_name = 'turn_outlet_off'
-                    target_state_bool = False
-                elif desired_state is None and current_live_state is True:
-                     # If no rule explicitly wants it ON or OFF this cycle, and it's currently ON,
-                     # turn it OFF. This is the corrected implicit OFF logic.
-                    action_needed = True
-                    kasa_function_name = 'turn_outlet_off'
-                    target_state_bool = False
-                    logging.info(f"[ACTION KASA] Implicite: {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)} -> OFF (non désirée explicitement ce cycle)")
-
-                if action_needed:
-                    if mac in self.kasa_devices:
-                        controller = self.kasa_devices[mac]['controller']
-                        # Log the action being taken
-                        log_state = desired_state if desired_state else 'OFF (Implicit)'
-                        logging.info(f"[ACTION KASA] {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)} -> {log_state} (État live avant: {current_live_state})")
-                        tasks_to_run.append(getattr(controller, kasa_function_name)(idx))
-                        # Optimistic update of live state immediately
-                        self.live_kasa_states.setdefault(mac, {})[idx] = target_state_bool
-                    else:
-                        logging.error(f"[ACTION KASA] Erreur: Appareil Kasa {mac} non trouvé pour action.")
+                if mac in self.kasa_devices:
+                    # Log the action being taken
+                    log_state = desired_state if desired_state else 'OFF (Implicit)'
+                    logging.info(f"[ACTION KASA] {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)} -> {log_state} (État live avant: {current_live_state})")
+                    batches_by_mac.setdefault(mac, {})[idx] = target_state_bool
+                    # Optimistic update of live state immediately
+                    self.live_kasa_states.setdefault(mac, {})[idx] = target_state_bool
+                    self.rule_engine.record_switch(outlet_key, target_state_bool, monotonic())
+                else:
+                    logging.error(f"[ACTION KASA] Erreur: Appareil Kasa {mac} non trouvé pour action.")
 
 
-            # --- 5. Exécuter les tâches Kasa ---
-            if tasks_to_run:
-                logging.debug(f"[MONITORING] Exécution de {len(tasks_to_run)} tâches Kasa...")
-                try:
-                    results = await asyncio.gather(*tasks_to_run, return_exceptions=True)
-                    for i, res in enumerate(results):
-                        if isinstance(res, Exception):
-                            # Attempt to find which task failed (more complex, maybe add later)
-                            logging.error(f"[MONITORING] Erreur tâche Kasa (index {i}): {res}")
-                except Exception as e_gather:
-                    logging.error(f"[MONITORING] Erreur gather Kasa: {e_gather}")
-                logging.debug("[MONITORING] Tâches Kasa du cycle terminées.")
-
-            # --- 6. Attente avant le prochain cycle ---
-            await asyncio.sleep(2) # Wait 2 seconds before the next cycle
+        # --- 5. Exécuter les lots Kasa (un par appareil, en parallèle entre appareils) ---
+        if batches_by_mac:
+            macs = list(batches_by_mac)
+            logging.debug(f"[MONITORING] Exécution de {sum(len(b) for b in batches_by_mac.values())} commandes Kasa sur {len(macs)} appareil(s)...")
+            try:
+                results = await asyncio.gather(
+                    *(self.kasa_devices[mac]['controller'].set_outlet_states(batches_by_mac[mac]) for mac in macs),
+                    return_exceptions=True)
+                applied = {} # Commandes confirmées, pour l'historique des prises
+                for mac, res in zip(macs, results):
+                    if isinstance(res, Exception):
+                        logging.error(f"[MONITORING] Erreur lot Kasa pour {self.get_alias('device', mac)}: {res}")
+                        continue
+                    for idx, ok in res.items():
+                        if ok:
+                            applied.setdefault(mac, {})[idx] = batches_by_mac[mac][idx]
+                        else:
+                            logging.error(f"[MONITORING] Échec commande Kasa: {self.get_alias('device', mac)} / {self.get_alias('outlet', mac, idx)}")
+                self.history.record_outlets(datetime.now().timestamp(), applied)
+            except Exception as e_gather:
+                logging.error(f"[MONITORING] Erreur gather Kasa: {e_gather}")
+            logging.debug("[MONITORING] Tâches Kasa du cycle terminées.")
 
-        logging.info("Sortie de la boucle de monitoring principale.")
     # ****************************************************************
     # ********************* FIN VERSION CORRIGÉE *********************
     # ****************************************************************
 
     # --- Helper function to evaluate a list of conditions based on logic (ET/OU) ---
     def _evaluate_logic_group(self, conditions, logic, current_sensor_values, current_time_obj, rule_id_log, group_type_log):
-        """Evaluates a list of conditions based on ET/OU logic."""
-        if not conditions:
-            # If logic is ET, no conditions means False. If OU, no conditions means False.
-            # An empty condition group never evaluates to True.
-            return False
-
-        if logic == 'ET':
-            all_true = True
-            for cond in conditions:
-                cond_result = self._check_condition(cond, current_sensor_values, current_time_obj)
-                if not cond_result:
-                    all_true = False
-                    logging.debug(f"[MONITORING] R{rule_id_log} {group_type_log}(ET) échoue sur CondID:{cond.get('condition_id','N/A')}")
-                    break # No need to check further for ET
-            return all_true
-        elif logic == 'OU':
-            any_true = False
-            for cond in conditions:
-                cond_result = self._check_condition(cond, current_sensor_values, current_time_obj)
-                if cond_result:
-                    any_true = True
-                    logging.debug(f"[MONITORING] R{rule_id_log} {group_type_log}(OU) réussit sur CondID:{cond.get('condition_id','N/A')}")
-                    break # No need to check further for OU
-            return any_true
-        else:
-            logging.error(f"[MONITORING] R{rule_id_log}: Logique {group_type_log} inconnue '{logic}'.")
-            return False
-
+        """Evaluates a list of conditions (dicts or compiled conditions) based on ET/OU logic."""
+        # Le monitoring passe par self.rule_engine (groupes déjà compilés); ceci compile à la volée
+        group = compile_group(conditions, logic, rule_id_log, group_type_log)
+        return group.evaluate(current_sensor_values, seconds_of_day(current_time_obj), rule_id_log, group_type_log)
 
     # --- Fonction de Vérification de Condition ---
-    # Add DEBUG logs inside _check_condition as well
     def _check_condition(self, condition_data, current_sensor_values, current_time_obj):
-        """Évalue une condition unique (Capteur ou Heure)."""
-        cond_type = condition_data.get('type')
-        operator = condition_data.get('operator')
-        cond_id_log = condition_data.get('condition_id', 'N/A')
-
-        if not cond_type or not operator:
-            logging.warning(f"[COND CHECK] Cond invalide (ID:{cond_id_log}): manque type/op - {condition_data}") # WARNING Log
-            return False
-
-        try:
-            if cond_type == 'Capteur':
-                sensor_id = condition_data.get('id')
-                threshold = condition_data.get('threshold')
-
-                if sensor_id is None or threshold is None or operator not in SENSOR_OPERATORS:
-                    logging.warning(f"[COND CHECK] Cond Capteur invalide (ID:{cond_id_log}): {condition_data}") # WARNING Log
-                    return False
-
-                if sensor_id not in current_sensor_values:
-                    logging.debug(f"[COND CHECK] (ID:{cond_id_log}): Valeur manquante pour capteur {self.get_alias('sensor', sensor_id)} ({sensor_id})") # DEBUG Log
-                    return False
-
-                current_value = current_sensor_values[sensor_id]
-                # *** DEBUG PRINT: Show sensor condition check ***
-                logging.debug(f"[COND CHECK] Eval Capteur (ID:{cond_id_log}): '{self.get_alias('sensor', sensor_id)}' ({current_value}) {operator} {threshold} ?") # DEBUG Log
-                result = self._compare(current_value, operator, float(threshold))
-                logging.debug(f"[COND CHECK] -> Résultat (ID:{cond_id_log}): {result}") # DEBUG Log
-                return result
-
-            elif cond_type == 'Heure':
-                time_str = condition_data.get('value')
-
-                if not time_str or operator not in TIME_OPERATORS:
-                    logging.warning(f"[COND CHECK] Cond Heure invalide (ID:{cond_id_log}): {condition_data}") # WARNING Log
-                    return False
-                try:
-                    target_time = datetime.strptime(time_str, '%H:%M').time()
-                except ValueError:
-                    logging.error(f"[COND CHECK] Format heure invalide (ID:{cond_id_log}): '{time_str}'") # ERROR Log
-                    return False
-
-                # *** DEBUG PRINT: Show time condition check ***
-                logging.debug(f"[COND CHECK] Eval Heure (ID:{cond_id_log}): {current_time_obj:%H:%M:%S} {operator} {target_time:%H:%M} ?") # DEBUG Log
-                if operator == '<': result = current_time_obj < target_time
-                elif operator == '>': result = current_time_obj > target_time
-                elif operator == '<=': result = current_time_obj <= target_time
-                elif operator == '>=': result = current_time_obj >= target_time
-                else:
-                    # Compare only hour and minute for '=' and '!='
-                    current_minutes = current_time_obj.hour * 60 + current_time_obj.minute
-                    target_minutes = target_time.hour * 60 + target_time.minute
-                    if operator == '=': result = current_minutes == target_minutes
-                    elif operator == '!=': result = current_minutes != target_minutes
-                    else: result = False # Should not happen due to validation
-
-                logging.debug(f"[COND CHECK] -> Résultat (ID:{cond_id_log}): {result}") # DEBUG Log
-                return result
-            else:
-                logging.error(f"[COND CHECK] Type cond inconnu (ID:{cond_id_log}): {cond_type}") # ERROR Log
+        """Évalue une condition unique (Capteur ou Heure), sous forme de dict ou déjà compilée."""
+        if callable(condition_data):
+            condition = condition_data
+        else:
+            try:
+                condition = compile_condition(condition_data)
+            except ValueError as e:
+                logging.warning(f"[COND CHECK] Cond invalide (ID:{condition_data.get('condition_id', 'N/A')}): {e} - {condition_data}") # WARNING Log
                 return False
-        except ValueError as e:
-            logging.error(f"[COND CHECK] Erreur valeur (ID:{cond_id_log}) - {condition_data}: {e}") # ERROR Log
-            return False
-        except Exception as e:
-            logging.error(f"[COND CHECK] Erreur eval cond (ID:{cond_id_log}) - {condition_data}: {e}", exc_info=True) # ERROR Log
-            return False
+        return condition(current_sensor_values, seconds_of_day(current_time_obj))
 
     # --- Fonction de Comparaison Numérique ---
     def _compare(self, value1, operator, value2):
         """Effectue une comparaison numérique entre deux valeurs."""
+        compare = SENSOR_OPERATOR_FUNCS.get(operator)
+        if compare is None:
+            logging.warning(f"Opérateur comparaison numérique inconnu: {operator}") # WARNING Log
+            return False
         try:
-            v1 = float(value1)
-            v2 = float(value2)
-            # logging.debug(f"Comparaison Numérique: {v1} {operator} {v2}") # Keep this commented unless very detailed debug needed
-
-            if operator == '<': return v1 < v2
-            elif operator == '>': return v1 > v2
-            elif operator == '=': return abs(v1 - v2) < 1e-9 # Use tolerance for float equality
-            elif operator == '!=': return abs(v1 - v2) >= 1e-9
-            elif operator == '<=': return v1 <= v2
-            elif operator == '>=': return v1 >= v2
-            else:
-                logging.warning(f"Opérateur comparaison numérique inconnu: {operator}") # WARNING Log
-                return False
+            return compare(float(value1), float(value2))
         except (ValueError, TypeError) as e:
             logging.error(f"Erreur comp num: impossible de convertir '{value1}' ou '{value2}'. Op: {operator}. Err: {e}") # ERROR Log
             return False
@@ -2050,20 +2250,8 @@ class GreenhouseApp:
         """Lance l'extinction de toutes les prises Kasa dans une boucle asyncio."""
         logging.info("Tentative d'extinction sécurisée de toutes les prises Kasa...") # INFO Log
         try:
-            # Essayer d'obtenir/créer une boucle asyncio et exécuter la tâche d'extinction
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                     # If a loop is running (likely the monitoring one if stopped abruptly), run in threadsafe manner
-                     future = asyncio.run_coroutine_threadsafe(self._async_turn_off_all(), loop)
-                     future.result(timeout=15) # Wait for completion with timeout
-                else:
-                     # If no loop is running, run until complete
-                     loop.run_until_complete(self._async_turn_off_all())
-            except RuntimeError:
-                # If get_event_loop fails (no loop set for this thread), use asyncio.run
-                logging.info("Aucune boucle asyncio existante, utilisation de asyncio.run pour l'extinction.") # INFO Log
-                asyncio.run(self._async_turn_off_all())
+            # Sur la boucle Kasa persistante (sessions du pool), en attendant la fin avec un timeout
+            self._run_on_kasa_loop(self._async_turn_off_all()).result(timeout=15)
         except asyncio.TimeoutError:
              logging.error("Timeout dépassé lors de l'attente de l'extinction des prises Kasa.") # ERROR Log
         except Exception as e:
@@ -2112,6 +2300,7 @@ class GreenhouseApp:
 
 
             logging.info(f"Extinction Kasa terminée. Tâches complétées: {success_count}, Échecs: {failure_count}.") # INFO Log
+            await self.device_pool.close_all()
         else:
             logging.info("Aucun appareil Kasa de type prise/multiprise trouvé à éteindre.") # INFO Log
 
@@ -2130,6 +2319,7 @@ class GreenhouseApp:
                      logging.error(f"Erreur on_rule_change avant save pour règle {rule_id}: {e}") # ERROR Log
 
         config_to_save = {
+            **self.config, # Conserver les autres sections (ex: 'monitoring')
             "aliases": self.aliases,
             "rules": self.rules # self.rules should now be up-to-date
         }
@@ -2149,6 +2339,10 @@ class GreenhouseApp:
                                   parent=self.root):
                 logging.info("Arrêt monitoring & fermeture demandés...") # INFO Log
                 self.stop_monitoring()
+                self.w1_watcher.stop()
+                self.sensor_service.stop()
+                if self.disk_history is not None:
+                    self.disk_history.close() # Écrire le dernier lot de mesures
                 # Allow some time for stop_monitoring tasks (like Kasa shutdown) to initiate
                 logging.info("Fermeture app dans 1 sec...") # INFO Log
                 self.root.after(1000, self.root.destroy)
@@ -2160,6 +2354,10 @@ class GreenhouseApp:
                                   "Êtes-vous sûr de vouloir quitter ?",
                                   parent=self.root):
                 logging.info("Fermeture demandée (monitoring inactif)...") # INFO Log
+                self.w1_watcher.stop()
+                self.sensor_service.stop()
+                if self.disk_history is not None:
+                    self.disk_history.close() # Écrire le dernier lot de mesures
                 # Attempt safe shutdown even if monitoring wasn't active
                 logging.info("Lancement extinction Kasa...") # INFO Log
                 threading.Thread(target=self._turn_off_all_kasa_safely, daemon=True).start()
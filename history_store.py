@@ -0,0 +1,375 @@
+# history_store.py
+# -----------------------------------------------------------
+# Historique des capteurs sur disque: fichiers à enregistrements fixes,
+# projetés en mémoire (mmap) et gérés en anneau, avec trois niveaux:
+#   - 'raw'  : chaque mesure (≈2 s) sur 48 h
+#   - 'min'  : min/max/moyenne par minute sur 90 jours
+#   - 'hour' : min/max/moyenne par heure sur 10 ans
+# Les agrégats sont calculés au fil de l'eau (sans relecture); les
+# enregistrements sont accumulés en mémoire puis écrits par lots, à la
+# suite dans chaque anneau, pour limiter l'usure de la carte SD.
+# La lecture se fait directement dans les fichiers projetés (pas de parsing).
+# -----------------------------------------------------------
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# En-tête de 64 octets: signature, version, taille d'enregistrement, capacité, prochain indice d'écriture, nombre d'enregistrements
+_MAGIC = b'SERREHST'
+_VERSION = 1
+_HEADER = struct.Struct('<8sHHIQQ')
+_HEADER_SIZE = 64
+# Enregistrements: mesure brute (horodatage, valeur) et agrégat (début du créneau, min, max, moyenne, nombre de mesures)
+RAW_RECORD = struct.Struct('<df')
+ROLLUP_RECORD = struct.Struct('<dfffI')
+if NUMPY_AVAILABLE:
+    RAW_DTYPE = np.dtype([('timestamp', '<f8'), ('value', '<f4')])
+    ROLLUP_DTYPE = np.dtype([('timestamp', '<f8'), ('min', '<f4'), ('max', '<f4'), ('mean', '<f4'), ('count', '<u4')])
+
+class Tier(NamedTuple):
+    name: str
+    bucket: int # Durée d'un créneau d'agrégation (s), 0 = mesures brutes
+    retention: int # Durée conservée (s)
+
+TIERS = (Tier('raw', 0, 48 * 3600),
+         Tier('min', 60, 90 * 86400),
+         Tier('hour', 3600, 10 * 365 * 86400))
+DEFAULT_FLUSH_INTERVAL = 60.0 # s entre deux écritures sur disque
+
+class RingFile:
+    """Fichier d'enregistrements de taille fixe projeté en mémoire et écrit en anneau."""
+    def __init__(self, path, record: struct.Struct, capacity: int):
+        self.path = Path(path)
+        self.record = record
+        size = _HEADER_SIZE + record.size * capacity
+        existing = self._read_header() if self.path.exists() else None
+        if existing is not None and existing[2] != record.size:
+            logging.warning(f"Historique {self.path.name}: format incompatible, fichier recréé.")
+            os.replace(self.path, self.path.with_suffix(self.path.suffix + '.old'))
+            existing = None
+        if existing is not None:
+            capacity = existing[3] # La capacité d'un fichier existant est conservée
+            size = _HEADER_SIZE + record.size * capacity
+        self.capacity = capacity
+        with open(self.path, 'a+b') as f:
+            if f.seek(0, os.SEEK_END) < size:
+                f.truncate(size) # Fichier creux: l'espace est alloué au fil des écritures
+        self._file = open(self.path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        if existing is None:
+            self.head, self.count = 0, 0
+            self._write_header()
+        else:
+            self.head, self.count = existing[4], existing[5]
+
+    def _read_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                fields = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return None
+        return fields if fields[0] == _MAGIC and fields[1] == _VERSION else None
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, self.record.size, self.capacity, self.head, self.count)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append_many(self, records: list):
+        """Écrit un lot d'enregistrements (tuples) à la suite, en deux tranches au plus."""
+        if not records:
+            return
+        records = records[-self.capacity:]
+        data = b''.join(self.record.pack(*r) for r in records)
+        first = min(len(records), self.capacity - self.head)
+        offset = _HEADER_SIZE + self.head * self.record.size
+        self._mm[offset:offset + first * self.record.size] = data[:first * self.record.size]
+        if first < len(records):
+            rest = data[first * self.record.size:]
+            self._mm[_HEADER_SIZE:_HEADER_SIZE + len(rest)] = rest
+        self.head = (self.head + len(records)) % self.capacity
+        self.count = min(self.capacity, self.count + len(records))
+        self._write_header()
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
+
+    def _offset(self, index: int) -> int:
+        """Position (octets) de l'enregistrement logique `index` (0 = le plus ancien)."""
+        return _HEADER_SIZE + ((self.head - self.count + index) % self.capacity) * self.record.size
+
+    def timestamp_at(self, index: int) -> float:
+        return struct.unpack_from('<d', self._mm, self._offset(index))[0]
+
+    def last(self):
+        return self.record.unpack_from(self._mm, self._offset(self.count - 1)) if self.count else None
+
+    def bisect(self, timestamp: float) -> int:
+        """Premier indice logique dont l'horodatage est >= timestamp."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def raw_range(self, first: int, last: int) -> bytes:
+        """Octets des enregistrements logiques [first, last)."""
+        if first >= last:
+            return b''
+        start = self._offset(first)
+        end = start + (last - first) * self.record.size
+        limit = _HEADER_SIZE + self.capacity * self.record.size
+        if end <= limit:
+            return self._mm[start:end]
+        return self._mm[start:limit] + self._mm[_HEADER_SIZE:_HEADER_SIZE + end - limit]
+
+class _Rollup:
+    """Agrégat incrémental d'un créneau: min, max, somme et nombre de mesures."""
+    __slots__ = ('bucket', 'start', 'min', 'max', 'total', 'count')
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.start = None
+        self.count = 0
+
+    def add(self, timestamp, low, high, total, count):
+        """Ajoute une mesure (ou un agrégat); retourne l'enregistrement du créneau précédent s'il vient de se terminer."""
+        start = math.floor(timestamp / self.bucket) * self.bucket
+        finished = None
+        if self.start is not None and start != self.start:
+            finished = self.record()
+            self.count = 0
+        if self.count == 0:
+            self.start, self.min, self.max, self.total, self.count = start, low, high, total, count
+        else:
+            self.min, self.max = min(self.min, low), max(self.max, high)
+            self.total += total
+            self.count += count
+        return finished
+
+    def record(self):
+        return (float(self.start), self.min, self.max, self.total / self.count, self.count)
+
+class SensorHistory:
+    """Les trois anneaux d'un capteur et ses agrégats en cours."""
+    def __init__(self, directory: Path, sensor_id: str, sample_interval: float):
+        self.sensor_id = sensor_id
+        self.files = {}
+        for tier in TIERS:
+            record = RAW_RECORD if tier.bucket == 0 else ROLLUP_RECORD
+            capacity = math.ceil(tier.retention / (tier.bucket or sample_interval))
+            self.files[tier.name] = RingFile(directory / f"{sensor_id}.{tier.name}", record, capacity)
+        self.pending = {tier.name: [] for tier in TIERS} # Enregistrements en attente d'écriture
+        self.rollups = {tier.name: _Rollup(tier.bucket) for tier in TIERS if tier.bucket}
+        last = self.files[TIERS[0].name].last()
+        self.last_timestamp = last[0] if last is not None else -math.inf # Dernière mesure brute enregistrée
+        self._resume()
+
+    def _resume(self):
+        """Reconstruit les créneaux en cours à partir de la fin du niveau inférieur (après un redémarrage)."""
+        for lower, tier in zip(TIERS, TIERS[1:]):
+            ring = self.files[lower.name]
+            last = ring.last()
+            if last is None:
+                continue
+            first = ring.bisect(math.floor(last[0] / tier.bucket) * tier.bucket)
+            data = ring.raw_range(first, len(ring))
+            for record in ring.record.iter_unpack(data):
+                self._feed(tier.name, record, emit=False)
+
+    def _feed(self, tier_name, record, emit=True):
+        if len(record) == 2: # Mesure brute
+            timestamp, value = record
+            finished = self.rollups[tier_name].add(timestamp, value, value, value, 1)
+        else:
+            timestamp, low, high, mean, count = record
+            finished = self.rollups[tier_name].add(timestamp, low, high, mean * count, count)
+        if finished is not None and emit:
+            self.pending[tier_name].append(finished)
+            index = [t.name for t in TIERS].index(tier_name)
+            if index + 1 < len(TIERS):
+                self._feed(TIERS[index + 1].name, finished)
+
+    def add(self, timestamp: float, value: float):
+        self.last_timestamp = timestamp
+        sample = (timestamp, value)
+        self.pending['raw'].append(sample)
+        self._feed(TIERS[1].name, sample)
+
+    def flush(self):
+        for name, records in self.pending.items():
+            if records:
+                self.files[name].append_many(records)
+                self.pending[name] = []
+                self.files[name].flush()
+
+    def close(self):
+        self.flush()
+        for ring in self.files.values():
+            ring.close()
+
+class DiskHistory:
+    """
+    Historique persistant de tous les capteurs (un répertoire, trois fichiers par capteur).
+    Les mesures sont reçues depuis le thread d'acquisition et écrites toutes les `flush_interval` secondes.
+    """
+    def __init__(self, directory, sample_interval: float = 2.0, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        if sample_interval <= 0 or flush_interval < 0:
+            raise ValueError(f"Intervalles d'historique invalides: mesure {sample_interval} s, écriture {flush_interval} s")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sample_interval = float(sample_interval)
+        self.flush_interval = float(flush_interval)
+        self._series = {} # {sensor_id: SensorHistory}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _get(self, sensor_id) -> SensorHistory | None:
+        series = self._series.get(sensor_id)
+        if series is None:
+            try:
+                series = self._series[sensor_id] = SensorHistory(self.directory, str(sensor_id), self.sample_interval)
+            except (OSError, ValueError) as e:
+                logging.error(f"Historique disque indisponible pour {sensor_id}: {e}")
+                return None
+        return series
+
+    def record_sensors(self, timestamp: float, values, read_times=None):
+        """
+        Ajoute une mesure par capteur ({sensor_id: valeur}, valeurs None ignorées) et écrit le lot si l'intervalle est écoulé.
+
+        read_times: {sensor_id: instant de la mesure} optionnel (SensorSnapshot.read_times). Chaque mesure est
+        horodatée à sa lecture; une mesure pas plus récente que la dernière enregistrée (valeur en cache
+        d'une sonde à intervalle de lecture) est ignorée: elle fausserait les agrégats et userait la carte SD.
+        """
+        with self._lock:
+            for sensor_id, value in values.items():
+                if value is None:
+                    continue
+                series = self._get(sensor_id)
+                if series is None:
+                    continue
+                read_time = read_times.get(sensor_id, timestamp) if read_times else timestamp
+                if read_time <= series.last_timestamp:
+                    continue
+                series.add(read_time, value)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def on_sensor_snapshot(self, snapshot):
+        """Abonné du service capteurs (SensorAcquisitionService.add_listener)."""
+        self.record_sensors(snapshot.timestamp, snapshot.values, snapshot.read_times)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        for series in self._series.values():
+            try:
+                series.flush()
+            except (OSError, ValueError) as e:
+                logging.error(f"Erreur d'écriture de l'historique de {series.sensor_id}: {e}")
+
+    def close(self):
+        with self._lock:
+            for series in self._series.values():
+                try:
+                    series.close()
+                except (OSError, ValueError) as e:
+                    logging.error(f"Erreur de fermeture de l'historique de {series.sensor_id}: {e}")
+            self._series = {}
+
+    def sensor_ids(self) -> list:
+        """Capteurs ayant un historique sur disque (y compris ceux non vus depuis le démarrage)."""
+        with self._lock:
+            on_disk = {path.name[:-len('.raw')] for path in self.directory.glob('*.raw')}
+            return sorted(on_disk | set(self._series))
+
+    def choose_tier(self, start: float, now: float | None = None) -> str:
+        """Niveau le plus fin dont la durée de conservation couvre `start`."""
+        age = (time.time() if now is None else now) - start
+        for tier in TIERS:
+            if age <= tier.retention:
+                return tier.name
+        return TIERS[-1].name
+
+    def _range_bytes(self, sensor_id, start, end, tier):
+        """(octets sur disque, enregistrements en attente, format) pour [start, end]."""
+        if sensor_id not in self._series and not (self.directory / f"{sensor_id}.raw").exists():
+            return b'', [], None # Capteur inconnu: ne pas créer de fichiers pour une simple lecture
+        series = self._get(sensor_id)
+        if series is None:
+            return b'', [], None
+        ring = series.files[tier]
+        first = ring.bisect(start)
+        last = len(ring) if end is None else ring.bisect(math.nextafter(end, math.inf))
+        pending = [r for r in series.pending[tier] if r[0] >= start and (end is None or r[0] <= end)]
+        return ring.raw_range(first, last), pending, ring.record
+
+    def query(self, sensor_id, start: float, end: float | None = None, tier: str | None = None) -> list:
+        """
+        Enregistrements de `sensor_id` entre start et end (horodatages time.time()):
+        'raw' -> [(timestamp, valeur)], agrégats -> [(début, min, max, moyenne, nombre)].
+        Sans `tier`, le niveau le plus fin couvrant `start` est utilisé.
+        """
+        tier = tier or self.choose_tier(start)
+        with self._lock:
+            data, pending, record = self._range_bytes(sensor_id, start, end, tier)
+        if record is None:
+            return []
+        return list(record.iter_unpack(data)) + pending
+
+    def query_array(self, sensor_id, start: float, end: float | None = None, tier: str | None = None):
+        """Comme query(), en tableau NumPy structuré (RAW_DTYPE ou ROLLUP_DTYPE) pour les longues périodes."""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy n'est pas installé: utilisez query().")
+        tier = tier or self.choose_tier(start)
+        dtype = RAW_DTYPE if tier == TIERS[0].name else ROLLUP_DTYPE
+        with self._lock:
+            data, pending, _ = self._range_bytes(sensor_id, start, end, tier)
+        array = np.frombuffer(data, dtype=dtype)
+        if pending:
+            array = np.concatenate([array, np.array(pending, dtype=dtype)])
+        return array
+
+# Test simple
+if __name__ == '__main__':
+    import tempfile
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        history = DiskHistory(tmp, sample_interval=2.0, flush_interval=0)
+        t0 = math.floor(time.time() / 3600) * 3600 - 3 * 3600
+        for i in range(3 * 1800): # 3 h de mesures à 2 s
+            history.record_sensors(t0 + 2 * i, {'28-000000000001': 20 + (i % 30) / 10})
+        history.close()
+        history = DiskHistory(tmp) # Réouverture: les agrégats en cours sont reconstruits
+        print("Brut (5 premiers):", history.query('28-000000000001', t0, t0 + 8, tier='raw'))
+        print("Minutes:", len(history.query('28-000000000001', t0, tier='min')))
+        print("Heures:", history.query('28-000000000001', t0, tier='hour'))
+        print("Fichiers:", {p.name: p.stat().st_size for p in Path(tmp).iterdir()})
+        history.close()
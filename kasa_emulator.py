@@ -0,0 +1,390 @@
+# kasa_emulator.py
+"""
+Module kasa_emulator.py
+
+Émulateur local de multiprises (KP303) et prises (HS103) Kasa pour les tests
+d'intégration et de charge, sans matériel. Chaque appareil virtuel écoute sur
+sa propre adresse de bouclage 127.0.0.N (Linux: tout 127.0.0.0/8 est local),
+port 9999, et parle le protocole IOT de python-kasa:
+    - TCP: requêtes JSON chiffrées XOR (clé 171), préfixées de leur longueur
+      sur 4 octets (big-endian); la connexion reste ouverte entre requêtes
+    - UDP: réponse à la requête de découverte get_sysinfo (chiffrée, sans préfixe)
+
+La diffusion n'existant pas sur l'interface de bouclage, une adresse de
+découverte (127.0.0.1 par défaut) relaie la requête: chaque appareil répond
+depuis sa propre adresse, comme sur un vrai réseau. DeviceDiscoverer(target=...)
+et DeviceController(ip) s'utilisent donc sans modification.
+
+Injection de défauts (par requête, tirage pseudo-aléatoire reproductible):
+    latency / jitter : délai de réponse (ms), TCP et UDP
+    loss             : probabilité de perdre une réponse de découverte UDP
+    failure          : probabilité de fermer la connexion TCP sans répondre
+    stall            : probabilité de ne jamais répondre (délai expiré côté client)
+Un appareil peut aussi être mis hors ligne (set_online) pour tester la redécouverte.
+
+Exemples:
+    python kasa_emulator.py --strips 3 --plugs 1                # émulateur seul (Ctrl+C pour arrêter)
+    python kasa_emulator.py --strips 100 --bench                # découverte, relevés et commandes
+    python kasa_emulator.py --strips 50 --latency 40 --jitter 20 --loss 0.1 --failure 0.02 --bench
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import ipaddress
+import json
+import random
+import statistics
+import struct
+import time
+
+XOR_KEY = 171 # Clé initiale du chiffrement "autokey" des appareils IOT
+KASA_PORT = 9999
+DEFAULT_DISCOVERY_HOST = '127.0.0.1'
+DEFAULT_FIRST_HOST = '127.0.0.2'
+DISCOVERY_SPREAD = 0.5 # s, étalement aléatoire des réponses à une requête de découverte relayée
+
+
+def xor_encrypt(data: bytes) -> bytes:
+    """Chiffre un message IOT (sans préfixe de longueur)."""
+    key = XOR_KEY
+    out = bytearray(len(data))
+    for i, byte in enumerate(data):
+        key ^= byte
+        out[i] = key
+    return bytes(out)
+
+
+def xor_decrypt(data: bytes) -> bytes:
+    """Déchiffre un message IOT (sans préfixe de longueur)."""
+    key = XOR_KEY
+    out = bytearray(len(data))
+    for i, byte in enumerate(data):
+        out[i] = key ^ byte
+        key = byte
+    return bytes(out)
+
+
+class VirtualDevice:
+    """État d'une multiprise (outlets > 1) ou d'une prise simple émulée: sysinfo IOT et relais."""
+
+    def __init__(self, host: str, number: int, outlets: int = 3):
+        self.host = host
+        self.number = number
+        self.is_strip = outlets > 1
+        self.mac = f"50:C7:BF:{(number >> 16) & 0xFF:02X}:{(number >> 8) & 0xFF:02X}:{number & 0xFF:02X}"
+        self.device_id = f"{number:040X}"
+        self.alias = f"Virtual {'Strip' if self.is_strip else 'Plug'} {number}"
+        self.states = [False] * outlets
+        self.outlet_aliases = [f"Plug {i + 1}" for i in range(outlets)] if self.is_strip else [self.alias]
+        self.online = True
+        self.requests = 0 # Requêtes TCP traitées (statistiques)
+
+    def sysinfo(self) -> dict:
+        info = {
+            'sw_ver': '1.0.3 Build 191105 Rel.113122', 'hw_ver': '1.0',
+            'model': 'KP303(US)' if self.is_strip else 'HS103(US)',
+            'deviceId': self.device_id, 'oemId': 'EMULATOR00000000000000000000000', 'hwId': 'EMULATOR00000000000000000000000',
+            'rssi': -50 - self.number % 20, 'latitude_i': 0, 'longitude_i': 0,
+            'alias': self.alias, 'status': 'new', 'mic_type': 'IOT.SMARTPLUGSWITCH', 'feature': 'TIM',
+            'mac': self.mac, 'updating': 0, 'led_off': 0, 'ntc_state': 0, 'err_code': 0,
+        }
+        if self.is_strip:
+            info['child_num'] = len(self.states)
+            info['children'] = [{'id': f"{self.device_id}{i:02d}", 'state': int(state), 'alias': alias,
+                                 'on_time': 0, 'next_action': {'type': -1}}
+                                for i, (state, alias) in enumerate(zip(self.states, self.outlet_aliases))]
+        else:
+            info.update({'type': 'IOT.SMARTPLUGSWITCH', 'dev_name': 'Smart Wi-Fi Plug Mini', 'icon_hash': '',
+                         'relay_state': int(self.states[0]), 'on_time': 0, 'active_mode': 'none',
+                         'next_action': {'type': -1}})
+            del info['mic_type']
+        return info
+
+    def _targets(self, context) -> list[int]:
+        """Indices des prises visées par un contexte child_ids (toutes si absent)."""
+        child_ids = (context or {}).get('child_ids')
+        if not child_ids:
+            return list(range(len(self.states)))
+        ids = [f"{self.device_id}{i:02d}" for i in range(len(self.states))]
+        # python-kasa envoie l'ID complet; certains clients n'envoient que le suffixe
+        return [i for i, full_id in enumerate(ids) for child_id in child_ids
+                if child_id == full_id or child_id == full_id[-2:]]
+
+    def handle(self, request: dict) -> dict:
+        """Traite une requête IOT {module: {commande: arguments}} et retourne la réponse."""
+        self.requests += 1
+        context = request.get('context')
+        response = {}
+        for target, commands in request.items():
+            if target == 'context':
+                continue
+            if target != 'system' or not isinstance(commands, dict):
+                response[target] = {'err_code': -1, 'err_msg': 'module not support'}
+                continue
+            result = {}
+            for command, args in commands.items():
+                args = args or {}
+                if command == 'get_sysinfo':
+                    result[command] = self.sysinfo()
+                elif command == 'set_relay_state':
+                    for i in self._targets(context):
+                        self.states[i] = bool(args.get('state'))
+                    result[command] = {'err_code': 0}
+                elif command == 'set_dev_alias':
+                    if context and context.get('child_ids'):
+                        for i in self._targets(context):
+                            self.outlet_aliases[i] = str(args.get('alias', ''))
+                    else:
+                        self.alias = str(args.get('alias', ''))
+                    result[command] = {'err_code': 0}
+                else:
+                    result[command] = {'err_code': -2, 'err_msg': 'member not support'}
+            response[target] = result
+        return response
+
+
+class _DeviceDatagram(asyncio.DatagramProtocol):
+    """Socket UDP d'un appareil (ip:9999): répond aux requêtes de découverte qui lui sont adressées."""
+
+    def __init__(self, emulator, device):
+        self.emulator = emulator
+        self.device = device
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.emulator._reply_discovery(self, data, addr)
+
+
+class _DiscoveryRelay(asyncio.DatagramProtocol):
+    """Adresse de découverte: tient lieu de diffusion, chaque appareil répond depuis sa propre adresse."""
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+
+    def datagram_received(self, data, addr):
+        # Étalement des réponses comme sur un vrai réseau: une rafale simultanée de centaines
+        # de datagrammes déborderait le tampon de réception du client (pertes non voulues)
+        for endpoint in self.emulator._endpoints:
+            self.emulator._reply_discovery(endpoint, data, addr, spread=DISCOVERY_SPREAD)
+
+
+class KasaEmulator:
+    """
+    Lance `strips` multiprises et `plugs` prises virtuelles sur 127.0.0.N:9999.
+
+    Utilisable comme gestionnaire de contexte asynchrone:
+        async with KasaEmulator(strips=100, latency=20) as emulator:
+            devices = await DeviceDiscoverer(target=emulator.discovery_host).discover()
+    """
+
+    def __init__(self, strips: int = 2, plugs: int = 0, outlets: int = 3, first_host: str = DEFAULT_FIRST_HOST,
+                 discovery_host: str = DEFAULT_DISCOVERY_HOST, port: int = KASA_PORT, latency: float = 0.0,
+                 jitter: float = 0.0, loss: float = 0.0, failure: float = 0.0, stall: float = 0.0, seed: int = 0):
+        for name, probability in (('loss', loss), ('failure', failure), ('stall', stall)):
+            if not 0.0 <= probability <= 1.0:
+                raise ValueError(f"Probabilité '{name}' invalide: {probability} (attendu entre 0 et 1)")
+        first = ipaddress.IPv4Address(first_host)
+        self.devices = [VirtualDevice(str(first + i), i + 1, outlets if i < strips else 1) for i in range(strips + plugs)]
+        self.discovery_host = discovery_host
+        self.port = port
+        self.latency = latency / 1000.0
+        self.jitter = jitter / 1000.0
+        self.loss = loss
+        self.failure = failure
+        self.stall = stall
+        self._rng = random.Random(seed)
+        self._servers = []
+        self._endpoints = []
+        self._transports = []
+        self._connections = {} # {tâche de connexion TCP: writer}
+        self._stalled = set() # Connexions volontairement laissées sans réponse
+
+    @property
+    def hosts(self) -> list[str]:
+        return [device.host for device in self.devices]
+
+    def device(self, host: str) -> VirtualDevice | None:
+        return next((d for d in self.devices if d.host == host), None)
+
+    def set_online(self, host: str, online: bool):
+        """Met un appareil hors ligne (plus de réponse UDP, connexions TCP refusées) ou le rétablit."""
+        self.device(host).online = online
+
+    # --- Cycle de vie ---
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        try:
+            for device in self.devices:
+                server = await asyncio.start_server(
+                    lambda r, w, d=device: self._serve_connection(d, r, w), device.host, self.port)
+                self._servers.append(server)
+                transport, endpoint = await loop.create_datagram_endpoint(
+                    lambda d=device: _DeviceDatagram(self, d), local_addr=(device.host, self.port))
+                self._endpoints.append(endpoint)
+                self._transports.append(transport)
+            if self.discovery_host:
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _DiscoveryRelay(self), local_addr=(self.discovery_host, self.port))
+                self._transports.append(transport)
+        except OSError:
+            await self.stop()
+            raise
+        return self
+
+    async def stop(self):
+        for transport in self._transports:
+            transport.close()
+        for server in self._servers:
+            server.close()
+        # Fermer les connexions encore ouvertes (ex: sessions non fermées par les clients) et attendre leurs tâches
+        for writer in list(self._connections.values()) + list(self._stalled):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers, self._endpoints, self._transports = [], [], []
+        self._connections.clear()
+        self._stalled.clear()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    # --- Protocole ---
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _reply_discovery(self, endpoint, data, addr, spread: float = 0.0):
+        device = endpoint.device
+        if not device.online or endpoint.transport is None or self._rng.random() < self.loss:
+            return
+        try:
+            request = json.loads(xor_decrypt(data))
+        except ValueError:
+            return # Requête d'un autre protocole (ex: découverte AES sur 20002)
+        if 'system' not in request:
+            return
+        payload = xor_encrypt(json.dumps({'system': {'get_sysinfo': device.sysinfo()}}).encode())
+        delay = self._delay() + self._rng.uniform(0.0, spread)
+        asyncio.get_running_loop().call_later(delay, endpoint.transport.sendto, payload, addr)
+
+    async def _serve_connection(self, device, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while device.online:
+                header = await reader.readexactly(4)
+                (length,) = struct.unpack('>I', header)
+                request = json.loads(xor_decrypt(await reader.readexactly(length)))
+                draw = self._rng.random()
+                if draw < self.stall:
+                    self._stalled.add(writer) # Le client attend jusqu'à son délai d'expiration
+                    return
+                if draw < self.stall + self.failure:
+                    break # Connexion fermée sans réponse
+                await asyncio.sleep(self._delay())
+                if not device.online:
+                    break
+                payload = xor_encrypt(json.dumps(device.handle(request)).encode())
+                writer.write(struct.pack('>I', len(payload)) + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+        if writer not in self._stalled:
+            writer.close()
+
+
+# --- Test de charge ---
+async def _bench(emulator, rounds: int, concurrency: int, verbose: bool):
+    """Mesure la découverte, les relevés d'état et les commandes via DeviceDiscoverer et DeviceSessionPool."""
+    from device_control import DeviceSessionPool
+    from discover_device import DeviceDiscoverer
+
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    results = {}
+    with quiet:
+        start = time.perf_counter()
+        devices = await DeviceDiscoverer(target=emulator.discovery_host).discover(concurrency=concurrency)
+        results['discovery'] = (time.perf_counter() - start, len(devices))
+
+        pool = DeviceSessionPool()
+        controllers = [await pool.acquire(d['mac'], d['ip'], d['is_strip'], d['is_plug']) for d in devices]
+        poll_times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            states = await asyncio.gather(*(c.get_outlet_state() for c in controllers))
+            poll_times.append(time.perf_counter() - start)
+        results['poll'] = (poll_times, sum(s is not None for s in states))
+
+        command_times, confirmed, total = [], 0, 0
+        for round_number in range(rounds):
+            turn_on = round_number % 2 == 0
+            start = time.perf_counter()
+            outcomes = await asyncio.gather(*(c.set_outlet_states({o['index']: turn_on for o in d['outlets']})
+                                              for c, d in zip(controllers, devices)))
+            command_times.append(time.perf_counter() - start)
+            confirmed += sum(sum(r.values()) for r in outcomes)
+            total += sum(len(r) for r in outcomes)
+        results['commands'] = (command_times, confirmed, total)
+        await pool.close_all()
+
+    expected = len(emulator.devices)
+    outlets = sum(len(d.states) for d in emulator.devices)
+    discovery_time, found = results['discovery']
+    print(f"Découverte : {found}/{expected} appareil(s) en {discovery_time:.2f} s")
+    poll_times, answered = results['poll']
+    print(f"Relevés    : {answered}/{found} appareil(s), médiane {statistics.median(poll_times) * 1000:.0f} ms par tour "
+          f"({found / statistics.median(poll_times):.0f} appareils/s)" if poll_times and found else "Relevés    : aucun appareil")
+    command_times, confirmed, total = results['commands']
+    if command_times and total:
+        print(f"Commandes  : {confirmed}/{total} prise(s) confirmée(s) sur {outlets} x {rounds}, médiane "
+              f"{statistics.median(command_times) * 1000:.0f} ms par tour ({total / sum(command_times):.0f} prises/s)")
+    print(f"Requêtes TCP reçues par l'émulateur: {sum(d.requests for d in emulator.devices)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Émulateur local d'appareils Kasa (protocole IOT) pour tests d'intégration et de charge.")
+    parser.add_argument('--strips', type=int, default=2, help="Nombre de multiprises virtuelles.")
+    parser.add_argument('--plugs', type=int, default=0, help="Nombre de prises simples virtuelles.")
+    parser.add_argument('--outlets', type=int, default=3, help="Prises par multiprise.")
+    parser.add_argument('--first-host', default=DEFAULT_FIRST_HOST, help="Adresse du premier appareil (les suivantes sont consécutives).")
+    parser.add_argument('--discovery-host', default=DEFAULT_DISCOVERY_HOST, help="Adresse de découverte (cible de DeviceDiscoverer).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence de réponse (ms).")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Variation aléatoire de la latence (± ms).")
+    parser.add_argument('--loss', type=float, default=0.0, help="Probabilité de perte d'une réponse de découverte UDP.")
+    parser.add_argument('--failure', type=float, default=0.0, help="Probabilité de fermer une connexion TCP sans répondre.")
+    parser.add_argument('--stall', type=float, default=0.0, help="Probabilité de ne jamais répondre à une requête TCP.")
+    parser.add_argument('--seed', type=int, default=0, help="Graine du tirage des défauts.")
+    parser.add_argument('--bench', action='store_true', help="Lance un test de charge (découverte, relevés, commandes) puis s'arrête.")
+    parser.add_argument('--rounds', type=int, default=5, help="Tours de relevés et de commandes du test de charge.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Récupérations de détails simultanées pendant la découverte.")
+    parser.add_argument('--verbose', action='store_true', help="Affiche les messages de DeviceDiscoverer/DeviceController.")
+    args = parser.parse_args(argv)
+
+    async def run():
+        async with KasaEmulator(strips=args.strips, plugs=args.plugs, outlets=args.outlets, first_host=args.first_host,
+                                discovery_host=args.discovery_host, latency=args.latency, jitter=args.jitter,
+                                loss=args.loss, failure=args.failure, stall=args.stall, seed=args.seed) as emulator:
+            print(f"{len(emulator.devices)} appareil(s) Kasa émulé(s): {emulator.hosts[0]} à {emulator.hosts[-1]}, "
+                  f"découverte via {emulator.discovery_host}:{emulator.port}")
+            if args.bench:
+                await _bench(emulator, args.rounds, args.concurrency, args.verbose)
+            else:
+                await asyncio.Event().wait() # Jusqu'à Ctrl+C
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,134 @@
-# light_sensor.py (Version modifiée pour utiliser la bibliothèque Adafruit)
+# light_sensor.py (pilotes smbus2 et Adafruit)
 #!/usr/bin/env python3
 """
-Module light_sensor.py (Version Adafruit)
+Module light_sensor.py
 
-Utilise la bibliothèque adafruit_circuitpython_bh1750 pour gérer
-deux capteurs BH1750 sur un Raspberry Pi via la couche Blinka.
+Gère deux capteurs BH1750 sur un Raspberry Pi.
 Détecte les capteurs aux adresses spécifiées (par défaut 0x23 et 0x5C).
+
+Deux pilotes (backends) sont disponibles:
+    - 'smbus2': pilote léger qui parle directement au BH1750 via /dev/i2c-N.
+      Le capteur est placé en mode de mesure continue; une lecture se résume
+      à un transfert de 2 octets, sans attente de mesure.
+    - 'adafruit': bibliothèque adafruit_circuitpython_bh1750 via la couche Blinka
+      (importée seulement si ce pilote est utilisé: import lent sur Pi Zero).
+'auto' choisit smbus2 si le bus /dev/i2c-N est accessible, sinon Adafruit.
 """
 
+import os
 import time
 import logging
+from sensor_health import SensorHealthTracker
 try:
-    import board # Fourni par adafruit-blinka
-    import busio # Fourni par adafruit-blinka
-    import adafruit_bh1750
-    ADAFRUIT_LIBS_AVAILABLE = True
+    from smbus2 import SMBus, i2c_msg
+    SMBUS2_AVAILABLE = True
 except ImportError:
-    logging.error("Bibliothèques Adafruit (blinka, adafruit_bh1750) non trouvées. Veuillez les installer.")
-    ADAFRUIT_LIBS_AVAILABLE = False
-except RuntimeError as e:
-    # Blinka peut lever une RuntimeError si les prérequis matériels/OS ne sont pas remplis
-    logging.error(f"Erreur RuntimeError lors de l'importation des bibliothèques Adafruit: {e}")
-    logging.error("Assurez-vous que I2C/SPI sont activés et que les permissions sont correctes.")
-    ADAFRUIT_LIBS_AVAILABLE = False
+    SMBUS2_AVAILABLE = False
+
+# Chargées à la demande par _load_adafruit_libs() (None = pas encore tenté)
+ADAFRUIT_LIBS_AVAILABLE = None
+board = busio = adafruit_bh1750 = None
+
+LIGHT_BACKENDS = ('auto', 'smbus2', 'adafruit')
+
+# Instructions BH1750 (fiche technique ROHM)
+BH1750_POWER_ON = 0x01
+BH1750_RESET = 0x07
+# Modes de mesure continue: nom -> (opcode, lux par unité brute, temps de mesure max. en s)
+BH1750_CONTINUOUS_MODES = {
+    'high': (0x10, 1 / 1.2, 0.180), # 1 lx de résolution
+    'high2': (0x11, 0.5 / 1.2, 0.180), # 0.5 lx de résolution
+    'low': (0x13, 1 / 1.2, 0.024), # 4 lx de résolution, mesure rapide
+}
+
+
+def _load_adafruit_libs() -> bool:
+    """Importe Blinka et adafruit_bh1750 au premier besoin; retourne True si disponibles."""
+    global ADAFRUIT_LIBS_AVAILABLE, board, busio, adafruit_bh1750
+    if ADAFRUIT_LIBS_AVAILABLE is not None:
+        return ADAFRUIT_LIBS_AVAILABLE
+    try:
+        import board # Fourni par adafruit-blinka
+        import busio # Fourni par adafruit-blinka
+        import adafruit_bh1750
+        ADAFRUIT_LIBS_AVAILABLE = True
+    except ImportError:
+        logging.error("Bibliothèques Adafruit (blinka, adafruit_bh1750) non trouvées. Veuillez les installer.")
+        ADAFRUIT_LIBS_AVAILABLE = False
+    except RuntimeError as e:
+        # Blinka peut lever une RuntimeError si les prérequis matériels/OS ne sont pas remplis
+        logging.error(f"Erreur RuntimeError lors de l'importation des bibliothèques Adafruit: {e}")
+        logging.error("Assurez-vous que I2C/SPI sont activés et que les permissions sont correctes.")
+        ADAFRUIT_LIBS_AVAILABLE = False
+    return ADAFRUIT_LIBS_AVAILABLE
+
+
+class SMBusBH1750:
+    """
+    Pilote BH1750 minimal sur smbus2, même interface que adafruit_bh1750.BH1750 (propriété `lux`).
+    Le capteur mesure en continu: lire `lux` ne fait que récupérer le dernier résultat (2 octets).
+    """
+    def __init__(self, bus, address: int, mode: str = 'high'):
+        if mode not in BH1750_CONTINUOUS_MODES:
+            raise ValueError(f"Mode BH1750 inconnu: {mode} (attendu: {', '.join(BH1750_CONTINUOUS_MODES)})")
+        self.bus = bus
+        self.address = address
+        self.mode = mode
+        self.start()
+
+    def start(self):
+        """(Re)met le capteur sous tension en mesure continue (ex: après une coupure). Absent du bus -> OSError."""
+        opcode, self._lux_per_count, measurement_time = BH1750_CONTINUOUS_MODES[self.mode]
+        self.bus.write_byte(self.address, BH1750_POWER_ON)
+        self.bus.write_byte(self.address, BH1750_RESET)
+        self.bus.write_byte(self.address, opcode)
+        self._ready_at = time.monotonic() + measurement_time # Première mesure disponible
+
+    @property
+    def lux(self) -> float:
+        wait = self._ready_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait) # Seulement juste après l'initialisation
+        msg = i2c_msg.read(self.address, 2)
+        self.bus.i2c_rdwr(msg)
+        high, low = list(msg)
+        return ((high << 8) | low) * self._lux_per_count
 
 
 class BH1750Manager:
-    def __init__(self, bus_number: int = 1, addresses: list = [0x23, 0x5C]):
+    def __init__(self, bus_number: int = 1, addresses: list = [0x23, 0x5C], backend: str = 'auto', mode: str = 'high'):
         """
-        Initialise le manager pour les capteurs BH1750 via Adafruit Blinka.
+        Initialise le manager pour les capteurs BH1750.
 
         Args:
-            bus_number (int): Ignoré (Blinka utilise board.SCL/SDA). Reste pour compatibilité.
+            bus_number (int): Numéro du bus I²C (/dev/i2c-N) pour le pilote smbus2 (ignoré par Blinka, qui utilise board.SCL/SDA).
             addresses (list): Liste des adresses I²C à scanner.
+            backend (str): 'auto', 'smbus2' ou 'adafruit' (voir LIGHT_BACKENDS).
+            mode (str): Mode de mesure continue du pilote smbus2 ('high', 'high2' ou 'low').
         """
+        if backend not in LIGHT_BACKENDS:
+            raise ValueError(f"Pilote BH1750 inconnu: {backend} (attendu: {', '.join(LIGHT_BACKENDS)})")
+        if mode not in BH1750_CONTINUOUS_MODES:
+            raise ValueError(f"Mode BH1750 inconnu: {mode} (attendu: {', '.join(BH1750_CONTINUOUS_MODES)})")
+        self.bus_number = bus_number
         self.addresses = addresses
+        self.mode = mode
         self.sensors = {} # Dictionnaire pour stocker les instances de capteurs {addr_int: sensor_instance}
         self.i2c = None
+        self.health = SensorHealthTracker("Capteur de lumière") # Échecs consécutifs et reprise exponentielle par adresse
+        self.backend = self._select_backend(backend)
+        logging.info(f"Pilote BH1750 sélectionné: {self.backend}")
 
-        if not ADAFRUIT_LIBS_AVAILABLE:
+        if self.backend == 'smbus2':
+            try:
+                self.i2c = SMBus(bus_number)
+                logging.info(f"Bus I2C /dev/i2c-{bus_number} ouvert via smbus2.")
+                self.scan_sensors()
+            except OSError as e:
+                logging.error(f"Erreur d'ouverture du bus I2C /dev/i2c-{bus_number}: {e}. Vérifiez que I2C est activé.")
+            return
+
+        if not _load_adafruit_libs():
             logging.error("Initialisation BH1750Manager échouée: Bibliothèques Adafruit manquantes.")
             return # Ne pas continuer si les libs ne sont pas là
 
@@ -56,17 +146,41 @@ class BH1750Manager:
              logging.error(f"Erreur inattendue lors de l'initialisation I2C: {e}")
 
 
+    def _select_backend(self, backend: str) -> str:
+        """Résout 'auto': smbus2 si disponible et /dev/i2c-N présent, sinon Adafruit Blinka."""
+        if backend == 'smbus2' and not SMBUS2_AVAILABLE:
+            logging.error("Pilote BH1750 'smbus2' demandé mais smbus2 n'est pas installé, utilisation d'Adafruit.")
+            return 'adafruit'
+        if backend != 'auto':
+            return backend
+        if SMBUS2_AVAILABLE and os.path.exists(f"/dev/i2c-{self.bus_number}"):
+            return 'smbus2'
+        return 'adafruit'
+
     def scan_sensors(self):
         """
-        Scanne le bus I²C pour les adresses spécifiées et initialise un objet
-        adafruit_bh1750 pour chaque capteur détecté.
+        Scanne le bus I²C pour les adresses spécifiées et initialise un pilote
+        (SMBusBH1750 ou adafruit_bh1750) pour chaque capteur détecté.
         """
         if not self.i2c:
              logging.warning("Scan annulé: Bus I2C non initialisé.")
              return
 
         self.sensors = {} # Réinitialiser en cas de re-scan
+        self.health.retain([]) # Nouvel état de santé pour les capteurs redétectés
         logging.info(f"Scan des adresses BH1750: { [hex(a) for a in self.addresses] }")
+        if self.backend == 'smbus2':
+            for addr in self.addresses:
+                try:
+                    self.sensors[addr] = SMBusBH1750(self.i2c, addr, self.mode)
+                    logging.info(f"Capteur BH1750 détecté à l'adresse {hex(addr)} (smbus2, mode continu '{self.mode}')")
+                except OSError:
+                    # Pas d'acquittement (NACK): aucun capteur à cette adresse
+                    logging.warning(f"Aucun capteur BH1750 détecté à l'adresse {hex(addr)} (OSError).")
+                except Exception as e:
+                    logging.error(f"Erreur lors de la tentative d'initialisation du capteur {hex(addr)}: {e}")
+            return
+
         for addr in self.addresses:
             try:
                 # Tente de créer une instance du capteur Adafruit BH1750
@@ -98,18 +212,24 @@ class BH1750Manager:
 
         Returns:
             float | None: La luminosité en lux ou None en cas d'erreur.
+            Un capteur en échec n'est réinterrogé qu'à l'échéance de son délai de reprise (exponentiel).
         """
         if address in self.sensors:
+            sensor_id = hex(address)
+            if not self.health.should_read(sensor_id):
+                return None # Capteur en échec: pas d'accès au bus avant son délai de reprise
             try:
-                lux_value = self.sensors[address].lux
-                logging.debug(f"Lecture capteur {hex(address)}: {lux_value:.2f} Lux")
-                return lux_value
+                sensor = self.sensors[address]
+                if self.health.get(sensor_id).failures and hasattr(sensor, 'start'):
+                    sensor.start() # Capteur peut-être rebranché: remettre la mesure continue
+                lux_value = sensor.lux
             except Exception as e:
                 # Peut être une OSError si le capteur se déconnecte
-                logging.error(f"Erreur lors de la lecture du capteur {hex(address)}: {e}")
-                # Optionnel: tenter de réinitialiser ou supprimer le capteur de la liste?
-                # del self.sensors[address] # Ou marquer comme défaillant
+                self.health.record_failure(sensor_id, e)
                 return None
+            logging.debug(f"Lecture capteur {sensor_id}: {lux_value:.2f} Lux")
+            self.health.record_success(sensor_id, lux_value)
+            return lux_value
         else:
             logging.warning(f"Tentative de lecture d'un capteur non disponible/détecté à l'adresse {hex(address)}")
             return None
@@ -136,9 +256,9 @@ if __name__ == '__main__':
     log_format = '%(asctime)s - %(levelname)s - %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_format)
 
-    if ADAFRUIT_LIBS_AVAILABLE:
-        print("Initialisation du BH1750Manager (Adafruit)...")
-        manager = BH1750Manager() # Utilise les adresses par défaut [0x23, 0x5C]
+    if SMBUS2_AVAILABLE or _load_adafruit_libs():
+        print("Initialisation du BH1750Manager...")
+        manager = BH1750Manager() # Utilise les adresses par défaut [0x23, 0x5C], pilote choisi automatiquement
         active = manager.get_active_sensors()
         print("Capteurs actifs détectés aux adresses (int):", active)
         print("Capteurs actifs détectés aux adresses (hex):", [hex(addr) for addr in active])
@@ -158,4 +278,4 @@ if __name__ == '__main__':
         else:
             print("Aucun capteur actif détecté, impossible de démarrer les lectures.")
     else:
-        print("Impossible d'exécuter le test: Bibliothèques Adafruit non disponibles.")
\ No newline at end of file
+        print("Impossible d'exécuter le test: ni smbus2 ni les bibliothèques Adafruit ne sont disponibles.")
\ No newline at end of file
@@ -0,0 +1,867 @@
+# rule_engine.py
+"""
+Module rule_engine.py
+
+Moteur d'évaluation des règles d'automatisation (SI / JUSQU'À).
+
+Les conditions sont validées et compilées une seule fois (au chargement de la
+configuration ou après ConditionEditor.apply) en objets compacts (__slots__)
+qui contiennent le seuil en float, l'heure en minutes depuis minuit et la
+fonction de comparaison déjà résolue: la boucle de monitoring ne fait plus
+aucun parsing.
+
+Les règles sont compilées en objets CompiledRule, avec des index:
+    - rule_id -> règle compilée
+    - (mac, index) de la prise -> règles ciblant cette prise (dans l'ordre de la liste)
+    - id de capteur -> règles dont une condition dépend de ce capteur
+    - règles dépendant de l'heure
+
+À chaque cycle, seules les règles dont un capteur a changé de valeur (ou dont
+une condition horaire a pu changer d'état) sont réévaluées, et seules les prises
+concernées voient leur état désiré recalculé. Le résultat est identique à une
+évaluation complète de toutes les règles, à une différence près pour JUSQU'À:
+    - une activation est confirmée dans le même appel (sa condition JUSQU'À est
+      évaluée aussitôt): une activation dont le JUSQU'À est déjà rempli n'est pas
+      visible, seul son retour l'est;
+    - un retour JUSQU'À reste visible pendant un cycle (ex: 'ON' pour une règle
+      OFF); la prise est réévaluée au cycle suivant (has_pending_evaluation()),
+      au plus tard après PENDING_RETRY_DELAY secondes.
+
+Conditions 'Agrégat' (moyenne / min / max / pente par minute sur une fenêtre glissante): compilées en
+condition 'Capteur' sur un capteur virtuel ('avg:<capteur>:<secondes>', voir
+window_aggregates.py) dont la valeur est fournie avec les mesures des capteurs réels.
+
+Anti-cyclage (configuration):
+    - 'hysteresis' sur une condition 'Capteur' (<, >, <=, >=): bande morte autour du seuil
+    - 'min_on_seconds' / 'min_off_seconds' sur une règle: temps minimum entre deux
+      commandes opposées envoyées à la prise (check_dwell / record_switch)
+
+Pour les très grands ensembles de règles, le backend 'numpy' (rule_engine_numpy.py)
+évalue tous les groupes de conditions en une passe vectorisée.
+"""
+import bisect
+import logging
+import operator
+import threading
+from datetime import datetime
+
+from window_aggregates import AGGREGATE_FUNCTIONS, aggregate_key
+
+_MISSING = object() # Marqueur pour une valeur de capteur absente
+
+FLOAT_TOLERANCE = 1e-9 # Tolérance pour l'égalité entre floats
+
+# Fonctions de comparaison pré-résolues (opérateur de la configuration -> fonction)
+SENSOR_OPERATOR_FUNCS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '=': lambda v1, v2: abs(v1 - v2) < FLOAT_TOLERANCE,
+    '!=': lambda v1, v2: abs(v1 - v2) >= FLOAT_TOLERANCE,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+# Les conditions horaires comparent des secondes depuis minuit; '=' et '!=' ne regardent que la minute
+TIME_OPERATOR_FUNCS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '=': lambda now_seconds, target_seconds: now_seconds // 60 == target_seconds // 60,
+    '!=': lambda now_seconds, target_seconds: now_seconds // 60 != target_seconds // 60,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+LOGIC_OPERATORS = ('ET', 'OU')
+EVALUATION_BACKENDS = ('auto', 'python', 'numpy')
+# Réévaluations enchaînées par evaluate() après une activation JUSQU'À (confirmation du JUSQU'À)
+IMMEDIATE_REEVALUATIONS = 2
+PENDING_RETRY_DELAY = 2.0 # s; cycle suivant un retour JUSQU'À (période de la boucle d'origine)
+
+
+def seconds_of_day(current_time_obj):
+    """Convertit un datetime.time en secondes (float) depuis minuit."""
+    return (current_time_obj.hour * 3600 + current_time_obj.minute * 60
+            + current_time_obj.second + current_time_obj.microsecond / 1_000_000)
+
+
+def time_key(now_seconds):
+    """
+    Retourne une clé qui ne change que lorsque le résultat d'une condition 'Heure'
+    peut changer: les comparaisons se font à la minute près, sauf à l'instant exact
+    HH:MM:00 où '<=' et '>' basculent.
+    """
+    return (int(now_seconds // 60), now_seconds % 60 == 0)
+
+
+def outlet_command(desired_state, live_state):
+    """
+    Décide la commande à envoyer à une prise (étape 4 du monitoring).
+
+    Args:
+        desired_state: 'ON', 'OFF' ou None (aucune règle ne fixe l'état).
+        live_state: True, False ou None (état inconnu).
+
+    Returns:
+        tuple: (état cible bool, implicite bool), ou None si aucune commande n'est nécessaire.
+        Implicite: aucune règle ne veut la prise ce cycle alors qu'elle est allumée -> OFF.
+    """
+    if desired_state == 'ON' and live_state is not True:
+        return True, False
+    if desired_state == 'OFF' and live_state is not False:
+        return False, False
+    if desired_state is None and live_state is True:
+        return False, True
+    return None
+
+
+# --- Conditions compilées ---
+class SensorCondition:
+    """Condition 'Capteur' compilée: valeur du capteur <op> seuil."""
+    __slots__ = ('condition_id', 'sensor_id', 'operator', 'threshold', '_compare')
+
+    def __init__(self, condition_id, sensor_id, operator_str, threshold):
+        self.condition_id = condition_id
+        self.sensor_id = sensor_id
+        self.operator = operator_str
+        self.threshold = threshold
+        self._compare = SENSOR_OPERATOR_FUNCS[operator_str]
+
+    def __call__(self, current_sensor_values, now_seconds):
+        value = current_sensor_values.get(self.sensor_id)
+        if value is None:
+            return False # Valeur manquante pour ce capteur
+        return self._compare(value, self.threshold)
+
+
+# Seuil de relâchement d'une condition avec hystérésis (valeur, seuil, hystérésis) -> redevient fausse
+HYSTERESIS_RELEASE_FUNCS = {
+    '>': lambda v, t, h: v <= t - h,
+    '>=': lambda v, t, h: v < t - h,
+    '<': lambda v, t, h: v >= t + h,
+    '<=': lambda v, t, h: v > t + h,
+}
+
+
+class HysteresisCondition(SensorCondition):
+    """
+    Condition 'Capteur' avec bande morte: devient vraie quand valeur <op> seuil, et ne
+    redevient fausse qu'une fois la valeur sortie de la bande (ex: '>' 25 avec 1.0
+    d'hystérésis reste vraie jusqu'à <= 24).
+
+    L'état est mis à jour par RuleEngine à chaque changement de valeur du capteur
+    (update), y compris lorsque la règle n'est pas réévaluée (court-circuit ET/OU).
+    """
+    __slots__ = ('hysteresis', 'state', '_release')
+
+    def __init__(self, condition_id, sensor_id, operator_str, threshold, hysteresis):
+        super().__init__(condition_id, sensor_id, operator_str, threshold)
+        self.hysteresis = hysteresis
+        self.state = False
+        self._release = HYSTERESIS_RELEASE_FUNCS[operator_str]
+
+    def update(self, value):
+        """Met à jour l'état avec la nouvelle valeur du capteur (None = capteur absent)."""
+        if value is None:
+            self.state = False
+        elif self._compare(value, self.threshold):
+            self.state = True
+        elif self._release(value, self.threshold, self.hysteresis):
+            self.state = False
+        return self.state
+
+    def __call__(self, current_sensor_values, now_seconds):
+        return self.state
+
+
+class TimeCondition:
+    """Condition 'Heure' compilée: heure courante <op> HH:MM."""
+    __slots__ = ('condition_id', 'operator', 'minutes', '_seconds', '_compare')
+
+    def __init__(self, condition_id, operator_str, minutes):
+        self.condition_id = condition_id
+        self.operator = operator_str
+        self.minutes = minutes # Minutes depuis minuit
+        self._seconds = minutes * 60
+        self._compare = TIME_OPERATOR_FUNCS[operator_str]
+
+    def __call__(self, current_sensor_values, now_seconds):
+        return self._compare(now_seconds, self._seconds)
+
+
+class InvalidCondition:
+    """Condition rejetée à la compilation: toujours fausse (l'erreur est journalisée une seule fois)."""
+    __slots__ = ('condition_id', 'error')
+
+    def __init__(self, condition_id, error):
+        self.condition_id = condition_id
+        self.error = error
+
+    def __call__(self, current_sensor_values, now_seconds):
+        return False
+
+
+def _compile_sensor_comparison(condition_id, sensor_id, operator_str, condition_data, type_log):
+    """Compile la comparaison valeur <op> seuil (hystérésis optionnelle) d'une condition 'Capteur' ou 'Agrégat'."""
+    threshold = condition_data.get('threshold')
+    if threshold is None:
+        raise ValueError("capteur ou seuil manquant")
+    if operator_str not in SENSOR_OPERATOR_FUNCS:
+        raise ValueError(f"opérateur '{operator_str}' invalide pour {type_log}")
+    try:
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        raise ValueError(f"seuil '{threshold}' non numérique") from None
+    hysteresis = condition_data.get('hysteresis')
+    if hysteresis not in (None, ''):
+        try:
+            hysteresis = float(hysteresis)
+        except (TypeError, ValueError):
+            raise ValueError(f"hystérésis '{hysteresis}' non numérique") from None
+        if hysteresis < 0:
+            raise ValueError(f"hystérésis négative ({hysteresis})")
+        if hysteresis > 0:
+            if operator_str not in HYSTERESIS_RELEASE_FUNCS:
+                raise ValueError(f"hystérésis non supportée pour l'opérateur '{operator_str}'")
+            return HysteresisCondition(condition_id, sensor_id, operator_str, threshold, hysteresis)
+    return SensorCondition(condition_id, sensor_id, operator_str, threshold)
+
+
+def compile_condition(condition_data):
+    """
+    Valide et compile une condition de la configuration.
+
+    Raises:
+        ValueError: si la condition est incomplète ou invalide.
+    """
+    if not isinstance(condition_data, dict):
+        raise ValueError(f"condition invalide (dict attendu): {condition_data!r}")
+    cond_type = condition_data.get('type')
+    operator_str = condition_data.get('operator')
+    condition_id = condition_data.get('condition_id', 'N/A')
+    if not cond_type or not operator_str:
+        raise ValueError("type ou opérateur manquant")
+
+    if cond_type == 'Capteur':
+        sensor_id = condition_data.get('id')
+        if sensor_id is None:
+            raise ValueError("capteur ou seuil manquant")
+        return _compile_sensor_comparison(condition_id, sensor_id, operator_str, condition_data, cond_type)
+
+    if cond_type == 'Agrégat':
+        # Moyenne / min / max glissant: condition 'Capteur' sur le capteur virtuel correspondant
+        sensor_id = condition_data.get('id')
+        function = condition_data.get('function')
+        window = condition_data.get('window')
+        if sensor_id is None or window in (None, ''):
+            raise ValueError("capteur ou fenêtre manquant")
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"fonction d'agrégat '{function}' inconnue (attendu: {', '.join(AGGREGATE_FUNCTIONS)})")
+        try:
+            window = float(window)
+        except (TypeError, ValueError):
+            raise ValueError(f"fenêtre '{window}' non numérique") from None
+        if window < 1 or window != int(window):
+            raise ValueError(f"fenêtre invalide ({window} s, entier >= 1 attendu)")
+        return _compile_sensor_comparison(condition_id, aggregate_key(function, sensor_id, window),
+                                          operator_str, condition_data, cond_type)
+
+    if cond_type == 'Heure':
+        time_str = condition_data.get('value')
+        if not time_str:
+            raise ValueError("heure manquante")
+        if operator_str not in TIME_OPERATOR_FUNCS:
+            raise ValueError(f"opérateur '{operator_str}' invalide pour Heure")
+        try:
+            target_time = datetime.strptime(str(time_str), '%H:%M').time()
+        except ValueError:
+            raise ValueError(f"format heure invalide '{time_str}' (HH:MM attendu)") from None
+        return TimeCondition(condition_id, operator_str, target_time.hour * 60 + target_time.minute)
+
+    raise ValueError(f"type de condition inconnu '{cond_type}'")
+
+
+def compile_condition_safe(condition_data, rule_id_log=None):
+    """Compile une condition; une condition invalide devient une InvalidCondition (toujours fausse)."""
+    try:
+        return compile_condition(condition_data)
+    except ValueError as e:
+        condition_id = condition_data.get('condition_id', 'N/A') if isinstance(condition_data, dict) else 'N/A'
+        logging.warning(f"[COND CHECK] R{rule_id_log} Cond invalide ignorée (ID:{condition_id}): {e} - {condition_data}")
+        return InvalidCondition(condition_id, str(e))
+
+
+class ConditionGroup:
+    """Groupe de conditions compilées combinées par une logique ET / OU."""
+    __slots__ = ('logic', 'conditions')
+
+    def __init__(self, logic, conditions):
+        self.logic = logic
+        self.conditions = tuple(conditions)
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def evaluate(self, current_sensor_values, now_seconds, rule_id_log, group_type_log):
+        """Évalue le groupe (court-circuit ET/OU). Un groupe vide n'est jamais vrai."""
+        if not self.conditions:
+            return False
+        if self.logic == 'ET':
+            for cond in self.conditions:
+                if not cond(current_sensor_values, now_seconds):
+                    if logging.root.isEnabledFor(logging.DEBUG):
+                        logging.debug(f"[MONITORING] R{rule_id_log} {group_type_log}(ET) échoue sur CondID:{cond.condition_id}")
+                    return False
+            return True
+        if self.logic == 'OU':
+            for cond in self.conditions:
+                if cond(current_sensor_values, now_seconds):
+                    if logging.root.isEnabledFor(logging.DEBUG):
+                        logging.debug(f"[MONITORING] R{rule_id_log} {group_type_log}(OU) réussit sur CondID:{cond.condition_id}")
+                    return True
+            return False
+        return False # Logique inconnue (signalée à la compilation)
+
+
+def compile_group(conditions, logic, rule_id_log=None, group_type_log=''):
+    """Compile une liste de conditions (dicts ou conditions déjà compilées) en ConditionGroup."""
+    if logic not in LOGIC_OPERATORS and conditions:
+        logging.error(f"[MONITORING] R{rule_id_log}: Logique {group_type_log} inconnue '{logic}'.")
+    compiled = [cond if callable(cond) else compile_condition_safe(cond, rule_id_log)
+                for cond in (conditions or [])]
+    return ConditionGroup(logic, compiled)
+
+
+def _dwell_seconds(rule_data, key):
+    """Lit un temps de maintien (secondes >= 0) d'une règle; une valeur invalide vaut 0."""
+    value = rule_data.get(key)
+    if value in (None, ''):
+        return 0.0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        value = -1
+    if value < 0:
+        logging.warning(f"Règle {rule_data.get('id')}: '{key}' invalide ({rule_data.get(key)!r}), ignoré.")
+        return 0.0
+    return value
+
+
+class CompiledRule:
+    """Représentation compilée d'une règle (données extraites une fois pour toutes)."""
+
+    def __init__(self, rule_data, order):
+        self.rule = rule_data # Référence vers le dictionnaire de la configuration
+        self.order = order # Position de la règle (priorité entre règles d'une même prise)
+        self.rule_id = rule_data.get('id')
+        self.mac = rule_data.get('target_device_mac')
+        self.idx = rule_data.get('target_outlet_index')
+        self.action = rule_data.get('action')
+        self.trigger_logic = rule_data.get('trigger_logic', 'ET')
+        self.until_logic = rule_data.get('until_logic', 'OU')
+        self.trigger_group = compile_group(rule_data.get('conditions'), self.trigger_logic, self.rule_id, "SI")
+        self.until_group = compile_group(rule_data.get('until_conditions'), self.until_logic, self.rule_id, "UNTIL")
+
+        # Temps minimum de maintien de la prise (anti-cyclage), en secondes
+        self.min_on_seconds = _dwell_seconds(rule_data, 'min_on_seconds')
+        self.min_off_seconds = _dwell_seconds(rule_data, 'min_off_seconds')
+
+        # Dépendances de la règle (capteurs et heure)
+        self.sensor_ids = set()
+        self.uses_time = False
+        self.latches = [] # Conditions avec hystérésis (état mis à jour par le moteur)
+        for cond in self.trigger_group.conditions + self.until_group.conditions:
+            if isinstance(cond, SensorCondition):
+                self.sensor_ids.add(cond.sensor_id)
+                if isinstance(cond, HysteresisCondition):
+                    self.latches.append(cond)
+            elif isinstance(cond, TimeCondition):
+                self.uses_time = True
+
+        # Résultats mis en cache (None = à réévaluer)
+        self.trigger_result = None
+        self.until_result = None
+        # Position des groupes SI / JUSQU'À dans le backend vectorisé
+        self.trigger_gid = None
+        self.until_gid = None
+
+    @property
+    def outlet_key(self):
+        """Clé (mac, index) de la prise ciblée, ou None si la cible est incomplète."""
+        if self.mac is None or self.idx is None:
+            return None
+        return (self.mac, self.idx)
+
+    def invalidate(self):
+        """Oublie les résultats mis en cache (une entrée de la règle a changé)."""
+        self.trigger_result = None
+        self.until_result = None
+
+
+class RuleEngine:
+    """
+    Évalue les règles compilées et maintient l'état JUSQU'À entre les cycles.
+
+    backend: 'python' (évaluation groupe par groupe), 'numpy' (passe vectorisée sur
+    toutes les conditions) ou 'auto' (numpy si disponible et si le nombre de
+    conditions dépasse le point de croisement mesuré).
+    """
+
+    def __init__(self, backend='python'):
+        self._lock = threading.Lock() # Les règles sont modifiées depuis l'UI, évaluées depuis le monitoring
+        self.backend = backend if backend in EVALUATION_BACKENDS else 'python'
+        self._vectorized = None # VectorizedGroupEvaluator (backend numpy)
+        self._vectorized_stale = True
+        self._batch_results = None # Résultats des groupes du cycle courant (backend numpy)
+        self._outlets_by_sensor = {} # Index capteur -> prises (backend numpy)
+        self._time_outlets = set()
+        self._rules_by_id = {} # {rule_id: CompiledRule}
+        self._rules_by_outlet = {} # {(mac, index): [CompiledRule, ...]} trié par ordre
+        self._rules_by_sensor = {} # {sensor_id: set(rule_id)}
+        self._time_rules = set() # {rule_id} des règles avec une condition 'Heure'
+        self._latches_by_sensor = {} # {sensor_id: [HysteresisCondition, ...]}
+        self._next_order = 0
+        self._active_until = {} # {(mac, index): {rule_id: {'revert_action': ..., 'original_action': ..., 'seq': n}}}
+        self._activation_seq = 0 # Ordre global d'activation des JUSQU'À
+        self._desired = {} # {(mac, index): 'ON'/'OFF'} dernier état désiré calculé
+        self._dirty_outlets = set()
+        self._reverted_outlets = set() # Prises revenues à leur action de retour pendant l'appel en cours
+        self._last_sensor_values = {}
+        self._last_time_key = None
+        self._last_switch = {} # {(mac, index): (état bool, time.monotonic())} dernière commande envoyée
+        self._dwell_pending = {} # {(mac, index): échéance monotonic} commandes retardées par le temps de maintien
+
+    # --- Compilation ---
+    def load(self, rules):
+        """Compile (ou recompile) la liste complète des règles."""
+        with self._lock:
+            self._rules_by_id = {}
+            self._rules_by_outlet = {}
+            self._rules_by_sensor = {}
+            self._time_rules = set()
+            self._latches_by_sensor = {}
+            self._next_order = 0
+            self._vectorized_stale = True
+            for rule_data in rules:
+                if isinstance(rule_data, dict):
+                    self._add(rule_data, self._next_order)
+                    self._next_order += 1
+            self._prune_active_state()
+            self._dirty_outlets.update(self._rules_by_outlet)
+            self._dirty_outlets.update(self._desired)
+        logging.debug(f"Moteur de règles: {len(self._rules_by_id)} règles compilées, {len(self._rules_by_outlet)} prises gérées.")
+
+    def update_rule(self, rule_data):
+        """Recompile une seule règle (nouvelle ou modifiée) en conservant sa priorité."""
+        rule_id = rule_data.get('id')
+        with self._lock:
+            old = self._rules_by_id.get(rule_id)
+            if old:
+                order = old.order
+                self._remove(old)
+            else:
+                order = self._next_order
+                self._next_order += 1
+            self._add(rule_data, order)
+            self._prune_active_state()
+
+    def remove_rule(self, rule_id):
+        """Retire une règle du moteur."""
+        with self._lock:
+            old = self._rules_by_id.get(rule_id)
+            if old:
+                self._remove(old)
+                self._prune_active_state()
+
+    def _add(self, rule_data, order):
+        self._vectorized_stale = True
+        crule = CompiledRule(rule_data, order)
+        if crule.rule_id in self._rules_by_id:
+            logging.warning(f"Moteur de règles: ID de règle dupliqué {crule.rule_id}, seule la première est utilisée.")
+            return
+        self._rules_by_id[crule.rule_id] = crule
+        key = crule.outlet_key
+        if key is None:
+            return # Règle sans cible: jamais évaluée
+        bisect.insort(self._rules_by_outlet.setdefault(key, []), crule, key=lambda r: r.order)
+        for sensor_id in crule.sensor_ids:
+            self._rules_by_sensor.setdefault(sensor_id, set()).add(crule.rule_id)
+        if crule.uses_time:
+            self._time_rules.add(crule.rule_id)
+        for latch in crule.latches:
+            self._latches_by_sensor.setdefault(latch.sensor_id, []).append(latch)
+            latch.update(self._last_sensor_values.get(latch.sensor_id)) # Règle ajoutée en cours de monitoring
+        self._dirty_outlets.add(key)
+
+    def _remove(self, crule):
+        self._vectorized_stale = True
+        del self._rules_by_id[crule.rule_id]
+        key = crule.outlet_key
+        if key is None:
+            return
+        outlet_rules = self._rules_by_outlet.get(key, [])
+        if crule in outlet_rules:
+            outlet_rules.remove(crule)
+        if not outlet_rules:
+            self._rules_by_outlet.pop(key, None)
+        for sensor_id in crule.sensor_ids:
+            dependents = self._rules_by_sensor.get(sensor_id)
+            if dependents:
+                dependents.discard(crule.rule_id)
+                if not dependents:
+                    del self._rules_by_sensor[sensor_id]
+        self._time_rules.discard(crule.rule_id)
+        for latch in crule.latches:
+            latches = self._latches_by_sensor.get(latch.sensor_id)
+            if latches and latch in latches:
+                latches.remove(latch)
+                if not latches:
+                    del self._latches_by_sensor[latch.sensor_id]
+        self._dirty_outlets.add(key)
+
+    def _prune_active_state(self):
+        """Annule ou déplace les JUSQU'À actifs dont la règle a disparu ou changé de cible."""
+        for key, active in list(self._active_until.items()):
+            for rule_id, until_info in list(active.items()):
+                crule = self._rules_by_id.get(rule_id)
+                if crule is None:
+                    logging.warning(f"[MONITORING] R{rule_id} (UNTIL): Règle non trouvée. Annulation.")
+                    del active[rule_id]
+                elif crule.outlet_key is None:
+                    logging.warning(f"[MONITORING] R{rule_id} (UNTIL): Cible invalide. Annulation.")
+                    del active[rule_id]
+                elif crule.outlet_key != key:
+                    # La règle a changé de prise: son JUSQU'À la suit, dans l'ordre d'activation
+                    del active[rule_id]
+                    target = self._active_until.setdefault(crule.outlet_key, {})
+                    target[rule_id] = until_info
+                    self._active_until[crule.outlet_key] = dict(sorted(target.items(), key=lambda item: item[1]['seq']))
+                    self._dirty_outlets.add(crule.outlet_key)
+                else:
+                    continue
+                self._dirty_outlets.add(key)
+            if not active:
+                self._active_until.pop(key, None)
+
+    def set_backend(self, backend):
+        """Change le backend d'évaluation ('auto', 'python' ou 'numpy')."""
+        if backend not in EVALUATION_BACKENDS:
+            logging.error(f"Backend d'évaluation inconnu '{backend}', conservation de '{self.backend}'.")
+            return
+        with self._lock:
+            self.backend = backend
+            self._vectorized_stale = True
+
+    def _ensure_vectorized(self):
+        """(Re)construit le backend vectorisé si nécessaire; retourne None pour le backend Python."""
+        if self.backend == 'python':
+            return None
+        if not self._vectorized_stale:
+            return self._vectorized
+        self._vectorized_stale = False
+        if self._vectorized is not None:
+            # Retour possible au backend Python: les caches par règle n'ont pas été tenus à jour
+            for crule in self._rules_by_id.values():
+                crule.invalidate()
+            self._dirty_outlets.update(self._rules_by_outlet)
+        self._vectorized = None
+        from rule_engine_numpy import NUMPY_AVAILABLE, VECTORIZE_MIN_CONDITIONS, VectorizedGroupEvaluator
+        if not NUMPY_AVAILABLE:
+            if self.backend == 'numpy':
+                logging.warning("Backend d'évaluation 'numpy' demandé mais NumPy n'est pas installé. Utilisation du backend Python.")
+            return None
+        groups = []
+        outlets_by_sensor = {}
+        time_outlets = set()
+        for crule in self._rules_by_id.values():
+            if crule.outlet_key is None:
+                continue
+            crule.trigger_gid = len(groups)
+            groups.append(crule.trigger_group)
+            crule.until_gid = len(groups)
+            groups.append(crule.until_group)
+            for sensor_id in crule.sensor_ids:
+                outlets_by_sensor.setdefault(sensor_id, set()).add(crule.outlet_key)
+            if crule.uses_time:
+                time_outlets.add(crule.outlet_key)
+        n_conditions = sum(len(group) for group in groups)
+        if self.backend == 'auto' and n_conditions < VECTORIZE_MIN_CONDITIONS:
+            return None
+        self._outlets_by_sensor = outlets_by_sensor # {sensor_id: set((mac, index))}
+        self._time_outlets = time_outlets
+        self._vectorized = VectorizedGroupEvaluator(groups)
+        self._dirty_outlets.update(self._rules_by_outlet)
+        logging.info(f"Moteur de règles: backend vectorisé (NumPy) actif pour {n_conditions} conditions.")
+        return self._vectorized
+
+    # --- Accès ---
+    def get_rule(self, rule_id):
+        """Retourne le dictionnaire de la règle rule_id, ou None."""
+        crule = self._rules_by_id.get(rule_id)
+        return crule.rule if crule else None
+
+    def managed_outlets(self):
+        """Retourne l'ensemble des prises (mac, index) ciblées par au moins une règle."""
+        with self._lock:
+            return set(self._rules_by_outlet)
+
+    def sensor_ids(self):
+        """Retourne l'ensemble des IDs de capteurs utilisés par les règles."""
+        with self._lock:
+            return set(self._rules_by_sensor)
+
+    def compiled_conditions(self):
+        """Retourne les conditions compilées (SI et JUSQU'À) des règles qui ciblent une prise."""
+        with self._lock:
+            return [cond for crule in self._rules_by_id.values() if crule.outlet_key is not None
+                    for cond in crule.trigger_group.conditions + crule.until_group.conditions]
+
+    def has_pending_evaluation(self):
+        """
+        True si un changement d'état JUSQU'À impose de réévaluer des prises au prochain cycle.
+
+        evaluate() confirme déjà les activations dans le même appel: après evaluate(), c'est le
+        cas des prises dont une règle vient de revenir à son action de retour (visible un cycle).
+        """
+        return bool(self._dirty_outlets)
+
+    def active_until_rule_ids(self):
+        """Retourne les IDs des règles en attente de leur condition JUSQU'À."""
+        with self._lock:
+            return [rule_id for active in self._active_until.values() for rule_id in active]
+
+    def seconds_until_next_time_change(self, current_time_obj):
+        """
+        Retourne le délai (secondes) jusqu'au prochain instant HH:MM:00 où une condition
+        'Heure' d'une règle peut changer d'état, ou None si aucune règle ne dépend de l'heure.
+        """
+        return self.seconds_until_next_time_boundary(seconds_of_day(current_time_obj))
+
+    def seconds_until_next_time_boundary(self, now_seconds):
+        """Comme seconds_until_next_time_change(), avec l'heure en secondes depuis minuit."""
+        boundaries = self.time_boundaries()
+        if not boundaries:
+            return None
+        pos = bisect.bisect_right(boundaries, now_seconds)
+        next_boundary = boundaries[pos] if pos < len(boundaries) else boundaries[0] + 86400
+        return next_boundary - now_seconds
+
+    def time_boundaries(self):
+        """
+        Retourne la liste triée des instants (secondes depuis minuit) où une condition
+        'Heure' peut changer d'état, minuit compris; liste vide si aucune règle n'utilise l'heure.
+        """
+        with self._lock:
+            boundaries = set()
+            for rule_id in self._time_rules:
+                crule = self._rules_by_id[rule_id]
+                for cond in crule.trigger_group.conditions + crule.until_group.conditions:
+                    if isinstance(cond, TimeCondition):
+                        boundaries.add(cond.minutes * 60)
+                        if cond.operator in ('=', '!='):
+                            boundaries.add((cond.minutes + 1) * 60 % 86400) # Fin de la minute
+        if boundaries:
+            boundaries.add(0) # Passage de minuit
+        return sorted(boundaries)
+
+    # --- Temps de maintien (anti-cyclage) ---
+    def dwell_times(self, outlet_key):
+        """Retourne (min_on, min_off) en secondes pour une prise: le maximum des règles qui la ciblent."""
+        with self._lock:
+            rules = self._rules_by_outlet.get(outlet_key, ())
+            return (max((crule.min_on_seconds for crule in rules), default=0.0),
+                    max((crule.min_off_seconds for crule in rules), default=0.0))
+
+    def check_dwell(self, outlet_key, target_state, now_ts):
+        """
+        Vérifie qu'une commande vers target_state (bool) respecte le temps de maintien
+        de la prise depuis la dernière commande envoyée.
+
+        Returns:
+            float: 0 si la commande est permise, sinon le nombre de secondes restant.
+        """
+        last = self._last_switch.get(outlet_key)
+        if last is None or last[0] == target_state:
+            self._dwell_pending.pop(outlet_key, None)
+            return 0.0
+        min_on, min_off = self.dwell_times(outlet_key)
+        required = min_on if last[0] else min_off # Une prise allumée doit rester allumée min_on
+        remaining = last[1] + required - now_ts
+        if remaining <= 0:
+            self._dwell_pending.pop(outlet_key, None)
+            return 0.0
+        self._dwell_pending[outlet_key] = last[1] + required
+        return remaining
+
+    def record_switch(self, outlet_key, state, now_ts):
+        """Enregistre une commande envoyée à la prise (point de départ du temps de maintien)."""
+        self._last_switch[outlet_key] = (state, now_ts)
+        self._dwell_pending.pop(outlet_key, None)
+
+    def seconds_until_dwell_expiry(self, now_ts):
+        """Délai jusqu'à la fin du plus proche temps de maintien bloquant une commande, ou None."""
+        for key, deadline in list(self._dwell_pending.items()):
+            if deadline <= now_ts:
+                del self._dwell_pending[key] # Échéance passée: la commande sera revérifiée au prochain cycle
+        if not self._dwell_pending:
+            return None
+        return min(self._dwell_pending.values()) - now_ts
+
+    # --- Évaluation ---
+    def reset_state(self):
+        """Réinitialise l'état d'exécution (JUSQU'À actifs, caches), ex: au démarrage du monitoring."""
+        with self._lock:
+            self._active_until = {}
+            self._desired = {}
+            self._last_sensor_values = {}
+            self._last_time_key = None
+            self._last_switch = {}
+            self._dwell_pending = {}
+            self._dirty_outlets = set(self._rules_by_outlet)
+            for crule in self._rules_by_id.values():
+                crule.invalidate()
+                for latch in crule.latches:
+                    latch.state = False
+
+    def evaluate(self, current_sensor_values, current_time_obj):
+        """
+        Évalue les règles pour ce cycle et retourne les états désirés des prises.
+
+        Returns:
+            dict: {(mac, index): 'ON'/'OFF'} pour les prises dont une règle fixe l'état.
+        """
+        return self.evaluate_seconds(current_sensor_values, seconds_of_day(current_time_obj))
+
+    def evaluate_seconds(self, current_sensor_values, now_seconds):
+        """Comme evaluate(), avec l'heure en secondes depuis minuit (ex: rejeu hors ligne)."""
+        with self._lock:
+            self._reverted_outlets = set()
+            self._evaluate_pass(current_sensor_values, now_seconds)
+            # Une activation peut changer le résultat sans nouvelle valeur (JUSQU'À déjà rempli):
+            # la confirmer tout de suite. Un retour reste visible ce cycle, sa prise attend le suivant.
+            for _ in range(IMMEDIATE_REEVALUATIONS):
+                held = self._dirty_outlets & self._reverted_outlets
+                if self._dirty_outlets <= held:
+                    break
+                self._dirty_outlets -= held
+                self._evaluate_pass(current_sensor_values, now_seconds)
+                self._dirty_outlets |= held
+            return dict(self._desired)
+
+    def _evaluate_pass(self, current_sensor_values, now_seconds):
+        """Une passe d'évaluation: prises dont un capteur, l'heure ou l'état JUSQU'À a changé."""
+        # Capteurs dont la valeur a changé (apparition/disparition comprises)
+        last_values = self._last_sensor_values
+        changed_sensors = [
+            sensor_id for sensor_id in current_sensor_values.keys() | last_values.keys()
+            if current_sensor_values.get(sensor_id, _MISSING) != last_values.get(sensor_id, _MISSING)
+        ]
+        self._last_sensor_values = dict(current_sensor_values)
+        # Hystérésis: toutes les bandes mortes suivent leur capteur, même si la règle n'est pas réévaluée
+        for sensor_id in changed_sensors:
+            for latch in self._latches_by_sensor.get(sensor_id, ()):
+                latch.update(current_sensor_values.get(sensor_id))
+
+        current_time_key = time_key(now_seconds)
+        time_changed = current_time_key != self._last_time_key
+        self._last_time_key = current_time_key
+
+        dirty_outlets = self._dirty_outlets
+        self._dirty_outlets = set()
+        vectorized = self._ensure_vectorized()
+        if vectorized is not None:
+            # Backend vectorisé: pas de cache par règle, tous les groupes sont évalués en une passe
+            for sensor_id in changed_sensors:
+                dirty_outlets.update(self._outlets_by_sensor.get(sensor_id, ()))
+            if time_changed:
+                dirty_outlets.update(self._time_outlets)
+            if dirty_outlets:
+                self._batch_results = vectorized.evaluate(current_sensor_values, now_seconds).tolist()
+        else:
+            dirty_rule_ids = set()
+            for sensor_id in changed_sensors:
+                dirty_rule_ids.update(self._rules_by_sensor.get(sensor_id, ()))
+            if time_changed:
+                dirty_rule_ids.update(self._time_rules)
+            for rule_id in dirty_rule_ids:
+                crule = self._rules_by_id[rule_id]
+                crule.invalidate()
+                dirty_outlets.add(crule.outlet_key)
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"[MONITORING] Éval règles - {len(dirty_outlets)} prise(s) à réévaluer.")
+        for key in dirty_outlets:
+            if key in self._rules_by_outlet:
+                self._evaluate_outlet(key, current_sensor_values, now_seconds)
+            else:
+                # Plus aucune règle ne cible cette prise
+                self._desired.pop(key, None)
+                self._active_until.pop(key, None)
+        self._batch_results = None
+
+    def _evaluate_outlet(self, outlet_key, current_sensor_values, now_seconds):
+        """Recalcule l'état désiré d'une prise à partir des règles qui la ciblent."""
+        active = self._active_until.setdefault(outlet_key, {})
+        desired_state = None
+        state_changed = False
+
+        # --- Évaluation des conditions JUSQU'À actives ---
+        for rule_id, until_info in list(active.items()):
+            crule = self._rules_by_id[rule_id]
+            if not crule.until_group:
+                logging.debug(f"[MONITORING] R{rule_id} (UNTIL): Aucune condition. Désactivation.")
+                del active[rule_id]
+                state_changed = True
+                continue
+            if self._batch_results is not None:
+                until_met = self._batch_results[crule.until_gid]
+            else:
+                if crule.until_result is None:
+                    crule.until_result = crule.until_group.evaluate(current_sensor_values, now_seconds, rule_id, "UNTIL")
+                until_met = crule.until_result
+            if until_met:
+                revert_action = until_info['revert_action']
+                logging.info(f"[MONITORING] R{rule_id}: Condition JUSQU'À ({crule.until_logic}) REMPLIE (par Condition(s) UNTIL). Action retour: {revert_action}.")
+                # L'action de retour est prioritaire sur les conditions SI de ce cycle
+                desired_state = revert_action
+                del active[rule_id]
+                state_changed = True
+                self._reverted_outlets.add(outlet_key)
+
+        # --- Évaluation des conditions SI (la première règle remplie fixe l'état) ---
+        if desired_state is None:
+            for crule in self._rules_by_outlet[outlet_key]:
+                if not crule.rule_id or not crule.action or not crule.trigger_group:
+                    continue
+                if crule.rule_id in active:
+                    continue # Règle en attente de son JUSQU'À
+                if self._batch_results is not None:
+                    trigger_met = self._batch_results[crule.trigger_gid]
+                else:
+                    if crule.trigger_result is None:
+                        crule.trigger_result = crule.trigger_group.evaluate(current_sensor_values, now_seconds, crule.rule_id, "SI")
+                    trigger_met = crule.trigger_result
+                if trigger_met:
+                    logging.info(f"[MONITORING] R{crule.rule_id}: Condition SI ({crule.trigger_logic}) REMPLIE (par Condition(s) SI). Action désirée: {crule.action}.")
+                    desired_state = crule.action
+                    if crule.until_group:
+                        revert_action = 'OFF' if crule.action == 'ON' else 'ON'
+                        logging.info(f"[MONITORING] R{crule.rule_id}: Activation JUSQU'À ({crule.until_logic}). Action retour: {revert_action}.")
+                        self._activation_seq += 1
+                        active[crule.rule_id] = {'revert_action': revert_action, 'original_action': crule.action,
+                                                 'seq': self._activation_seq}
+                        state_changed = True
+                    break
+
+        # --- Maintien de l'état des règles actives (JUSQU'À non remplie) ---
+        if desired_state is None and active:
+            rule_id, until_info = next(iter(active.items()))
+            desired_state = until_info['original_action']
+            logging.debug(f"[MONITORING] R{rule_id}: Maintien état actif {desired_state} pour {outlet_key}")
+
+        if desired_state is None:
+            self._desired.pop(outlet_key, None)
+        else:
+            self._desired[outlet_key] = desired_state
+        if not active:
+            del self._active_until[outlet_key]
+        if state_changed:
+            # L'état JUSQU'À a changé: le résultat du prochain cycle peut différer
+            self._dirty_outlets.add(outlet_key)
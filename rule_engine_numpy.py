@@ -0,0 +1,194 @@
+# rule_engine_numpy.py
+"""
+Module rule_engine_numpy.py
+
+Backend d'évaluation vectorisé (NumPy, optionnel) pour les grands ensembles de règles.
+
+Toutes les conditions compilées de tous les groupes ET/OU sont rangées dans des
+tableaux NumPy (index du capteur, code opérateur, seuil, groupe). Un cycle
+d'évaluation se résume alors à quelques comparaisons vectorisées (une par
+opérateur) et à une réduction par groupe, au lieu d'une boucle Python par condition.
+
+Les résultats sont identiques à ceux de ConditionGroup.evaluate (mêmes
+comparaisons IEEE en float64, même tolérance pour '=' et '!=', capteur absent = faux).
+"""
+import logging
+import time
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from rule_engine import FLOAT_TOLERANCE, HysteresisCondition, SensorCondition, TimeCondition
+
+# Nombre de conditions à partir duquel le mode 'auto' bascule sur le backend vectorisé.
+# Le benchmark en bas de ce fichier donne un croisement vers 500-1000 conditions;
+# on garde une marge car en usage réel peu de capteurs changent à chaque cycle.
+VECTORIZE_MIN_CONDITIONS = 1000
+
+# Codes opérateurs
+_OP_FALSE, _OP_LT, _OP_GT, _OP_EQ, _OP_NE, _OP_LE, _OP_GE, _OP_TIME_EQ, _OP_TIME_NE = range(9)
+_SENSOR_OP_CODES = {'<': _OP_LT, '>': _OP_GT, '=': _OP_EQ, '!=': _OP_NE, '<=': _OP_LE, '>=': _OP_GE}
+_TIME_OP_CODES = {'<': _OP_LT, '>': _OP_GT, '=': _OP_TIME_EQ, '!=': _OP_TIME_NE, '<=': _OP_LE, '>=': _OP_GE}
+
+
+class VectorizedGroupEvaluator:
+    """Évalue en une passe vectorisée une liste de ConditionGroup."""
+
+    def __init__(self, groups):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy n'est pas installé: backend vectorisé indisponible.")
+
+        self.sensor_columns = {} # {sensor_id: colonne}; la dernière colonne contient l'heure
+        sensor_idx, op_codes, thresholds, group_starts, group_sizes = [], [], [], [], []
+        is_and, valid_groups = [], []
+        self._latches, latch_positions = [], [] # Conditions avec hystérésis: état tenu par le moteur
+
+        for gid, group in enumerate(groups):
+            if not group.conditions or group.logic not in ('ET', 'OU'):
+                continue # Groupe vide ou logique inconnue: toujours faux
+            valid_groups.append(gid)
+            is_and.append(group.logic == 'ET')
+            group_starts.append(len(op_codes))
+            group_sizes.append(len(group.conditions))
+            for cond in group.conditions:
+                if isinstance(cond, HysteresisCondition):
+                    latch_positions.append(len(op_codes))
+                    self._latches.append(cond)
+                    sensor_idx.append(-1)
+                    op_codes.append(_OP_FALSE) # Résultat recopié depuis cond.state
+                    thresholds.append(0.0)
+                elif isinstance(cond, SensorCondition):
+                    sensor_idx.append(self.sensor_columns.setdefault(cond.sensor_id, len(self.sensor_columns)))
+                    op_codes.append(_SENSOR_OP_CODES[cond.operator])
+                    thresholds.append(cond.threshold)
+                elif isinstance(cond, TimeCondition):
+                    sensor_idx.append(-1) # Colonne de l'heure (ajustée ci-dessous)
+                    op_codes.append(_TIME_OP_CODES[cond.operator])
+                    thresholds.append(cond.minutes * 60)
+                else:
+                    sensor_idx.append(-1)
+                    op_codes.append(_OP_FALSE)
+                    thresholds.append(0.0)
+
+        self.n_groups = len(groups)
+        self._time_column = len(self.sensor_columns)
+        self._sensor_ids = list(self.sensor_columns)
+        self._values = np.full(self._time_column + 1, np.nan, dtype=np.float64)
+
+        sensor_idx = np.array(sensor_idx, dtype=np.intp)
+        sensor_idx[sensor_idx < 0] = self._time_column
+        self._cond_sensor = sensor_idx
+        self._cond_threshold = np.array(thresholds, dtype=np.float64)
+        self._n_conditions = len(op_codes)
+        op_codes = np.array(op_codes, dtype=np.int8)
+        # Index des conditions pour chaque opérateur (une comparaison vectorisée par opérateur)
+        self._op_indices = [(code, np.flatnonzero(op_codes == code)) for code in range(1, 9)]
+        self._op_indices = [(code, idx) for code, idx in self._op_indices if idx.size]
+        self._latch_positions = np.array(latch_positions, dtype=np.intp)
+
+        self._valid_groups = np.array(valid_groups, dtype=np.intp)
+        self._group_starts = np.array(group_starts, dtype=np.intp)
+        self._group_sizes = np.array(group_sizes, dtype=np.int64)
+        self._group_is_and = np.array(is_and, dtype=bool)
+        logging.debug(f"Backend vectorisé: {self._n_conditions} conditions, {len(valid_groups)}/{self.n_groups} groupes, {len(self.sensor_columns)} capteurs.")
+
+    @property
+    def n_conditions(self):
+        return self._n_conditions
+
+    def evaluate(self, current_sensor_values, now_seconds):
+        """Retourne un tableau bool (un résultat par groupe, dans l'ordre de la liste fournie)."""
+        results = np.zeros(self.n_groups, dtype=bool)
+        if not self._n_conditions:
+            return results
+
+        values = self._values
+        get = current_sensor_values.get
+        for column, sensor_id in enumerate(self._sensor_ids):
+            value = get(sensor_id)
+            values[column] = np.nan if value is None else value
+        values[self._time_column] = now_seconds
+
+        # NaN (capteur absent) donne faux pour toutes les comparaisons, y compris '!=' (abs(NaN) >= tol est faux)
+        cond_values = values[self._cond_sensor]
+        thresholds = self._cond_threshold
+        cond_results = np.zeros(self._n_conditions, dtype=bool)
+        for code, idx in self._op_indices:
+            v, t = cond_values[idx], thresholds[idx]
+            if code == _OP_LT: cond_results[idx] = v < t
+            elif code == _OP_GT: cond_results[idx] = v > t
+            elif code == _OP_EQ: cond_results[idx] = np.abs(v - t) < FLOAT_TOLERANCE
+            elif code == _OP_NE: cond_results[idx] = np.abs(v - t) >= FLOAT_TOLERANCE
+            elif code == _OP_LE: cond_results[idx] = v <= t
+            elif code == _OP_GE: cond_results[idx] = v >= t
+            elif code == _OP_TIME_EQ: cond_results[idx] = np.floor_divide(v, 60) == np.floor_divide(t, 60)
+            elif code == _OP_TIME_NE: cond_results[idx] = np.floor_divide(v, 60) != np.floor_divide(t, 60)
+        if self._latches:
+            cond_results[self._latch_positions] = [latch.state for latch in self._latches]
+
+        # Réduction par groupe: nombre de conditions vraies
+        true_counts = np.add.reduceat(cond_results.astype(np.int64), self._group_starts)
+        results[self._valid_groups] = np.where(self._group_is_and,
+                                               true_counts == self._group_sizes,
+                                               true_counts > 0)
+        return results
+
+
+# --- Benchmark: point de croisement Python / NumPy ---
+if __name__ == '__main__':
+    import random
+    from datetime import datetime
+    from rule_engine import RuleEngine
+
+    logging.basicConfig(level=logging.WARNING)
+    if not NUMPY_AVAILABLE:
+        print("NumPy non disponible: impossible d'exécuter le benchmark.")
+        raise SystemExit(1)
+
+    def make_rules(n_rules, n_sensors, n_outlets, rng):
+        """Génère des règles aléatoires (2 conditions SI, 1 condition JUSQU'À sur 3)."""
+        def condition():
+            if rng.random() < 0.85:
+                return {'type': 'Capteur', 'id': f"s{rng.randrange(n_sensors)}",
+                        'operator': rng.choice(list(_SENSOR_OP_CODES)), 'threshold': rng.uniform(0, 40)}
+            return {'type': 'Heure', 'operator': rng.choice(list(_TIME_OP_CODES)),
+                    'value': f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"}
+        rules = []
+        for i in range(n_rules):
+            outlet = rng.randrange(n_outlets)
+            rules.append({'id': f"r{i}", 'trigger_logic': rng.choice(['ET', 'OU']),
+                          'conditions': [condition() for _ in range(2)],
+                          'until_logic': 'OU', 'until_conditions': [condition()] if rng.random() < 0.33 else [],
+                          'target_device_mac': f"mac{outlet // 3}", 'target_outlet_index': outlet % 3,
+                          'action': rng.choice(['ON', 'OFF'])})
+        return rules
+
+    def time_backend(backend, rules, samples):
+        engine = RuleEngine(backend=backend)
+        engine.load(rules)
+        engine.reset_state()
+        start = time.perf_counter()
+        outputs = [engine.evaluate(values, now) for values, now in samples]
+        return (time.perf_counter() - start) / len(samples), outputs
+
+    rng = random.Random(42)
+    n_sensors, n_cycles = 16, 50
+    print(f"{'règles':>8} {'conditions':>11} {'python (ms)':>12} {'numpy (ms)':>11}")
+    crossover = None
+    for n_rules in (50, 100, 250, 500, 1000, 2500, 5000, 10000):
+        rules = make_rules(n_rules, n_sensors, max(3, n_rules // 20), rng)
+        now = datetime.now()
+        # Tous les capteurs changent à chaque cycle (pire cas pour l'évaluation incrémentale)
+        samples = [({f"s{i}": rng.uniform(0, 40) for i in range(n_sensors)}, now.time()) for _ in range(n_cycles)]
+        t_python, out_python = time_backend('python', rules, samples)
+        t_numpy, out_numpy = time_backend('numpy', rules, samples)
+        assert out_python == out_numpy, "Résultats différents entre les backends!"
+        n_conditions = sum(len(r['conditions']) + len(r['until_conditions']) for r in rules)
+        print(f"{n_rules:>8} {n_conditions:>11} {t_python * 1000:>12.3f} {t_numpy * 1000:>11.3f}")
+        if crossover is None and t_numpy < t_python:
+            crossover = n_conditions
+    print(f"Point de croisement: ~{crossover} conditions" if crossover else "NumPy n'est jamais plus rapide sur cette machine.")
@@ -0,0 +1,444 @@
+# rule_simulator.py
+"""
+Module rule_simulator.py
+
+Rejeu hors ligne des règles de config.yaml sur un enregistrement (ou une
+simulation) de valeurs de capteurs, sans Tkinter, sans attente et sans appareil.
+
+Le simulateur utilise le même moteur (rule_engine.RuleEngine) et la même décision
+de commande (rule_engine.outlet_command, temps de maintien compris) que
+_async_monitoring_task: SI / JUSQU'À / maintien / OFF implicite. Il reproduit
+aussi les réveils de la boucle: à chaque nouvelle valeur de capteur, à chaque
+frontière horaire HH:MM:00 d'une condition 'Heure' et à la fin d'un temps de maintien.
+Les prises simulées exécutent toujours les commandes reçues.
+
+Avec NumPy (run_arrays), les résultats de toutes les conditions sont d'abord
+calculés sur toute la trace en une passe vectorisée; le moteur n'est ensuite
+exécuté qu'aux échantillons où une condition change de résultat (plus les
+réévaluations qu'il demande lui-même). Le résultat est identique à run(), qui
+exécute un cycle à chaque nouvel échantillon, mais un mois de données à 2 s
+se rejoue en quelques secondes.
+
+Format de la trace (CSV, une colonne par capteur, cellule vide = capteur absent):
+    timestamp,28-0000000001,0x23
+    2024-05-01T00:00:00,18.5,0
+    1714521602,18.56,0
+
+Exemples:
+    python rule_simulator.py --trace mesures.csv --output commandes.csv
+    python rule_simulator.py --synthetic-days 30 --interval 2
+"""
+import argparse
+import bisect
+import csv
+import logging
+import math
+import sys
+import time
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from config_manager import load_config, DEFAULT_CONFIG_FILE
+from rule_engine import (RuleEngine, outlet_command, FLOAT_TOLERANCE, HYSTERESIS_RELEASE_FUNCS,
+                         HysteresisCondition, SensorCondition, TimeCondition, PENDING_RETRY_DELAY)
+from window_aggregates import AggregateTracker, aggregate_columns, base_sensor_ids
+
+
+class RuleSimulator:
+    """Rejoue une suite d'échantillons (timestamp, {capteur: valeur}) sur un ensemble de règles."""
+
+    def __init__(self, rules, backend='auto', initial_outlet_state=False):
+        """
+        Args:
+            rules (list): Règles (format de config.yaml).
+            backend (str): Backend d'évaluation du moteur ('auto', 'python', 'numpy').
+            initial_outlet_state: État initial des prises simulées (False, True ou None = inconnu).
+        """
+        self.engine = RuleEngine(backend=backend)
+        self.engine.load(rules)
+        self.managed_outlets = sorted(self.engine.managed_outlets(), key=str)
+        self.initial_outlet_state = initial_outlet_state
+        self._boundaries = self.engine.time_boundaries() # Secondes depuis minuit (triées)
+        self.cycles = 0 # Nombre d'évaluations effectuées
+        self.next_wake = math.inf # Prochaine frontière horaire / fin de temps de maintien (timestamp)
+
+    def _reset(self, on_command):
+        self.engine.reset_state()
+        self.cycles = 0
+        self.next_wake = math.inf
+        self._live_states = {key: self.initial_outlet_state for key in self.managed_outlets}
+        self._on_command = on_command or (lambda *args: None)
+        self._day = _LocalDay()
+        self._last_desired = None
+        self._dwell_pending = False # Une commande attend la fin d'un temps de maintien
+        self._aggregates = AggregateTracker() # Capteurs virtuels des conditions 'Agrégat', comme en direct
+        self._aggregates.set_keys(self.engine.sensor_ids())
+
+    def _cycle(self, ts, values):
+        """Un cycle de _async_monitoring_task (étapes 3 à 6) à l'instant ts."""
+        engine = self.engine
+        self.cycles += 1
+        now_seconds = self._day.seconds_of_day(ts)
+        desired = engine.evaluate_seconds(values, now_seconds)
+        dwell_deadline = None
+        # Les prises simulées suivent les commandes: sans changement d'état désiré ni
+        # commande retardée, l'étape 4 n'enverrait rien
+        if desired != self._last_desired or self._dwell_pending:
+            self._last_desired = desired
+            live_states = self._live_states
+            for key in self.managed_outlets:
+                command = outlet_command(desired.get(key), live_states[key])
+                if command is None:
+                    continue
+                target_state, implicit_off = command
+                if engine.check_dwell(key, target_state, ts) > 0:
+                    continue # Commande retardée (temps de maintien)
+                live_states[key] = target_state
+                engine.record_switch(key, target_state, ts)
+                self._on_command(ts, key[0], key[1], target_state, implicit_off)
+            dwell_deadline = engine.seconds_until_dwell_expiry(ts)
+            self._dwell_pending = dwell_deadline is not None
+        # Prochain réveil sans nouvelle valeur de capteur
+        next_wake = math.inf
+        if self._boundaries:
+            pos = bisect.bisect_right(self._boundaries, now_seconds)
+            if pos < len(self._boundaries):
+                next_wake = ts + self._boundaries[pos] - now_seconds
+            else:
+                next_wake = self._day.next_midnight(ts)
+        if dwell_deadline is not None:
+            next_wake = min(next_wake, ts + dwell_deadline)
+        if engine.has_pending_evaluation():
+            next_wake = min(next_wake, ts + PENDING_RETRY_DELAY) # Cycle suivant un retour JUSQU'À
+        self.next_wake = next_wake
+
+    def run(self, samples, on_command=None):
+        """
+        Rejoue les échantillons un par un (timestamps croissants, secondes epoch, heure locale).
+
+        Args:
+            samples: itérable de (timestamp, {sensor_id: valeur}).
+            on_command: appelé pour chaque commande avec (timestamp, mac, index, état bool, implicite bool).
+
+        Returns:
+            int: nombre d'échantillons traités.
+        """
+        self._reset(on_command)
+        last_values = None
+        n_samples = 0
+        for ts, values in samples:
+            n_samples += 1
+            if self._aggregates:
+                values = {**values, **self._aggregates.update(ts, values)}
+            # Réveils intermédiaires (frontières horaires, fins de temps de maintien) avec les dernières valeurs
+            while self.next_wake <= ts:
+                self._cycle(self.next_wake, last_values)
+            if values != last_values:
+                last_values = values
+                self._cycle(ts, values)
+        return n_samples
+
+    def run_arrays(self, timestamps, sensor_ids, values, on_command=None):
+        """
+        Comme run(), pour une trace sous forme de tableaux NumPy, en n'exécutant le moteur
+        qu'aux échantillons où son résultat peut changer.
+
+        Args:
+            timestamps: tableau (n,) de timestamps croissants.
+            sensor_ids (list): IDs des capteurs (colonnes de values).
+            values: tableau (n, nb capteurs) float64, NaN = capteur absent.
+
+        Returns:
+            int: nombre d'échantillons traités.
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy n'est pas installé: utilisez run().")
+        self._reset(on_command)
+        n_samples = len(timestamps)
+        if n_samples == 0:
+            return 0
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(n_samples, len(sensor_ids))
+        # Colonnes des capteurs virtuels (agrégats glissants), calculées une fois sur toute la trace
+        sensor_ids, values = aggregate_columns(self.engine.sensor_ids(), timestamps, sensor_ids, values)
+
+        # Échantillons dont une valeur a changé (réveil de la boucle réelle) ...
+        previous, current = values[:-1], values[1:]
+        raw_changed = np.ones(n_samples, dtype=bool)
+        raw_changed[1:] = ((previous != current) & ~(np.isnan(previous) & np.isnan(current))).any(axis=1)
+        # ... et, parmi eux, ceux où au moins une condition change de résultat
+        condition_changed = raw_changed & _condition_change_mask(self.engine.compiled_conditions(), sensor_ids,
+                                                                 values, _seconds_of_day_array(timestamps))
+        candidates = np.flatnonzero(condition_changed).tolist()
+        raw_indices = np.flatnonzero(raw_changed).tolist()
+        timestamp_list = timestamps.tolist()
+        last_ts = timestamp_list[-1]
+
+        def row_values(index):
+            return {sensor_id: v for sensor_id, v in zip(sensor_ids, values[index].tolist()) if v == v}
+
+        current_index = -1 # Dernier échantillon déjà pris en compte
+        while True:
+            pos = bisect.bisect_right(candidates, current_index)
+            next_index = candidates[pos] if pos < len(candidates) else None
+            if self.engine.has_pending_evaluation():
+                # Le moteur doit réévaluer au prochain réveil: prochaine valeur modifiée
+                pos = bisect.bisect_right(raw_indices, current_index)
+                if pos < len(raw_indices) and (next_index is None or raw_indices[pos] < next_index):
+                    next_index = raw_indices[pos]
+            next_ts = timestamp_list[next_index] if next_index is not None else last_ts
+            if self.next_wake <= next_ts:
+                # Réveil (frontière horaire / temps de maintien) avec le dernier échantillon reçu
+                wake_index = bisect.bisect_left(timestamp_list, self.next_wake) - 1
+                current_index = max(current_index, wake_index)
+                self._cycle(self.next_wake, row_values(wake_index))
+            elif next_index is not None:
+                current_index = next_index
+                self._cycle(timestamp_list[next_index], row_values(next_index))
+            else:
+                break
+        return n_samples
+
+
+class _LocalDay:
+    """Conversion rapide timestamp -> secondes depuis minuit (heure locale), avec cache par jour."""
+
+    def __init__(self):
+        self.start = self.end = None
+        self.exact = False # Jour de changement d'heure: conversion exacte à chaque appel
+
+    def _load(self, ts):
+        midnight = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = midnight.timestamp()
+        self.end = (midnight + timedelta(days=1)).timestamp()
+        self.exact = self.end - self.start != 86400
+
+    def seconds_of_day(self, ts):
+        if self.start is None or not self.start <= ts < self.end:
+            self._load(ts)
+        if self.exact:
+            return _exact_seconds_of_day(ts)
+        return ts - self.start
+
+    def next_midnight(self, ts):
+        if self.start is None or not self.start <= ts < self.end:
+            self._load(ts)
+        return self.end
+
+
+def _exact_seconds_of_day(ts):
+    local = datetime.fromtimestamp(ts)
+    return local.hour * 3600 + local.minute * 60 + local.second + local.microsecond / 1_000_000
+
+
+# --- Pré-calcul vectorisé des conditions (NumPy) ---
+def _seconds_of_day_array(timestamps):
+    """Secondes depuis minuit pour chaque timestamp (mêmes valeurs que _LocalDay.seconds_of_day)."""
+    result = np.empty_like(timestamps)
+    day = _LocalDay()
+    start = 0
+    while start < len(timestamps):
+        day.seconds_of_day(timestamps[start].item())
+        end = int(np.searchsorted(timestamps, day.end, side='left'))
+        if day.exact:
+            result[start:end] = [_exact_seconds_of_day(ts) for ts in timestamps[start:end].tolist()]
+        else:
+            result[start:end] = timestamps[start:end] - day.start
+        start = end
+    return result
+
+
+_NUMPY_SENSOR_OPS = {
+    '<': lambda v, t: v < t,
+    '>': lambda v, t: v > t,
+    '=': lambda v, t: np.abs(v - t) < FLOAT_TOLERANCE,
+    '!=': lambda v, t: np.abs(v - t) >= FLOAT_TOLERANCE,
+    '<=': lambda v, t: v <= t,
+    '>=': lambda v, t: v >= t,
+}
+_NUMPY_TIME_OPS = dict(_NUMPY_SENSOR_OPS)
+_NUMPY_TIME_OPS['='] = lambda s, t: np.floor_divide(s, 60) == t // 60
+_NUMPY_TIME_OPS['!='] = lambda s, t: np.floor_divide(s, 60) != t // 60
+
+
+def _condition_change_mask(conditions, sensor_ids, values, seconds_of_day):
+    """Retourne un masque bool (n,): True là où au moins une condition change de résultat."""
+    n_samples = len(seconds_of_day)
+    changed = np.zeros(n_samples, dtype=bool)
+    changed[0] = True
+    columns = {sensor_id: j for j, sensor_id in enumerate(sensor_ids)}
+    seen = set()
+    with np.errstate(invalid='ignore'): # NaN (capteur absent): toutes les comparaisons sont fausses
+        for cond in conditions:
+            if id(cond) in seen:
+                continue
+            seen.add(id(cond))
+            if isinstance(cond, SensorCondition):
+                if cond.sensor_id not in columns:
+                    continue # Capteur jamais présent: condition toujours fausse
+                column = values[:, columns[cond.sensor_id]]
+                result = _NUMPY_SENSOR_OPS[cond.operator](column, cond.threshold)
+                if isinstance(cond, HysteresisCondition):
+                    result = _latch_series(cond, column, result)
+            elif isinstance(cond, TimeCondition):
+                result = _NUMPY_TIME_OPS[cond.operator](seconds_of_day, cond.minutes * 60)
+            else:
+                continue # Condition invalide: toujours fausse
+            changed[1:] |= result[1:] != result[:-1]
+    return changed
+
+
+def _latch_series(cond, column, set_mask):
+    """État d'une condition avec hystérésis à chaque échantillon (report du dernier basculement)."""
+    release_mask = HYSTERESIS_RELEASE_FUNCS[cond.operator](column, cond.threshold, cond.hysteresis) | np.isnan(column)
+    event_index = np.where(set_mask | release_mask, np.arange(len(column)), -1)
+    last_event = np.maximum.accumulate(event_index)
+    return np.where(last_event >= 0, set_mask[np.maximum(last_event, 0)], False)
+
+
+# --- Sources d'échantillons ---
+def read_csv_trace(path):
+    """Lit une trace CSV (voir en-tête du module) et produit des (timestamp, {sensor_id: valeur})."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        sensor_ids = header[1:]
+        for line_number, row in enumerate(reader, start=2):
+            if not row:
+                continue
+            try:
+                ts = _parse_timestamp(row[0])
+                values = {sensor_id: float(cell) for sensor_id, cell in zip(sensor_ids, row[1:]) if cell}
+            except ValueError as e:
+                logging.warning(f"Trace {path}, ligne {line_number} ignorée: {e}")
+                continue
+            yield ts, values
+
+
+def load_csv_trace(path):
+    """Lit une trace CSV en tableaux NumPy: (timestamps, sensor_ids, valeurs avec NaN = absent)."""
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), None) or ['timestamp']
+    sensor_ids = header[1:]
+    timestamps, rows = [], []
+    nan = float('nan')
+    for ts, sample in read_csv_trace(path):
+        timestamps.append(ts)
+        rows.append([sample.get(sensor_id, nan) for sensor_id in sensor_ids])
+    return (np.array(timestamps, dtype=np.float64), sensor_ids,
+            np.array(rows, dtype=np.float64).reshape(len(timestamps), len(sensor_ids)))
+
+
+def iter_samples(timestamps, sensor_ids, values):
+    """Convertit une trace en tableaux en échantillons (timestamp, {sensor_id: valeur}) pour run()."""
+    for ts, row in zip(timestamps.tolist(), values.tolist()):
+        yield ts, {sensor_id: v for sensor_id, v in zip(sensor_ids, row) if v == v}
+
+
+def _parse_timestamp(text):
+    """Timestamp epoch (secondes) ou date ISO 8601 (heure locale si sans fuseau)."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def synthetic_trace(sensor_ids, start, days, interval=2.0, seed=0):
+    """
+    Génère une trace synthétique (tableaux NumPy): température journalière sinusoïdale
+    + dérive aléatoire pour les sondes, courbe jour/nuit pour les capteurs de lumière (IDs '0x..').
+
+    Returns:
+        tuple: (timestamps, sensor_ids, valeurs)
+    """
+    rng = np.random.default_rng(seed)
+    sensor_ids = sorted(sensor_ids)
+    timestamps = start.timestamp() + np.arange(0, days * 86400, interval, dtype=np.float64)
+    phase = _seconds_of_day_array(timestamps) * (2 * math.pi / 86400)
+    kernel = 0.995 ** np.arange(600) # Dérive lente (bruit filtré)
+    values = np.empty((len(timestamps), len(sensor_ids)), dtype=np.float64)
+    for j, sensor_id in enumerate(sensor_ids):
+        drift = np.convolve(rng.normal(0, 0.05, len(timestamps)), kernel)[:len(timestamps)]
+        if sensor_id.startswith('0x'):
+            values[:, j] = np.round(np.maximum(0.0, -np.cos(phase) * 20000 * (1 + drift / 10)), 1)
+        else:
+            values[:, j] = np.round(20 - 6 * np.cos(phase - 0.5) + drift, 2)
+    return timestamps, sensor_ids, values
+
+# --- Ligne de commande ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejoue les règles de la configuration sur une trace de capteurs.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_FILE, help="Fichier de configuration (règles et alias).")
+    parser.add_argument('--trace', help="Trace CSV à rejouer (timestamp + une colonne par capteur).")
+    parser.add_argument('--synthetic-days', type=float, default=0, help="Sans --trace: nombre de jours de trace synthétique.")
+    parser.add_argument('--interval', type=float, default=2.0, help="Intervalle (s) de la trace synthétique.")
+    parser.add_argument('--start', default=None, help="Début de la trace synthétique (ISO 8601, défaut: aujourd'hui 00:00).")
+    parser.add_argument('--seed', type=int, default=0, help="Graine de la trace synthétique.")
+    parser.add_argument('--backend', default='auto', choices=('auto', 'python', 'numpy'), help="Backend du moteur de règles.")
+    parser.add_argument('--initial-state', default='off', choices=('off', 'on', 'unknown'), help="État initial des prises simulées.")
+    parser.add_argument('--output', default='-', help="Fichier CSV de la chronologie des commandes ('-' = sortie standard).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    config = load_config(args.config)
+    aliases = config.get('aliases', {})
+    rules = [rule for rule in config.get('rules', []) if isinstance(rule, dict)]
+    initial_state = {'off': False, 'on': True, 'unknown': None}[args.initial_state]
+    simulator = RuleSimulator(rules, backend=args.backend, initial_outlet_state=initial_state)
+
+    if not args.trace and args.synthetic_days <= 0:
+        parser.error("--trace ou --synthetic-days est requis.")
+    if not NUMPY_AVAILABLE and not args.trace:
+        parser.error("La trace synthétique nécessite NumPy.")
+
+    load_start = time.perf_counter()
+    trace = None
+    if args.trace and NUMPY_AVAILABLE:
+        trace = load_csv_trace(args.trace)
+    elif not args.trace:
+        start = datetime.fromisoformat(args.start) if args.start else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        trace = synthetic_trace(base_sensor_ids(simulator.engine.sensor_ids()), start, args.synthetic_days, args.interval, args.seed)
+    load_elapsed = time.perf_counter() - load_start
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    writer = csv.writer(output)
+    writer.writerow(['timestamp', 'mac', 'outlet_index', 'device', 'outlet', 'command', 'implicit'])
+    counts = {}
+
+    def on_command(ts, mac, index, state, implicit_off):
+        counts[(mac, index)] = counts.get((mac, index), 0) + 1
+        writer.writerow([datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'), mac, index,
+                         aliases.get('devices', {}).get(mac, mac),
+                         aliases.get('outlets', {}).get(mac, {}).get(str(index), f"Prise {index}"),
+                         'ON' if state else 'OFF', int(implicit_off)])
+
+    start_time = time.perf_counter()
+    try:
+        if trace is not None:
+            n_samples = simulator.run_arrays(*trace, on_command=on_command)
+        else:
+            n_samples = simulator.run(read_csv_trace(args.trace), on_command) # Sans NumPy: lecture en continu
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start_time
+
+    # Résumé sur la sortie d'erreur (la sortie standard peut contenir la chronologie)
+    rate = n_samples / elapsed if elapsed > 0 else float('inf')
+    print(f"{n_samples} échantillons, {simulator.cycles} cycles, {sum(counts.values())} commandes "
+          f"en {elapsed:.2f} s ({rate:,.0f} échantillons/s; chargement de la trace: {load_elapsed:.2f} s).", file=sys.stderr)
+    for (mac, index), count in sorted(counts.items(), key=str):
+        print(f"  {aliases.get('devices', {}).get(mac, mac)} / prise {index}: {count} commandes", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
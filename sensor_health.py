@@ -0,0 +1,115 @@
+# sensor_health.py
+# -----------------------------------------------------------
+# Suivi de l'état de santé des capteurs (échecs consécutifs, dernière
+# lecture valide) et reprise avec attente exponentielle: un capteur
+# défaillant n'est plus relu à chaque cycle ni journalisé à chaque échec.
+# -----------------------------------------------------------
+import logging
+import time
+
+# Délais de reprise par défaut (s): premier délai, plafond et facteur multiplicatif
+DEFAULT_BASE_DELAY = 5.0
+DEFAULT_MAX_DELAY = 300.0
+DEFAULT_BACKOFF_FACTOR = 2.0
+
+class Backoff:
+    """Échéancier de nouvelle tentative: délai = base * facteur^(échecs-1), plafonné."""
+    __slots__ = ('base_delay', 'max_delay', 'factor', 'failures', 'retry_at')
+
+    def __init__(self, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 factor: float = DEFAULT_BACKOFF_FACTOR):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.failures = 0
+        self.retry_at = 0.0 # Instant monotonic à partir duquel une tentative est permise
+
+    def ready(self, now: float | None = None) -> bool:
+        return (time.monotonic() if now is None else now) >= self.retry_at
+
+    def success(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def failure(self, now: float | None = None) -> float:
+        """Enregistre un échec et retourne le délai avant la prochaine tentative."""
+        self.failures += 1
+        delay = min(self.max_delay, self.base_delay * self.factor ** (self.failures - 1))
+        self.retry_at = (time.monotonic() if now is None else now) + delay
+        return delay
+
+class SensorHealth(Backoff):
+    """Backoff d'un capteur, avec sa dernière lecture valide."""
+    __slots__ = ('last_good_value', 'last_good_time')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_good_value = None
+        self.last_good_time = None # time.time() de la dernière lecture valide
+
+    @property
+    def healthy(self) -> bool:
+        return self.failures == 0
+
+class SensorHealthTracker:
+    """
+    État de santé par capteur. Les journaux sont limités: un avertissement au premier échec,
+    au passage au délai maximal et au rétablissement; les échecs intermédiaires sont en DEBUG.
+    """
+    def __init__(self, label: str = "Capteur", base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, factor: float = DEFAULT_BACKOFF_FACTOR):
+        self.label = label
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self._health = {} # {sensor_id: SensorHealth}
+
+    def get(self, sensor_id) -> SensorHealth:
+        health = self._health.get(sensor_id)
+        if health is None:
+            health = self._health[sensor_id] = SensorHealth(self.base_delay, self.max_delay, self.factor)
+        return health
+
+    def should_read(self, sensor_id, now: float | None = None) -> bool:
+        """False tant que le délai de reprise d'un capteur défaillant n'est pas écoulé."""
+        health = self._health.get(sensor_id)
+        return health is None or health.ready(now)
+
+    def record_success(self, sensor_id, value):
+        health = self.get(sensor_id)
+        if health.failures:
+            logging.info(f"{self.label} {sensor_id} rétabli après {health.failures} échec(s).")
+        health.success()
+        health.last_good_value = value
+        health.last_good_time = time.time()
+
+    def record_failure(self, sensor_id, error) -> float:
+        """Enregistre un échec (journalisation limitée) et retourne le délai avant la prochaine tentative."""
+        health = self.get(sensor_id)
+        delay = health.failure()
+        if health.failures == 1:
+            logging.warning(f"{self.label} {sensor_id} en échec ({error}), nouvel essai dans {delay:.0f} s.")
+        elif delay >= self.max_delay and health.failures == self._failures_to_max():
+            logging.warning(f"{self.label} {sensor_id} toujours en échec après {health.failures} essais ({error}), "
+                            f"nouvel essai toutes les {delay:.0f} s.")
+        else:
+            logging.debug(f"{self.label} {sensor_id} en échec ({health.failures}x: {error}), nouvel essai dans {delay:.0f} s.")
+        return delay
+
+    def unhealthy(self) -> dict:
+        """{sensor_id: SensorHealth} des capteurs actuellement en échec."""
+        return {sensor_id: health for sensor_id, health in self._health.items() if not health.healthy}
+
+    def retain(self, sensor_ids):
+        """Oublie l'état des capteurs qui ne font plus partie de `sensor_ids` (après redécouverte)."""
+        keep = set(sensor_ids)
+        for sensor_id in [s for s in self._health if s not in keep]:
+            del self._health[sensor_id]
+
+    def _failures_to_max(self) -> int:
+        """Nombre d'échecs consécutifs à partir duquel le délai atteint le plafond."""
+        failures, delay = 1, self.base_delay
+        while delay < self.max_delay and self.factor > 1:
+            failures += 1
+            delay *= self.factor
+        return failures
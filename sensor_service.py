@@ -0,0 +1,233 @@
+# sensor_service.py
+# -----------------------------------------------------------
+# Service d'acquisition unique des capteurs (température 1-Wire, lumière BH1750).
+# Un thread dédié lit le matériel à son propre rythme et publie des instantanés
+# immuables et horodatés; le monitoring et l'interface les consultent sans
+# jamais accéder eux-mêmes aux bus.
+# -----------------------------------------------------------
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+_EMPTY = MappingProxyType({})
+
+class SensorSnapshot(NamedTuple):
+    """Lecture de tous les capteurs à un instant donné (immuable)."""
+    sequence: int # Numéro croissant de l'instantané (0 = aucune acquisition encore)
+    timestamp: float # time.time() à la fin de l'acquisition
+    temperatures: Mapping[str, float | None] # {sensor_id: °C ou None si erreur}
+    lights: Mapping[str, float | None] # {adresse hexa: lux ou None si erreur}
+    values: Mapping[str, float] # Valeurs valides des deux familles, pour le moteur de règles
+    # {sensor_id: time.time() de la mesure} pour values: une sonde relue moins souvent que les
+    # instantanés (intervalle par sonde) y garde l'instant de sa dernière lecture réelle
+    read_times: Mapping[str, float] = _EMPTY
+
+    def age(self, now: float | None = None) -> float:
+        """Âge de l'instantané en secondes."""
+        return (time.time() if now is None else now) - self.timestamp
+
+EMPTY_SNAPSHOT = SensorSnapshot(0, 0.0, _EMPTY, _EMPTY, _EMPTY)
+
+# Familles de capteurs (bus indépendants, lues en parallèle) et délai max. d'une lecture complète (s)
+SENSOR_FAMILIES = ('temperature', 'light')
+DEFAULT_FAMILY_TIMEOUTS = {'temperature': 5.0, 'light': 2.0}
+
+class SensorAcquisitionService:
+    """
+    Possède TempSensorManager et BH1750Manager: toutes les lectures et redécouvertes
+    passent par ce service (un verrou par famille sérialise l'accès à chaque bus).
+
+    Les familles (1-Wire, I2C) sont lues simultanément: une acquisition dure le temps
+    de la plus lente et non leur somme. Une famille qui dépasse son délai est publiée
+    sans valeurs (None) et n'est plus relancée tant que sa lecture bloquée n'a pas rendu la main.
+    """
+    def __init__(self, temp_manager, light_manager, interval: float = 2.0, family_timeouts: dict | None = None):
+        if interval <= 0:
+            raise ValueError(f"Intervalle d'acquisition invalide: {interval}")
+        self.temp_manager = temp_manager
+        self.light_manager = light_manager
+        self.interval = float(interval)
+        self.family_timeouts = dict(DEFAULT_FAMILY_TIMEOUTS)
+        for family, timeout in (family_timeouts or {}).items():
+            if family not in SENSOR_FAMILIES:
+                raise ValueError(f"Famille de capteurs inconnue: {family} (attendu: {', '.join(SENSOR_FAMILIES)})")
+            if float(timeout) <= 0:
+                raise ValueError(f"Délai de lecture invalide pour '{family}': {timeout}")
+            self.family_timeouts[family] = float(timeout)
+        self._readers = {'temperature': lambda: self.temp_manager.read_all_temperatures(),
+                         'light': lambda: self.light_manager.read_all_sensors()}
+        self._snapshot = EMPTY_SNAPSHOT
+        self._listeners = []
+        self._topology_listeners = [] # Appelés quand la liste des capteurs change (branchement à chaud)
+        self._family_locks = {family: threading.Lock() for family in SENSOR_FAMILIES}
+        self._publish_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(SENSOR_FAMILIES), thread_name_prefix="SensorFamily")
+        self._stalled = {} # {famille: Future d'une lecture ayant dépassé son délai}
+        self._refresh = threading.Event() # Demande d'acquisition immédiate
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Cycle de vie ---
+    def start(self):
+        """Démarre le thread d'acquisition (sans effet s'il tourne déjà)."""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SensorAcquisition", daemon=True)
+        self._thread.start()
+        logging.info(f"Service d'acquisition des capteurs démarré (intervalle {self.interval} s).")
+
+    def stop(self, timeout: float = 2.0):
+        """Arrête le thread d'acquisition et attend sa fin (au plus `timeout` secondes)."""
+        self._stop.set()
+        self._refresh.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logging.warning("Le thread d'acquisition des capteurs ne s'est pas arrêté dans le délai imparti.")
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- Consultation ---
+    def latest(self) -> SensorSnapshot:
+        """Dernier instantané publié (aucun accès matériel)."""
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """callback(snapshot) est appelé depuis le thread d'acquisition à chaque nouvel instantané."""
+        self._listeners = self._listeners + [callback] # Copie: itération sans verrou côté publication
+
+    def remove_listener(self, callback):
+        self._listeners = [cb for cb in self._listeners if cb != callback] # != : méthodes liées
+
+    def add_topology_listener(self, callback):
+        """callback() est appelé (hors thread Tk) quand des capteurs sont ajoutés ou retirés."""
+        self._topology_listeners = self._topology_listeners + [callback]
+
+    def request_refresh(self):
+        """Demande une acquisition immédiate (ex: après une redécouverte)."""
+        self._refresh.set()
+
+    # --- Matériel ---
+    def rediscover(self):
+        """Redécouvre les capteurs des deux familles puis demande une nouvelle acquisition."""
+        discover = {'temperature': (self.temp_manager.discover_sensors, "température"),
+                    'light': (self.light_manager.scan_sensors, "lumière")}
+        for family, (discover_func, label) in discover.items():
+            # Ne pas rester bloqué derrière une lecture elle-même bloquée sur ce bus
+            if not self._family_locks[family].acquire(timeout=self.family_timeouts[family]):
+                logging.warning(f"Découverte des capteurs de {label} ignorée: bus occupé par une lecture bloquée.")
+                continue
+            try:
+                discover_func()
+            except Exception as e:
+                logging.error(f"Erreur lors de la découverte des capteurs de {label}: {e}")
+            finally:
+                self._family_locks[family].release()
+        self.request_refresh()
+
+    def apply_temperature_bus_changes(self, added: set, removed: set) -> bool:
+        """
+        Répercute un branchement/débranchement de sondes 1-Wire (signalé par W1BusWatcher).
+        Retourne False si le bus est occupé (le changement sera resignalé).
+        """
+        lock = self._family_locks['temperature']
+        if not lock.acquire(timeout=self.family_timeouts['temperature']):
+            return False
+        try:
+            self.temp_manager.apply_bus_changes(added, removed)
+        finally:
+            lock.release()
+        self.request_refresh() # Nouvel instantané sans attendre l'intervalle: le monitoring voit le changement
+        for callback in self._topology_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Erreur dans un abonné (topologie) du service capteurs: {e}")
+        return True
+
+    def sample_once(self) -> SensorSnapshot:
+        """Lit toutes les familles de capteurs en parallèle, publie l'instantané et le retourne."""
+        start = time.monotonic()
+        futures = {}
+        results = {}
+        for family in SENSOR_FAMILIES:
+            stalled = self._stalled.get(family)
+            if stalled is not None and not stalled.done():
+                results[family] = None # Lecture précédente toujours bloquée: ne pas empiler les threads
+                continue
+            if stalled is not None:
+                del self._stalled[family]
+                logging.info(f"Capteurs '{family}': la lecture bloquée a rendu la main, reprise des acquisitions.")
+            futures[family] = self._executor.submit(self._read_family, family)
+        for family, future in futures.items():
+            try:
+                results[family] = future.result(timeout=max(0.0, start + self.family_timeouts[family] - time.monotonic()))
+            except FutureTimeoutError:
+                logging.warning(f"Capteurs '{family}': lecture non terminée après {self.family_timeouts[family]} s, valeurs ignorées.")
+                self._stalled[family] = future
+                results[family] = None
+        with self._publish_lock:
+            return self._publish(self._family_values('temperature', results['temperature']),
+                                 self._family_values('light', results['light']))
+
+    def _read_family(self, family) -> dict:
+        with self._family_locks[family]:
+            try:
+                return self._readers[family]()
+            except Exception as e:
+                logging.error(f"Erreur lecture capteurs '{family}': {e}")
+                return {}
+
+    def _family_values(self, family, readings) -> dict:
+        """Valeurs d'une famille; si elle n'a pas pu être lue, ses capteurs connus valent None."""
+        if readings is not None:
+            return readings
+        previous = self._snapshot.temperatures if family == 'temperature' else self._snapshot.lights
+        return dict.fromkeys(previous)
+
+    def _publish(self, temperatures, lights) -> SensorSnapshot:
+        values = {k: v for k, v in {**temperatures, **lights}.items() if v is not None}
+        timestamp = time.time()
+        temperature_times = self.temp_manager.get_read_times()
+        read_times = {k: temperature_times.get(k, timestamp) if k in temperatures else timestamp for k in values}
+        snapshot = SensorSnapshot(self._snapshot.sequence + 1, timestamp, MappingProxyType(dict(temperatures)),
+                                  MappingProxyType(dict(lights)), MappingProxyType(values), MappingProxyType(read_times))
+        self._snapshot = snapshot # Remplacement atomique de la référence
+        logging.debug(f"Instantané capteurs #{snapshot.sequence}: {values}")
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Erreur dans un abonné du service capteurs: {e}")
+        return snapshot
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            self._refresh.clear()
+            self.sample_once()
+            # Rythme régulier: l'intervalle compte depuis le début de l'acquisition précédente
+            next_sample = max(next_sample + self.interval, time.monotonic())
+            self._refresh.wait(max(0.0, next_sample - time.monotonic()))
+            if self._refresh.is_set():
+                next_sample = time.monotonic()
+        logging.info("Service d'acquisition des capteurs arrêté.")
+
+# Test simple
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    from temp_sensor_wrapper import TempSensorManager
+    from light_sensor import BH1750Manager
+    service = SensorAcquisitionService(TempSensorManager(), BH1750Manager(), interval=2.0)
+    service.add_listener(lambda snap: print(f"#{snap.sequence} {time.strftime('%H:%M:%S', time.localtime(snap.timestamp))}: {dict(snap.values)}"))
+    service.start()
+    try:
+        time.sleep(10)
+    finally:
+        service.stop()
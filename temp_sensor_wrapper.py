@@ -1,10 +1,68 @@
 # temp_sensor_wrapper.py
 import logging
-from w1thermsensor import W1ThermSensor, SensorNotReadyError, NoSensorFoundError
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from w1thermsensor import W1ThermSensor, SensorNotReadyError, NoSensorFoundError, Sensor
+from sensor_health import Backoff, SensorHealthTracker
+
+# Fichier sysfs du maître 1-Wire déclenchant une conversion simultanée sur tout le bus
+W1_BULK_READ_FILE = "therm_bulk_read"
+# Temps de conversion max. du DS18B20 selon la résolution (bits -> s)
+CONVERSION_TIMES = {9: 0.094, 10: 0.188, 11: 0.375, 12: 0.75}
+DEFAULT_RESOLUTION = 12
+# Marge ajoutée au temps de conversion avant d'abandonner l'attente d'une conversion groupée et pas de scrutation (s)
+BULK_CONVERSION_MARGIN = 0.25
+BULK_POLL_INTERVAL = 0.01
+# Lectures concurrentes max. en mode 'parallel' (le pilote w1_therm libère le bus pendant la conversion)
+MAX_PARALLEL_READS = 16
+# 'auto': conversion groupée si disponible, sinon lectures concurrentes
+ACQUISITION_MODES = ('auto', 'bulk', 'parallel', 'sequential')
+# Préfixes (famille 1-Wire en hexa) des répertoires de sondes de température, ex: '28-0123456789ab'
+W1_THERM_PREFIXES = {f"{sensor_type.value:02x}" for sensor_type in Sensor}
+# Redécouverte automatique quand aucune sonde n'est connue: délai initial et plafond (s)
+DISCOVERY_BASE_DELAY = 10.0
+DISCOVERY_MAX_DELAY = 600.0
+
+def _probe_settings(settings: dict | None, where: str) -> dict:
+    """Valide {'resolution': 9..12, 'interval': s >= 0} (clés optionnelles) et retourne une copie."""
+    settings = dict(settings or {})
+    unknown = set(settings) - {'resolution', 'interval'}
+    if unknown:
+        raise ValueError(f"{where}: paramètre(s) inconnu(s) {sorted(unknown)}")
+    if 'resolution' in settings:
+        if settings['resolution'] not in CONVERSION_TIMES:
+            raise ValueError(f"{where}: résolution {settings['resolution']} invalide (9 à 12 bits)")
+    if 'interval' in settings:
+        interval = float(settings['interval'])
+        if interval < 0:
+            raise ValueError(f"{where}: intervalle négatif ({interval})")
+        settings['interval'] = interval
+    return settings
 
 class TempSensorManager:
-    def __init__(self):
+    def __init__(self, acquisition_mode: str = 'auto', default_settings: dict | None = None,
+                 probe_settings: dict[str, dict] | None = None):
+        """
+        acquisition_mode: voir ACQUISITION_MODES.
+        default_settings: {'resolution': bits, 'interval': s} appliqués à toutes les sondes.
+        probe_settings: {sensor_id: {'resolution': bits, 'interval': s}} par sonde (prioritaires).
+        Une sonde n'est relue qu'une fois son intervalle écoulé (0 = à chaque appel);
+        entre deux lectures, sa dernière valeur est retournée.
+        """
+        if acquisition_mode not in ACQUISITION_MODES:
+            raise ValueError(f"Mode d'acquisition inconnu: {acquisition_mode} (attendu: {', '.join(ACQUISITION_MODES)})")
         self.sensors = []
+        self.acquisition_mode = acquisition_mode
+        self.default_settings = _probe_settings(default_settings, "Paramètres par défaut des sondes")
+        self.probe_settings = {str(sensor_id): _probe_settings(settings, f"Sonde {sensor_id}")
+                               for sensor_id, settings in (probe_settings or {}).items()}
+        self._last_readings = {} # {sensor_id: (valeur, instant monotonic de la lecture, time.time() de la lecture)}
+        self._bulk_unavailable = set() # Fichiers therm_bulk_read inutilisables (absents, droits insuffisants)
+        self._executor = None # Pool de threads créé à la première lecture concurrente
+        self._last_mode_used = None
+        self.health = SensorHealthTracker("Capteur de température") # Échecs consécutifs et reprise exponentielle par sonde
+        self._discovery_backoff = Backoff(DISCOVERY_BASE_DELAY, DISCOVERY_MAX_DELAY)
         self.discover_sensors()
 
     def discover_sensors(self):
@@ -13,6 +71,7 @@ class TempSensorManager:
             self.sensors = W1ThermSensor.get_available_sensors()
             if self.sensors:
                 logging.info(f"Capteurs de température 1-Wire trouvés : {[s.id for s in self.sensors]}")
+                self._apply_resolutions()
             else:
                 logging.warning("Aucun capteur de température 1-Wire DS18B20 trouvé.")
         except NoSensorFoundError:
@@ -20,41 +79,246 @@ class TempSensorManager:
         except Exception as e:
             logging.error(f"Erreur lors de la découverte des capteurs 1-Wire: {e}")
             self.sensors = [] # Assurer que la liste est vide en cas d'erreur majeure
+        if self.sensors:
+            self._discovery_backoff.success()
+        else:
+            self._discovery_backoff.failure()
+        self.health.retain(sensor.id for sensor in self.sensors)
+
+    @staticmethod
+    def bus_directory() -> Path:
+        """Répertoire des périphériques du bus 1-Wire (une entrée par esclave)."""
+        return Path(W1ThermSensor.BASE_DIRECTORY)
+
+    @staticmethod
+    def is_probe_entry(name: str) -> bool:
+        """True si cette entrée du répertoire du bus est une sonde de température."""
+        return len(name) > 3 and name[2] == '-' and name[:2].lower() in W1_THERM_PREFIXES
+
+    def apply_bus_changes(self, added: set, removed: set):
+        """
+        Ajoute/retire des sondes d'après les entrées du répertoire du bus (ex: '28-0123456789ab'),
+        sans redécouverte complète. Les sondes ajoutées reçoivent leur résolution configurée.
+        """
+        removed_ids = {name[3:] for name in removed}
+        self.sensors = [sensor for sensor in self.sensors if sensor.id not in removed_ids]
+        known_ids = {sensor.id for sensor in self.sensors}
+        for name in sorted(added):
+            if not self.is_probe_entry(name) or name[3:] in known_ids:
+                continue
+            try:
+                sensor = W1ThermSensor(Sensor.from_id_string(name[:2]), name[3:])
+            except Exception as e:
+                logging.error(f"Impossible d'ajouter la sonde 1-Wire {name}: {e}")
+                continue
+            self.sensors.append(sensor)
+            self._apply_resolution(sensor)
+        for sensor_id in removed_ids:
+            self._last_readings.pop(sensor_id, None)
+        self.health.retain(sensor.id for sensor in self.sensors)
+        if self.sensors:
+            self._discovery_backoff.success()
+        logging.info(f"Capteurs de température 1-Wire: {[s.id for s in self.sensors]}")
 
     def get_sensor_ids(self) -> list[str]:
         """Retourne les IDs des capteurs découverts."""
         return [sensor.id for sensor in self.sensors]
 
+    def get_resolution(self, sensor_id: str) -> int | None:
+        """Résolution configurée pour cette sonde (None = celle de la sonde, 12 bits par défaut)."""
+        return self.probe_settings.get(sensor_id, {}).get('resolution', self.default_settings.get('resolution'))
+
+    def get_read_times(self) -> dict[str, float]:
+        """time.time() de la dernière lecture effective de chaque sonde (une valeur gardée en cache conserve le sien)."""
+        return {sensor_id: last[2] for sensor_id, last in list(self._last_readings.items()) if last[0] is not None}
+
+    def get_interval(self, sensor_id: str) -> float:
+        """Intervalle minimal (s) entre deux lectures de cette sonde."""
+        return self.probe_settings.get(sensor_id, {}).get('interval', self.default_settings.get('interval', 0.0))
+
+    def conversion_time(self, sensor_id: str) -> float:
+        """Temps de conversion max. (s) de cette sonde à sa résolution configurée."""
+        return CONVERSION_TIMES[self.get_resolution(sensor_id) or DEFAULT_RESOLUTION]
+
+    def _apply_resolutions(self):
+        """Programme la résolution configurée dans la RAM de chaque sonde (non persistée en EEPROM)."""
+        for sensor in self.sensors:
+            self._apply_resolution(sensor)
+
+    def _apply_resolution(self, sensor):
+        resolution = self.get_resolution(sensor.id)
+        if resolution is None:
+            return
+        try:
+            sensor.set_resolution(resolution, persist=False)
+            logging.info(f"Capteur {sensor.id}: résolution {resolution} bits ({CONVERSION_TIMES[resolution] * 1000:.0f} ms).")
+        except Exception as e:
+            # Requiert les droits root et un noyau >= 4.7
+            logging.warning(f"Impossible de régler la résolution du capteur {sensor.id} à {resolution} bits: {e}")
+
     def read_all_temperatures(self) -> dict[str, float | None]:
-        """Lit la température de tous les capteurs découverts."""
-        readings = {}
+        """
+        Lit la température de tous les capteurs découverts.
+
+        Selon `acquisition_mode`, une seule conversion est déclenchée pour tout le bus
+        (therm_bulk_read) ou les capteurs sont lus en parallèle: le coût pour N sondes
+        est alors d'environ un temps de conversion au lieu de N.
+        Seules les sondes dont l'intervalle est écoulé sont lues; les autres gardent leur dernière valeur.
+        Une sonde en échec vaut None et n'est relue qu'à l'échéance de son délai de reprise (exponentiel).
+        """
         if not self.sensors:
-             # Tenter une nouvelle découverte si aucun capteur n'était connu
+             # Tenter une nouvelle découverte si aucun capteur n'était connu (espacée exponentiellement)
+             if not self._discovery_backoff.ready():
+                 return {}
              logging.debug("Tentative de redécouverte des capteurs de température.")
              self.discover_sensors()
              if not self.sensors:
                  logging.warning("Impossible de lire les températures, aucun capteur trouvé.")
                  return {} # Retourner un dict vide si toujours aucun capteur
 
+        now = time.monotonic()
+        readings = {}
+        sensors = []
         for sensor in self.sensors:
-            try:
-                temperature = sensor.get_temperature() # Défaut Celsius
-                readings[sensor.id] = round(temperature, 2)
-                logging.debug(f"Lecture capteur {sensor.id}: {temperature:.2f}°C")
-            except SensorNotReadyError:
-                logging.warning(f"Capteur de température {sensor.id} non prêt.")
-                readings[sensor.id] = None
-            except Exception as e:
-                logging.error(f"Erreur de lecture du capteur de température {sensor.id}: {e}")
-                readings[sensor.id] = None
-                # Si une erreur survient, on pourrait essayer de redécouvrir au prochain cycle
-                # ou marquer le capteur comme problématique. Pour l'instant, on retourne None.
+            last = self._last_readings.get(sensor.id)
+            if not self.health.should_read(sensor.id, now):
+                readings[sensor.id] = None # Sonde en échec: attendre son délai de reprise
+            elif last is not None and last[0] is not None and now - last[1] < self.get_interval(sensor.id):
+                readings[sensor.id] = last[0] # Pas encore due: dernière valeur valide
+            else:
+                sensors.append(sensor)
+        if not sensors:
+            return readings
+
+        readings.update(self._acquire(sensors))
+        now, wall_now = time.monotonic(), time.time()
+        for sensor in sensors:
+            self._last_readings[sensor.id] = (readings[sensor.id], now, wall_now)
         return readings
 
+    def _acquire(self, sensors) -> dict[str, float | None]:
+        """Lit les sondes données selon le mode d'acquisition."""
+        if self.acquisition_mode == 'sequential':
+            return self._read_sequential(sensors)
+
+        pending = sensors
+        readings = {}
+        if self.acquisition_mode in ('auto', 'bulk'):
+            converted_groups, pending = self._bulk_convert(sensors)
+            if converted_groups:
+                # Conversion terminée: la lecture de w1_slave retourne la valeur convertie sans nouvelle conversion.
+                # Les maîtres 1-Wire sont des bus indépendants: un thread par bus s'il y en a plusieurs.
+                if len(converted_groups) == 1:
+                    readings.update(self._read_sequential(converted_groups[0]))
+                else:
+                    for group_readings in self._pool().map(self._read_sequential, converted_groups):
+                        readings.update(group_readings)
+                self._log_mode('bulk')
+        if pending:
+            if self.acquisition_mode == 'bulk':
+                logging.debug(f"Conversion groupée indisponible pour {len(pending)} capteur(s), lecture individuelle.")
+                readings.update(self._read_sequential(pending))
+                self._log_mode('sequential')
+            else:
+                readings.update(self._read_parallel(pending))
+                self._log_mode('parallel')
+        return readings
+
+    def _read_one(self, sensor) -> float | None:
+        """Lit un capteur; retourne None en cas d'erreur (enregistrée dans self.health)."""
+        try:
+            temperature = sensor.get_temperature() # Défaut Celsius
+        except SensorNotReadyError:
+            self.health.record_failure(sensor.id, "non prêt")
+            return None
+        except Exception as e:
+            self.health.record_failure(sensor.id, e)
+            return None
+        logging.debug(f"Lecture capteur {sensor.id}: {temperature:.2f}°C")
+        temperature = round(temperature, 2)
+        self.health.record_success(sensor.id, temperature)
+        return temperature
+
+    def _read_sequential(self, sensors) -> dict[str, float | None]:
+        return {sensor.id: self._read_one(sensor) for sensor in sensors}
+
+    def _read_parallel(self, sensors) -> dict[str, float | None]:
+        """Lit les capteurs simultanément (une conversion par capteur, en parallèle)."""
+        if len(sensors) == 1:
+            return self._read_sequential(sensors)
+        return dict(zip((sensor.id for sensor in sensors), self._pool().map(self._read_one, sensors)))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_READS, thread_name_prefix="ds18b20")
+        return self._executor
+
+    def _bulk_convert(self, sensors):
+        """
+        Déclenche une conversion simultanée sur le(s) maître(s) 1-Wire des capteurs et attend sa fin.
+        Retourne (capteurs convertis groupés par maître, capteurs restant à lire individuellement).
+        """
+        by_bulk_file = {}
+        pending = []
+        for sensor in sensors:
+            bulk_file = self._bulk_read_file(sensor)
+            if bulk_file is None or bulk_file in self._bulk_unavailable:
+                pending.append(sensor)
+            else:
+                by_bulk_file.setdefault(bulk_file, []).append(sensor)
+
+        triggered = []
+        for bulk_file, group in by_bulk_file.items():
+            try:
+                with bulk_file.open("r+") as f: # "r+": ne jamais créer le fichier s'il est absent
+                    f.write("trigger\n")
+                triggered.append(bulk_file)
+            except OSError as e:
+                # Fichier absent (noyau < 5.10) ou écriture réservée à root: ne plus réessayer
+                logging.info(f"Conversion groupée 1-Wire indisponible ({bulk_file}): {e}")
+                self._bulk_unavailable.add(bulk_file)
+                pending.extend(group)
+
+        # Attendre la fin des conversions: le fichier vaut -1 tant qu'un capteur convertit encore.
+        # Toutes les sondes du bus convertissent, même celles qui ne sont pas dues: la plus lente fixe la durée.
+        timeout = max(self.conversion_time(sensor.id) for sensor in self.sensors) + BULK_CONVERSION_MARGIN
+        deadline = time.monotonic() + timeout
+        waiting = list(triggered)
+        while waiting and time.monotonic() < deadline:
+            time.sleep(BULK_POLL_INTERVAL)
+            waiting = [f for f in waiting if self._bulk_in_progress(f)]
+        if waiting:
+            logging.warning(f"Conversion groupée 1-Wire non terminée après {timeout:.2f} s: {[str(f) for f in waiting]}")
+
+        return [by_bulk_file[bulk_file] for bulk_file in triggered], pending
+
+    @staticmethod
+    def _bulk_read_file(sensor) -> Path | None:
+        """Chemin du fichier therm_bulk_read du maître 1-Wire portant ce capteur, ou None."""
+        try:
+            # /sys/bus/w1/devices/28-xxx/w1_slave -> /sys/devices/w1_bus_master1/28-xxx/w1_slave
+            return Path(sensor.sensorpath).resolve().parent.parent / W1_BULK_READ_FILE
+        except (AttributeError, OSError):
+            return None
+
+    @staticmethod
+    def _bulk_in_progress(bulk_file) -> bool:
+        try:
+            return bulk_file.read_text().strip() == "-1"
+        except OSError:
+            return False
+
+    def _log_mode(self, mode):
+        if mode != self._last_mode_used:
+            logging.info(f"Acquisition des températures: mode '{mode}' ({len(self.sensors)} capteur(s)).")
+            self._last_mode_used = mode
+
 # Test simple
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     manager = TempSensorManager()
     print("Capteurs trouvés:", manager.get_sensor_ids())
     if manager.sensors:
-      print("Lectures:", manager.read_all_temperatures())
\ No newline at end of file
+      start = time.monotonic()
+      print("Lectures:", manager.read_all_temperatures())
+      print(f"Durée d'acquisition: {time.monotonic() - start:.3f} s")
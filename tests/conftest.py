@@ -0,0 +1,33 @@
+# tests/conftest.py
+# -----------------------------------------------------------
+# Configuration pytest: les modules du projet sont à la racine du dépôt.
+# -----------------------------------------------------------
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def kasa_emulator():
+    """
+    Exécute un scénario asynchrone contre des appareils Kasa émulés (kasa_emulator.py):
+        kasa_emulator(scenario, strips=2) -> résultat de await scenario(emulator)
+    """
+    from kasa_emulator import KasaEmulator
+
+    def run(scenario, **settings):
+        async def main():
+            try:
+                emulator = await KasaEmulator(**settings).start()
+            except OSError as e: # 127.0.0.N non routable (hors Linux) ou port occupé
+                pytest.skip(f"Émulateur Kasa indisponible: {e}")
+            try:
+                return await scenario(emulator)
+            finally:
+                await emulator.stop()
+        return asyncio.run(main())
+    return run
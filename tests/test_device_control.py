@@ -0,0 +1,213 @@
+# tests/test_device_control.py
+# -----------------------------------------------------------
+# Disjoncteurs par appareil (CircuitBreaker) et sessions Kasa, contre l'émulateur.
+# -----------------------------------------------------------
+import asyncio
+import threading
+
+import pytest
+
+from device_control import CircuitBreaker, DeviceController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(clock, **settings):
+    settings = {'failure_threshold': 2, 'base_backoff': 5.0, 'max_backoff': 20.0, **settings}
+    return CircuitBreaker(name='test', clock=clock, **settings)
+
+
+def test_breaker_transitions():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in() == pytest.approx(5.0)
+
+    clock.now += 5.0
+    assert not breaker.allow(trial=False) # Les commandes ne sondent jamais un appareil
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow() # Un seul essai à la fois
+
+    breaker.record_failure() # Essai en échec: backoff doublé
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.backoff == 10.0
+    for _ in range(3):
+        clock.now += breaker.backoff
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.backoff == 20.0 # Plafonné à max_backoff
+
+    clock.now += breaker.backoff
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.backoff == 5.0
+
+
+@pytest.mark.parametrize('settings', [{'failure_threshold': 0}, {'base_backoff': 0}, {'base_backoff': 10, 'max_backoff': 5}])
+def test_breaker_rejects_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        make_breaker(FakeClock(), **settings)
+
+
+def test_unreachable_device_fails_fast(kasa_emulator):
+    clock = FakeClock()
+
+    async def scenario(emulator):
+        down, up = emulator.hosts
+        controller = DeviceController(down, is_strip=True, breaker=make_breaker(clock))
+        neighbour = DeviceController(up, is_strip=True, breaker=make_breaker(clock))
+        try:
+            assert await controller.get_outlet_state() is not None
+            emulator.set_online(down, False)
+            await controller.close() # Session perdue: la reconnexion échoue
+            assert await controller.get_outlet_state() is None
+            assert await controller.get_outlet_state() is None
+            assert controller.breaker.state == CircuitBreaker.OPEN
+
+            # Circuit ouvert: aucune tentative vers l'appareil, le voisin n'est pas affecté
+            requests = emulator.device(down).requests
+            assert await controller.get_outlet_state() is None
+            assert await controller.set_outlet_states({0: True}) == {0: False}
+            assert emulator.device(down).requests == requests
+            assert await neighbour.set_outlet_states({1: True}) == {1: True}
+
+            # Backoff écoulé: une commande ne sert pas d'essai, le prochain relevé si
+            emulator.set_online(down, True)
+            clock.now += controller.breaker.backoff
+            assert await controller.turn_outlet_on(0) is False
+            assert controller.breaker.state == CircuitBreaker.OPEN
+            outlets = await controller.get_outlet_state()
+            assert [outlet['index'] for outlet in outlets] == [0, 1, 2]
+            assert controller.breaker.state == CircuitBreaker.CLOSED
+            assert await controller.turn_outlet_on(0) is True
+        finally:
+            await controller.close()
+            await neighbour.close()
+
+    kasa_emulator(scenario, strips=2)
+
+
+def test_failed_trial_reopens_with_doubled_backoff(kasa_emulator):
+    clock = FakeClock()
+
+    async def scenario(emulator):
+        host = emulator.hosts[0]
+        controller = DeviceController(host, is_strip=True, breaker=make_breaker(clock))
+        emulator.set_online(host, False)
+        try:
+            for _ in range(2):
+                assert await controller.get_outlet_state() is None
+            assert controller.breaker.state == CircuitBreaker.OPEN
+            clock.now += controller.breaker.backoff
+            assert await controller.get_outlet_state() is None # Essai (half-open) en échec
+            assert controller.breaker.state == CircuitBreaker.OPEN
+            assert controller.breaker.backoff == 10.0
+        finally:
+            await controller.close()
+
+    kasa_emulator(scenario, strips=1)
+
+
+def test_unexpected_error_drops_session_and_counts_as_failure(kasa_emulator):
+    clock = FakeClock()
+
+    async def scenario(emulator):
+        host = emulator.hosts[0]
+        controller = DeviceController(host, is_strip=True, breaker=make_breaker(clock))
+        try:
+            assert await controller.get_outlet_state() is not None
+
+            async def broken_update(*args, **kwargs):
+                raise OSError("Network is unreachable")
+            controller._device.update = broken_update
+            assert await controller.get_outlet_state() is None
+            assert controller._device is None # Session abandonnée, pas gardée en cache
+            assert controller.breaker.failures == 1
+
+            emulator.set_online(host, False)
+            assert await controller.get_outlet_state() is None
+            assert controller.breaker.state == CircuitBreaker.OPEN
+        finally:
+            await controller.close()
+
+    kasa_emulator(scenario, strips=1)
+
+
+def test_poll_after_command_reconnect_refreshes_state(kasa_emulator):
+    async def scenario(emulator):
+        host = emulator.hosts[0]
+        controller = DeviceController(host, is_strip=True)
+        try:
+            assert await controller.set_outlet_states({0: True}) == {0: True} # Connexion ouverte par la commande
+            emulator.device(host).states[1] = True # Changement hors de l'application
+            outlets = await controller.get_outlet_state()
+            assert [outlet['is_on'] for outlet in outlets] == [True, True, False]
+        finally:
+            await controller.close()
+
+    kasa_emulator(scenario, strips=1)
+
+
+def test_failed_batch_drops_session_and_opens_breaker(kasa_emulator):
+    clock = FakeClock()
+
+    async def scenario(emulator):
+        host = emulator.hosts[0]
+        controller = DeviceController(host, is_strip=True, breaker=make_breaker(clock))
+        try:
+            assert await controller.set_outlet_states({0: True}) == {0: True}
+            emulator.set_online(host, False) # Session coupée entre deux lots
+            assert await controller.set_outlet_states({0: False, 1: True}) == {0: False, 1: False}
+            assert controller._device is None # Pas de réutilisation d'une session morte
+            assert controller.breaker.failures == 1
+            assert await controller.get_outlet_state() is None # Reconnexion impossible
+            assert controller.breaker.state == CircuitBreaker.OPEN
+        finally:
+            await controller.close()
+
+    kasa_emulator(scenario, strips=1)
+
+
+@pytest.mark.parametrize('owner_running', [True, False])
+def test_session_from_another_loop_is_closed(kasa_emulator, owner_running):
+    async def scenario(emulator):
+        host = emulator.hosts[0]
+        controller = DeviceController(host, is_strip=True)
+        owner = asyncio.new_event_loop()
+        thread = threading.Thread(target=owner.run_forever, daemon=True)
+        thread.start()
+        try:
+            # Session ouverte par une autre boucle (thread), arrêtée ou non avant la réutilisation
+            opened = asyncio.run_coroutine_threadsafe(controller.get_outlet_state(), owner)
+            assert await asyncio.wrap_future(opened) is not None
+            assert len(emulator._connections) == 1
+            if not owner_running:
+                owner.call_soon_threadsafe(owner.stop)
+                thread.join()
+            assert await controller.get_outlet_state() is not None
+            for _ in range(100): # L'ancienne connexion est fermée, pas abandonnée ouverte
+                if len(emulator._connections) == 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert len(emulator._connections) == 1
+        finally:
+            await controller.close()
+            if owner.is_running():
+                owner.call_soon_threadsafe(owner.stop)
+            thread.join()
+            owner.close()
+
+    kasa_emulator(scenario, strips=1)
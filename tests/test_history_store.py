@@ -0,0 +1,49 @@
+# tests/test_history_store.py
+# -----------------------------------------------------------
+# Historique disque: une valeur en cache n'est écrite qu'une fois.
+# -----------------------------------------------------------
+from types import MappingProxyType
+
+import pytest
+
+from history_store import DiskHistory
+from sensor_service import SensorSnapshot
+
+T0 = 1_700_000_400.0 # Début d'une minute
+
+
+def snapshot(sequence, timestamp, values, read_times):
+    return SensorSnapshot(sequence, timestamp, MappingProxyType(dict(values)), MappingProxyType({}),
+                          MappingProxyType(dict(values)), MappingProxyType(dict(read_times)))
+
+
+def test_repeated_read_time_is_not_written_again(tmp_path):
+    history = DiskHistory(tmp_path, sample_interval=2.0, flush_interval=0)
+    try:
+        # Snapshots toutes les 2 s; la sonde n'est relue que toutes les 6 s (valeur en cache entre-temps)
+        for i in range(30):
+            read_time = T0 + 6 * (i // 3)
+            history.on_sensor_snapshot(snapshot(i + 1, T0 + 2 * i, {'p': 20.0 + i // 3}, {'p': read_time}))
+        raw = history.query('p', T0, T0 + 60, tier='raw')
+        assert [ts for ts, _ in raw] == [T0 + 6 * k for k in range(10)]
+        assert [value for _, value in raw] == [20.0 + k for k in range(10)]
+        # Le créneau de la minute se termine à la première mesure de la minute suivante
+        history.on_sensor_snapshot(snapshot(31, T0 + 60, {'p': 30.0}, {'p': T0 + 60}))
+        (start, low, high, mean, count), = history.query('p', T0, T0 + 59, tier='min')
+        assert (start, low, high, count) == (T0, 20.0, 29.0, 10)
+        assert mean == pytest.approx(24.5)
+    finally:
+        history.close()
+
+
+def test_cached_value_is_skipped_after_reopening(tmp_path):
+    history = DiskHistory(tmp_path, flush_interval=0)
+    history.on_sensor_snapshot(snapshot(1, T0, {'p': 20.0}, {'p': T0}))
+    history.close()
+    history = DiskHistory(tmp_path, flush_interval=0)
+    try:
+        history.on_sensor_snapshot(snapshot(2, T0 + 2, {'p': 20.0}, {'p': T0})) # Même lecture, relue depuis le cache
+        history.on_sensor_snapshot(snapshot(3, T0 + 4, {'p': 21.0}, {'p': T0 + 4}))
+        assert history.query('p', T0, tier='raw') == [(T0, 20.0), (T0 + 4, 21.0)]
+    finally:
+        history.close()
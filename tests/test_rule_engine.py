@@ -0,0 +1,84 @@
+# tests/test_rule_engine.py
+# -----------------------------------------------------------
+# Moteur de règles: réévaluations imposées par un changement d'état JUSQU'À.
+# -----------------------------------------------------------
+from rule_engine import RuleEngine, outlet_command
+
+OUTLET = ('AA:BB:CC:DD:EE:FF', 0)
+
+
+def make_rule(conditions, until_conditions, action='ON', rule_id='R1'):
+    return {'id': rule_id, 'name': rule_id, 'target_device_mac': OUTLET[0], 'target_outlet_index': OUTLET[1],
+            'action': action, 'trigger_logic': 'ET', 'conditions': conditions,
+            'until_logic': 'OU', 'until_conditions': until_conditions}
+
+
+def sensor(sensor_id, operator, threshold):
+    return {'type': 'Capteur', 'id': sensor_id, 'operator': operator, 'threshold': threshold}
+
+
+def hour(operator, value):
+    return {'type': 'Heure', 'id': None, 'operator': operator, 'value': value}
+
+
+def make_engine(*rules, backend='python'):
+    engine = RuleEngine(backend=backend)
+    engine.load(list(rules))
+    engine.reset_state()
+    return engine
+
+
+def test_activation_is_settled_within_evaluate():
+    engine = make_engine(make_rule([sensor('t', '>', 25.0)], [sensor('t', '<', 20.0)]))
+    assert engine.evaluate_seconds({'t': 26.0}, 8 * 3600) == {OUTLET: 'ON'}
+    # Le JUSQU'À a déjà été évalué: rien ne reste en attente du prochain réveil
+    assert not engine.has_pending_evaluation()
+    assert engine.active_until_rule_ids() == ['R1']
+
+
+def test_until_revert_with_constant_sensor_is_not_deferred():
+    # SI Heure>=08:00 ON JUSQU'À temp>30, temp constante à 31: la prise ne doit pas rester ON
+    engine = make_engine(make_rule([hour('>=', '08:00')], [sensor('t', '>', 30.0)]))
+    values = {'t': 31.0}
+    assert engine.evaluate_seconds(values, 8 * 3600 - 1) == {}
+    for _ in range(3):
+        # Activation aussitôt confirmée puis retour: seul le retour OFF est visible
+        assert engine.evaluate_seconds(values, 8 * 3600) == {OUTLET: 'OFF'}
+        assert engine.has_pending_evaluation() # SI toujours rempli: réévaluée au cycle suivant
+
+
+def test_until_revert_is_visible_for_one_cycle():
+    engine = make_engine(make_rule([sensor('t', '<', 28.0)], [sensor('t', '>', 30.0)]))
+    assert engine.evaluate_seconds({'t': 26.0}, 0) == {OUTLET: 'ON'}
+    assert not engine.has_pending_evaluation()
+    assert engine.evaluate_seconds({'t': 31.0}, 0) == {OUTLET: 'OFF'}
+    assert engine.active_until_rule_ids() == []
+    assert engine.has_pending_evaluation()
+    # Cycle suivant, sans nouvelle valeur: plus aucune règle active ni SI rempli, état non imposé
+    desired = engine.evaluate_seconds({'t': 31.0}, 0)
+    assert desired == {}
+    assert not engine.has_pending_evaluation()
+    # La prise allumée reçoit l'OFF implicite de l'étape 4
+    assert outlet_command(desired.get(OUTLET), True) == (False, True)
+
+
+def test_off_rule_until_revert_emits_on():
+    # SI t<28 OFF JUSQU'À t>30: le retour 'ON' doit être émis, pas effacé par la réévaluation
+    engine = make_engine(make_rule([sensor('t', '<', 28.0)], [sensor('t', '>', 30.0)], action='OFF'))
+    assert engine.evaluate_seconds({'t': 26.0}, 0) == {OUTLET: 'OFF'}
+    desired = engine.evaluate_seconds({'t': 31.0}, 0)
+    assert desired == {OUTLET: 'ON'}
+    assert outlet_command(desired[OUTLET], False) == (True, False)
+    assert engine.has_pending_evaluation()
+    assert engine.evaluate_seconds({'t': 31.0}, 0) == {}
+    assert not engine.has_pending_evaluation()
+
+
+def test_backends_agree_on_until_reevaluation():
+    rules = [make_rule([hour('>=', '08:00')], [sensor('t', '>', 30.0)])]
+    results = {}
+    for backend in ('python', 'numpy'):
+        engine = make_engine(*rules, backend=backend)
+        results[backend] = [engine.evaluate_seconds({'t': t}, 8 * 3600 + i)
+                            for i, t in enumerate([29.0, 29.0, 31.0, 31.0, 31.0, 29.0, 29.0])]
+    assert results['python'] == results['numpy']
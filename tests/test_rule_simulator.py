@@ -0,0 +1,92 @@
+# tests/test_rule_simulator.py
+# -----------------------------------------------------------
+# Rejeu hors ligne: réveils JUSQU'À et colonnes d'agrégats vectorisées.
+# -----------------------------------------------------------
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from rule_engine import PENDING_RETRY_DELAY
+from rule_simulator import RuleSimulator
+from window_aggregates import AGGREGATE_FUNCTIONS, AggregateTracker, aggregate_columns, aggregate_key
+
+MAC = 'AA:BB:CC:DD:EE:FF'
+
+
+def until_rule(conditions, until_conditions, action):
+    return {'id': 'R1', 'name': 'R1', 'target_device_mac': MAC, 'target_outlet_index': 0, 'action': action,
+            'trigger_logic': 'ET', 'conditions': conditions, 'until_logic': 'OU', 'until_conditions': until_conditions}
+
+
+HOUR_RULE = until_rule([{'type': 'Heure', 'id': None, 'operator': '>=', 'value': '08:00'}],
+                       [{'type': 'Capteur', 'id': 't', 'operator': '>', 'threshold': 30.0}], 'ON')
+OFF_RULE = until_rule([{'type': 'Capteur', 'id': 't', 'operator': '<', 'threshold': 28.0}],
+                      [{'type': 'Capteur', 'id': 't', 'operator': '>', 'threshold': 30.0}], 'OFF')
+
+
+def replay(rule, samples, initial_outlet_state=False, arrays=False):
+    simulator = RuleSimulator([rule], initial_outlet_state=initial_outlet_state)
+    commands = []
+    record = lambda ts, mac, index, state, implicit: commands.append((ts, state, implicit))
+    if arrays:
+        timestamps = np.array([ts for ts, _ in samples])
+        values = np.array([[values['t']] for _, values in samples])
+        simulator.run_arrays(timestamps, ['t'], values, record)
+    else:
+        simulator.run(samples, record)
+    return commands
+
+
+@pytest.mark.parametrize('arrays', [False, True])
+def test_until_revert_with_constant_sensor(arrays):
+    # SI Heure>=08:00 ON JUSQU'À temp>30, temp constante: la prise ne reste pas ON jusqu'au lendemain
+    start = datetime(2026, 5, 1, 7, 59).timestamp()
+    samples = [(start + 2 * i, {'t': 31.0}) for i in range(120)]
+    # Activation confirmée aussitôt puis retour OFF: aucune commande ON, ni impulsion ni bascule
+    assert replay(HOUR_RULE, samples, arrays=arrays) == []
+    assert replay(HOUR_RULE, samples[30:], initial_outlet_state=True, arrays=arrays) == [(start + 60, False, False)]
+
+
+@pytest.mark.parametrize('arrays', [False, True])
+def test_off_rule_revert_is_emitted_then_released(arrays):
+    # SI t<28 OFF JUSQU'À t>30: retour ON visible un cycle, puis OFF implicite au cycle suivant
+    start = datetime(2026, 5, 1, 12, 0).timestamp()
+    samples = [(start + 2 * i, {'t': 26.0 if i < 5 else 31.0}) for i in range(30)]
+    assert replay(OFF_RULE, samples, arrays=arrays) == [(start + 10, True, False),
+                                                        (start + 10 + PENDING_RETRY_DELAY, False, True)]
+
+
+def test_until_revert_without_new_samples():
+    # Trace clairsemée: le cycle suivant le retour a lieu sans attendre l'échantillon suivant
+    start = datetime(2026, 5, 1, 12, 0).timestamp()
+    samples = [(start, {'t': 26.0}), (start + 10, {'t': 31.0}), (start + 600, {'t': 31.0})]
+    commands = replay(OFF_RULE, samples)
+    assert commands == [(start + 10, True, False), (start + 10 + PENDING_RETRY_DELAY, False, True)]
+    assert commands == replay(OFF_RULE, samples, arrays=True)
+
+
+def test_aggregate_columns_match_tracker():
+    rng = np.random.default_rng(3)
+    n_samples = 5000
+    timestamps = 1.7e9 + np.cumsum(rng.uniform(0.5, 4.0, n_samples))
+    timestamps[100:110] = timestamps[100] # Timestamps répétés: mesure comptée une seule fois
+    values = np.column_stack([rng.normal(20, 3, n_samples), rng.normal(500, 100, n_samples)])
+    values[rng.random(n_samples) < 0.2, 0] = np.nan
+    values[1000:1500, 1] = np.nan # Capteur absent pendant plus d'une fenêtre
+    sensor_ids = ['s1', 's2']
+    keys = [aggregate_key(function, sensor_id, window) for function in AGGREGATE_FUNCTIONS
+            for sensor_id in sensor_ids + ['absent'] for window in (1, 60, 600)]
+
+    extended_ids, extended = aggregate_columns(keys, timestamps, sensor_ids, values)
+    assert extended_ids[:2] == sensor_ids
+    assert sorted(extended_ids[2:]) == sorted(keys)
+
+    tracker = AggregateTracker()
+    tracker.set_keys(keys)
+    expected = np.full((n_samples, len(keys)), np.nan)
+    for i, (ts, row) in enumerate(zip(timestamps.tolist(), values.tolist())):
+        sample = {sensor_id: v for sensor_id, v in zip(sensor_ids, row) if v == v}
+        for key, aggregate in tracker.update(ts, sample).items():
+            expected[i, extended_ids.index(key) - 2] = aggregate
+    np.testing.assert_allclose(extended[:, 2:], expected, rtol=1e-9, atol=1e-9, equal_nan=True)
@@ -0,0 +1,50 @@
+# tests/test_window_aggregates.py
+# -----------------------------------------------------------
+# Agrégats glissants: une valeur en cache n'est comptée qu'une fois.
+# -----------------------------------------------------------
+import pytest
+
+from timeseries import TimeSeriesStore
+from window_aggregates import AggregateTracker
+
+KEYS = ['avg:p:600', 'slope:p:600', 'avg:lux:600']
+
+
+def snapshots():
+    """Instantanés toutes les 2 s; la sonde 'p' n'est relue que toutes les 6 s (valeur en cache entre-temps)."""
+    for i in range(9):
+        timestamp = 1000.0 + 2 * i
+        read_time = 1000.0 + 6 * (i // 3)
+        yield timestamp, {'p': 20.0 + read_time - 1000.0, 'lux': 100.0}, {'p': read_time, 'lux': timestamp}
+
+
+def test_cached_readings_are_added_once():
+    tracker = AggregateTracker()
+    tracker.set_keys(KEYS)
+    for timestamp, values, read_times in snapshots():
+        result = tracker.update(timestamp, values, read_times)
+    # Lectures réelles: 20, 26, 32 à 1000, 1006, 1012 (et non 3 fois chacune)
+    assert result['avg:p:600'] == pytest.approx(26.0)
+    assert result['slope:p:600'] == pytest.approx(60.0) # 1 °C/s
+    assert result['avg:lux:600'] == pytest.approx(100.0)
+
+
+def test_without_read_times_every_snapshot_is_a_reading():
+    tracker = AggregateTracker()
+    tracker.set_keys(KEYS)
+    for timestamp, values, _ in snapshots():
+        result = tracker.update(timestamp, values)
+    assert result['avg:p:600'] == pytest.approx(26.0)
+    assert result['slope:p:600'] < 60.0 # Paliers répétés: pente aplatie
+
+
+def test_store_records_readings_at_their_read_time():
+    store = TimeSeriesStore()
+    for timestamp, values, read_times in snapshots():
+        store.record_sensors(timestamp, values, read_times)
+    assert store.sensor_latest('p', 10) == ([1000.0, 1006.0, 1012.0], [20.0, 26.0, 32.0])
+    assert len(store.sensor_latest('lux', 10)[0]) == 9
+    # Fenêtre de remplissage d'un nouvel agrégat: mêmes mesures que le suivi en direct
+    tracker = AggregateTracker(seed=lambda sensor_id, seconds: store.sensor_window(sensor_id, seconds, now=1016.0))
+    tracker.set_keys(KEYS)
+    assert tracker.update(1016.0, {})['avg:p:600'] == pytest.approx(26.0)
@@ -0,0 +1,203 @@
+# timeseries.py
+# -----------------------------------------------------------
+# Historique en mémoire des capteurs et des prises: un tampon circulaire
+# de taille fixe par série (tableaux compacts array.array: float32 pour
+# les valeurs capteurs, uint8 pour les états de prises, float64 pour les
+# horodatages). Ajout en O(1), mémoire bornée quelle que soit la durée de
+# fonctionnement; base des graphiques, conditions agrégées et diagnostics.
+# -----------------------------------------------------------
+import threading
+import time
+from array import array
+
+# Capacités par défaut: 24 h de mesures à 2 s par capteur (~0.5 Mo), 4096 changements d'état par prise
+DEFAULT_SENSOR_CAPACITY = 43200
+DEFAULT_OUTLET_CAPACITY = 4096
+
+class RingBuffer:
+    """
+    Série temporelle de taille fixe: les échantillons les plus anciens sont écrasés.
+    Les horodatages doivent être croissants (recherche dichotomique dans window()).
+    """
+    __slots__ = ('capacity', '_times', '_values', '_start', '_count')
+
+    def __init__(self, capacity: int, typecode: str = 'f'):
+        if capacity <= 0:
+            raise ValueError(f"Capacité invalide: {capacity}")
+        self.capacity = capacity
+        self._times = array('d', bytes(8 * capacity)) # Préalloués: aucune réallocation ensuite
+        self._values = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self._start = 0 # Indice physique de l'échantillon le plus ancien
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, value):
+        if self._count < self.capacity:
+            pos = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            pos = self._start # Plein: écraser le plus ancien
+            self._start = (self._start + 1) % self.capacity
+        self._times[pos] = timestamp
+        self._values[pos] = value
+
+    def _physical(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    def last(self):
+        """Dernier échantillon (timestamp, valeur), ou None si vide."""
+        if not self._count:
+            return None
+        pos = self._physical(self._count - 1)
+        return self._times[pos], self._values[pos]
+
+    def latest(self, n: int):
+        """Les n derniers échantillons (du plus ancien au plus récent): (timestamps, valeurs)."""
+        return self._slice(max(0, self._count - n), self._count)
+
+    def window(self, start: float, end: float | None = None):
+        """Échantillons avec start <= timestamp <= end (end=None: jusqu'au dernier): (timestamps, valeurs)."""
+        first = self._bisect_left(start)
+        last = self._count if end is None else self._bisect_right(end)
+        return self._slice(first, max(first, last))
+
+    def _slice(self, first: int, last: int):
+        """Échantillons logiques [first, last) en deux tranches contiguës au plus."""
+        if first >= last:
+            return [], []
+        p_first, p_last = self._physical(first), self._physical(last - 1) + 1
+        if p_first < p_last:
+            return self._times[p_first:p_last].tolist(), self._values[p_first:p_last].tolist()
+        return (self._times[p_first:].tolist() + self._times[:p_last].tolist(),
+                self._values[p_first:].tolist() + self._values[:p_last].tolist())
+
+    def _bisect_left(self, timestamp: float) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._physical(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect_right(self, timestamp: float) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._physical(mid)] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def nbytes(self) -> int:
+        return self._times.itemsize * self.capacity + self._values.itemsize * self.capacity
+
+class TimeSeriesStore:
+    """
+    Un RingBuffer par capteur (float32, chaque mesure) et par prise (uint8, changements d'état).
+    Écritures et lectures sont protégées par un verrou: le service capteurs écrit depuis son thread.
+    """
+    def __init__(self, sensor_capacity: int = DEFAULT_SENSOR_CAPACITY, outlet_capacity: int = DEFAULT_OUTLET_CAPACITY):
+        self.sensor_capacity = sensor_capacity
+        self.outlet_capacity = outlet_capacity
+        self._sensors = {} # {sensor_id: RingBuffer}
+        self._outlets = {} # {(mac, index): RingBuffer}
+        self._lock = threading.Lock()
+
+    # --- Écriture ---
+    def record_sensors(self, timestamp: float, values, read_times=None):
+        """
+        Ajoute une mesure par capteur ({sensor_id: valeur}, valeurs None ignorées).
+
+        read_times: {sensor_id: instant de la mesure} optionnel; une valeur dont l'instant
+        n'est pas postérieur à la dernière mesure enregistrée (valeur en cache) est ignorée.
+        """
+        with self._lock:
+            for sensor_id, value in values.items():
+                if value is None:
+                    continue
+                series = self._sensors.get(sensor_id)
+                if series is None:
+                    series = self._sensors[sensor_id] = RingBuffer(self.sensor_capacity, 'f')
+                if read_times:
+                    read_time = read_times.get(sensor_id, timestamp)
+                    last = series.last()
+                    if last is not None and read_time <= last[0]:
+                        continue
+                    series.append(read_time, value)
+                else:
+                    series.append(timestamp, value)
+
+    def record_outlets(self, timestamp: float, states):
+        """Enregistre les états {mac: {index: bool}}; seul un changement d'état ajoute un échantillon."""
+        with self._lock:
+            for mac, outlet_states in states.items():
+                for index, is_on in outlet_states.items():
+                    series = self._outlets.get((mac, index))
+                    if series is None:
+                        series = self._outlets[(mac, index)] = RingBuffer(self.outlet_capacity, 'B')
+                    last = series.last()
+                    if last is None or last[1] != is_on:
+                        series.append(timestamp, 1 if is_on else 0)
+
+    def on_sensor_snapshot(self, snapshot):
+        """Abonné du service capteurs (SensorAcquisitionService.add_listener)."""
+        self.record_sensors(snapshot.timestamp, snapshot.values, snapshot.read_times)
+
+    # --- Lecture ---
+    def sensor_ids(self) -> list:
+        with self._lock:
+            return list(self._sensors)
+
+    def outlet_keys(self) -> list:
+        with self._lock:
+            return list(self._outlets)
+
+    def sensor_latest(self, sensor_id, n: int = 1):
+        """n dernières mesures d'un capteur: (timestamps, valeurs)."""
+        with self._lock:
+            series = self._sensors.get(sensor_id)
+            return series.latest(n) if series is not None else ([], [])
+
+    def sensor_window(self, sensor_id, seconds: float, now: float | None = None):
+        """Mesures d'un capteur sur les `seconds` dernières secondes: (timestamps, valeurs)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._sensors.get(sensor_id)
+            return series.window(now - seconds, now) if series is not None else ([], [])
+
+    def outlet_latest(self, mac, index, n: int = 1):
+        """n derniers changements d'état d'une prise: (timestamps, états 0/1)."""
+        with self._lock:
+            series = self._outlets.get((mac, index))
+            return series.latest(n) if series is not None else ([], [])
+
+    def outlet_window(self, mac, index, seconds: float, now: float | None = None):
+        """Changements d'état d'une prise sur les `seconds` dernières secondes: (timestamps, états 0/1)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._outlets.get((mac, index))
+            return series.window(now - seconds, now) if series is not None else ([], [])
+
+    def nbytes(self) -> int:
+        """Mémoire allouée par les tampons (octets)."""
+        with self._lock:
+            return sum(s.nbytes() for s in self._sensors.values()) + sum(s.nbytes() for s in self._outlets.values())
+
+# Test simple
+if __name__ == '__main__':
+    store = TimeSeriesStore(sensor_capacity=5)
+    t0 = time.time()
+    for i in range(8):
+        store.record_sensors(t0 + 2 * i, {'28-000000000001': 20 + i * 0.5})
+    print("5 dernières:", store.sensor_latest('28-000000000001', 5))
+    print("Fenêtre 6 s:", store.sensor_window('28-000000000001', 6, now=t0 + 14))
+    store.record_outlets(t0, {'AA:BB': {0: False}})
+    store.record_outlets(t0 + 1, {'AA:BB': {0: False}})
+    store.record_outlets(t0 + 2, {'AA:BB': {0: True}})
+    print("Prise:", store.outlet_latest('AA:BB', 0, 10))
+    print("Mémoire:", store.nbytes(), "octets")
@@ -0,0 +1,147 @@
+# w1_watcher.py
+# -----------------------------------------------------------
+# Détection à chaud des sondes 1-Wire branchées ou débranchées.
+# Surveille le répertoire des périphériques du bus w1 (/sys/bus/w1/devices)
+# et signale uniquement les entrées ajoutées/retirées: aucune redécouverte
+# complète, aucun accès au bus (la liste est tenue à jour par le noyau).
+#
+# inotify (via ctypes) est utilisé quand le système de fichiers émet des
+# événements; sysfs n'en émet généralement pas pour les nouveaux esclaves,
+# la liste du répertoire est donc aussi relue à intervalle régulier
+# (lecture d'un répertoire en mémoire noyau, quasi gratuite).
+# -----------------------------------------------------------
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import threading
+from pathlib import Path
+
+# Constantes inotify (linux/inotify.h)
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+_WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF
+
+DEFAULT_POLL_INTERVAL = 2.0 # s, relecture du répertoire si aucun événement inotify
+
+def _open_inotify(path: Path) -> int | None:
+    """Retourne un descripteur inotify surveillant `path`, ou None si inotify est indisponible."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(path), _WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None # Pas de libc/inotify (ex: système non Linux)
+
+class W1BusWatcher:
+    """
+    Thread qui appelle on_change(ajoutées, retirées) (ensembles de noms d'entrées) lorsque le
+    contenu de `directory` change. Si on_change retourne False, le changement sera resignalé
+    au tour suivant (ex: bus momentanément occupé).
+    """
+    def __init__(self, directory, on_change, name_filter=None, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.directory = Path(directory)
+        self.on_change = on_change
+        self.name_filter = name_filter or (lambda name: True)
+        self.poll_interval = poll_interval
+        self._known = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake_r = self._wake_w = None
+        self.using_inotify = False
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._known = self._list_entries()
+        self._thread = threading.Thread(target=self._run, name="W1BusWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"x") # Débloquer select()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def check_now(self) -> bool:
+        """Compare le répertoire à l'état connu et signale les différences. Retourne True si un changement a été signalé."""
+        current = self._list_entries()
+        if current is None or current == self._known:
+            return False
+        known = self._known or set()
+        added, removed = current - known, known - current
+        logging.info(f"Bus 1-Wire: sonde(s) ajoutée(s) {sorted(added)}, retirée(s) {sorted(removed)}.")
+        try:
+            accepted = self.on_change(added, removed) is not False
+        except Exception as e:
+            logging.error(f"Erreur lors du traitement d'un changement du bus 1-Wire: {e}")
+            accepted = False
+        if accepted:
+            self._known = current
+        return accepted
+
+    def _list_entries(self) -> set | None:
+        try:
+            return {name for name in os.listdir(self.directory) if self.name_filter(name)}
+        except OSError:
+            return None # Répertoire absent (module w1 non chargé): rien à signaler
+
+    def _run(self):
+        inotify_fd = _open_inotify(self.directory)
+        self.using_inotify = inotify_fd is not None
+        logging.info(f"Surveillance du bus 1-Wire ({self.directory}): "
+                     f"{'inotify + ' if self.using_inotify else ''}relecture toutes les {self.poll_interval} s.")
+        try:
+            if inotify_fd is None:
+                while not self._stop.wait(self.poll_interval):
+                    self.check_now()
+                return
+            self._wake_r, self._wake_w = os.pipe()
+            while not self._stop.is_set():
+                ready, _, _ = select.select([inotify_fd, self._wake_r], [], [], self.poll_interval)
+                if self._stop.is_set():
+                    break
+                if inotify_fd in ready:
+                    try:
+                        while os.read(inotify_fd, 4096): # Vider les événements: seul le contenu du répertoire compte
+                            pass
+                    except BlockingIOError:
+                        pass
+                self.check_now()
+        finally:
+            for fd in (inotify_fd, self._wake_r, self._wake_w):
+                if fd is not None:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._wake_r = self._wake_w = None
+
+# Test simple
+if __name__ == '__main__':
+    import time
+    logging.basicConfig(level=logging.INFO)
+    watcher = W1BusWatcher("/sys/bus/w1/devices", lambda added, removed: print("Ajoutées:", added, "Retirées:", removed),
+                           name_filter=lambda name: not name.startswith("w1_bus_master"))
+    watcher.start()
+    print("Branchez/débranchez une sonde (Ctrl+C pour arrêter)...")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()